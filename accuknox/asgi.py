@@ -7,10 +7,70 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
+import asyncio
+import contextvars
+import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler as BaseASGIHandler
+from django.db import connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'accuknox.settings')
 
+
+class ASGIHandler(BaseASGIHandler):
+    """
+        Django 3.2 iterates streaming responses on the event loop, where the ORM refuses to run. This
+        handler pulls each part of a streaming response on a thread of its own instead, so a view can
+        stream query results (a server-side cursor stays on the connection of that one thread).
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='streaming-response')
+        context = contextvars.copy_context()
+        parts = iter(response)
+        try:
+            while True:
+                part = await loop.run_in_executor(executor, functools.partial(context.run, next, parts, None))
+                if part is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await loop.run_in_executor(executor, self.close_response, response)
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def close_response(response):
+        # Runs on the streaming thread: request_finished then closes that thread's connections, and
+        # whatever is left open is closed before the thread goes away.
+        try:
+            response.close()
+        finally:
+            connections.close_all()
+
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    return ASGIHandler()
+
+
 application = get_asgi_application()
@@ -0,0 +1,121 @@
+"""
+PostgreSQL backend that takes its connections from a per-process pool.
+
+Django opens a connection on a thread's first query and closes it when the request finishes (or when
+``CONN_MAX_AGE`` runs out). With this backend, opening takes a connection from the pool and closing
+hands it back, so connections persist across requests and each worker process holds at most
+``POOL['MAX_SIZE']`` of them. ``CONN_MAX_AGE`` should stay 0; the pool does the reusing.
+
+Pool options are read from the ``POOL`` key of the database settings (see `DEFAULT_POOL_OPTIONS`).
+"""
+import functools
+import threading
+
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as BaseDatabaseCreation
+from django.utils.asyncio import async_unsafe
+
+from accuknox.pooled_postgresql.pool import ConnectionPool
+
+
+DEFAULT_POOL_OPTIONS = {
+    'MAX_SIZE': 10,
+    # Seconds to wait for a free connection before raising PoolTimeout.
+    'TIMEOUT': 10,
+    # Seconds after which an idle connection is closed.
+    'MAX_IDLE': 300,
+    # Seconds after which a connection is closed when it is next returned or taken.
+    'MAX_LIFETIME': 3600,
+    # Connections idle for longer than this many seconds are checked with SELECT 1 before use.
+    'CHECK_AFTER': 30,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _connect(conn_params):
+    connection = base.Database.connect(**conn_params)
+    # Same as Django's postgresql backend: skip psycopg2's jsonb decoding.
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def get_pool(alias, conn_params, options):
+    key = (alias, tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = dict(DEFAULT_POOL_OPTIONS, **(options or {}))
+            pool = _pools[key] = ConnectionPool(
+                functools.partial(_connect, conn_params),
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                max_idle=options['MAX_IDLE'],
+                max_lifetime=options['MAX_LIFETIME'],
+                check_after=options['CHECK_AFTER'],
+            )
+        return pool
+
+
+def close_pools(database=None):
+    """
+        Close and forget the pools (of one `database` name, or all of them).
+    """
+    with _pools_lock:
+        for key in list(_pools):
+            if database is None or ('database', database) in key[1]:
+                _pools.pop(key).close()
+
+
+def pool_stats():
+    """
+        Return ``{alias: stats}`` for the pools of this process, summed over the databases of an alias.
+    """
+    with _pools_lock:
+        pools = list(_pools.items())
+    stats = {}
+    for (alias, _), pool in pools:
+        totals = stats.setdefault(alias, {})
+        for name, value in pool.stats().items():
+            if name == 'wait_seconds_max':
+                totals[name] = max(totals.get(name, 0), value)
+            else:
+                totals[name] = totals.get(name, 0) + value
+    return stats
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections to the test database would block DROP DATABASE.
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, conn_params, self.settings_dict.get('POOL'))
+        connection = self.pool.acquire()
+
+        # The rest mirrors the parent's get_new_connection().
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # Closed inside an atomic block, Django keeps referring to the connection, so it must
+                # not go back to the pool; neither should one that raised non-data errors.
+                self.pool.release(self.connection, discard=self.in_atomic_block or self.errors_occurred)
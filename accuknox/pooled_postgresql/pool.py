@@ -0,0 +1,176 @@
+"""
+Connection pool used by the ``accuknox.pooled_postgresql`` database backend.
+"""
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+
+from django.db import OperationalError
+from psycopg2 import extensions
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+        Thread-safe pool of at most `max_size` psycopg2 connections to one database.
+
+        `acquire` hands out the most recently returned idle connection, opening a new one while the pool
+        is below `max_size` and otherwise waiting up to `timeout` seconds. Idle connections are closed
+        once idle for longer than `max_idle` or older than `max_lifetime` seconds, and a connection idle
+        for more than `check_after` seconds is checked with ``SELECT 1`` before it is handed out.
+        Checked-out connections are tracked weakly, so one that is never returned frees its slot once
+        it is garbage collected.
+    """
+
+    def __init__(self, connect, max_size, timeout, max_idle, max_lifetime, check_after):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self._idle = deque()
+        self._in_use = weakref.WeakKeyDictionary()
+        self._opening = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'timeouts': 0,
+            'opened': 0,
+            'closed': 0,
+            'failed_checks': 0,
+        }
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def acquire(self):
+        started = time.monotonic()
+        waited = False
+        with self._condition:
+            while True:
+                connection = self._pop_idle()
+                if connection is not None:
+                    break
+                if self.size < self.max_size:
+                    self._opening += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    logger.warning('No database connection free after %.1fs (pool size %d)', self.timeout, self.max_size)
+                    raise PoolTimeout('Connection pool exhausted: no connection free after %.1f seconds' % self.timeout)
+                waited = True
+                self._condition.wait(remaining)
+
+        if connection is None:
+            try:
+                connection = self.connect()
+            except Exception:
+                with self._condition:
+                    self._opening -= 1
+                    self._condition.notify()
+                raise
+            created_at = time.monotonic()
+            with self._condition:
+                self._opening -= 1
+                self._stats['opened'] += 1
+        else:
+            connection, created_at = connection
+
+        with self._condition:
+            self._in_use[connection] = created_at
+            self._stats['checkouts'] += 1
+            if waited:
+                wait = time.monotonic() - started
+                self._stats['waits'] += 1
+                self._stats['wait_seconds_total'] += wait
+                self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], wait)
+        return connection
+
+    def _pop_idle(self):
+        """
+            Take the most recently returned usable idle connection, closing stale or broken ones.
+            Called with the lock held; returns ``(connection, created_at)`` or None.
+        """
+        now = time.monotonic()
+        while self._idle:
+            connection, created_at, returned_at = self._idle.pop()
+            if (
+                connection.closed
+                or now - returned_at > self.max_idle
+                or now - created_at > self.max_lifetime
+                or (now - returned_at > self.check_after and not self._is_usable(connection))
+            ):
+                self._close(connection)
+                continue
+            return connection, created_at
+        return None
+
+    def _is_usable(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+        except Exception:
+            self._stats['failed_checks'] += 1
+            return False
+        return True
+
+    def release(self, connection, discard=False):
+        """
+            Return `connection` to the pool. An open transaction is rolled back first; broken connections,
+            and any connection when `discard` is true, are closed instead.
+        """
+        if not discard and not connection.closed:
+            try:
+                if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except Exception:
+                discard = True
+        with self._condition:
+            created_at = self._in_use.pop(connection, None)
+            if created_at is None or discard or connection.closed or self._closed:
+                self._close(connection)
+            else:
+                self._idle.append((connection, created_at, time.monotonic()))
+            self._condition.notify()
+
+    def _close(self, connection):
+        self._stats['closed'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+            Close every idle connection. Checked-out connections are closed when they are returned.
+        """
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                self._close(self._idle.pop()[0])
+
+    def stats(self):
+        with self._condition:
+            return dict(
+                self._stats,
+                max_size=self.max_size,
+                size=self.size,
+                idle=len(self._idle),
+                checked_out=len(self._in_use),
+            )
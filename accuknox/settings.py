@@ -50,6 +50,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -60,10 +61,14 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.users.authentication.CachedJWTAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'apps.users.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_RENDERER_CLASSES': [
+        'apps.users.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -95,6 +100,7 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    'apps.users.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -128,16 +134,108 @@ WSGI_APPLICATION = 'accuknox.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': POSTGRES_DB,
-        'USER': POSTGRES_USER,
-        'PASSWORD': POSTGRES_PASSWORD,
-        'HOST': POSTGRES_HOST,
-        'PORT': POSTGRES_PORT,
+# POSTGRES_POOL_SIZE > 0 (the default) uses the pooled backend in accuknox/pooled_postgresql: every
+# worker process keeps up to that many connections open and reuses them across requests. With
+# POSTGRES_POOL_SIZE=0 the stock backend is used and POSTGRES_CONN_MAX_AGE keeps connections alive.
+POSTGRES_POOL_SIZE = int(os.getenv('POSTGRES_POOL_SIZE', 10))
+
+if POSTGRES_DB:
+    DATABASES = {
+        'default': {
+            'ENGINE': (
+                'accuknox.pooled_postgresql' if POSTGRES_POOL_SIZE > 0
+                else 'django.db.backends.postgresql_psycopg2'
+            ),
+            'NAME': POSTGRES_DB,
+            'USER': POSTGRES_USER,
+            'PASSWORD': POSTGRES_PASSWORD,
+            'HOST': POSTGRES_HOST,
+            'PORT': POSTGRES_PORT,
+            'CONN_MAX_AGE': 0 if POSTGRES_POOL_SIZE > 0 else int(os.getenv('POSTGRES_CONN_MAX_AGE', 60)),
+            'POOL': {
+                'MAX_SIZE': POSTGRES_POOL_SIZE,
+                'TIMEOUT': float(os.getenv('POSTGRES_POOL_TIMEOUT', 10)),
+                'MAX_IDLE': float(os.getenv('POSTGRES_POOL_MAX_IDLE', 300)),
+                'MAX_LIFETIME': float(os.getenv('POSTGRES_POOL_MAX_LIFETIME', 3600)),
+                'CHECK_AFTER': float(os.getenv('POSTGRES_POOL_CHECK_AFTER', 30)),
+            },
+        }
+    }
+else:
+    # Local runs and the test suite fall back to SQLite when no Postgres is configured.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+# Caches
+# The list response cache, the replica pins and CacheRateLimiter keep state that every worker process (and
+# management commands such as import_users) must see, so deployments use memcached: MEMCACHED_LOCATION is
+# "host:port", or several comma separated. Without it each process gets its own local-memory cache, which
+# apps.users.cache.check_shared_caches only accepts with DEBUG on.
+MEMCACHED_LOCATION = os.getenv('MEMCACHED_LOCATION')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Read replicas
+# POSTGRES_REPLICAS lists replica servers as comma separated "host[:port][*weight]" entries, for example
+# "replica1,replica2:5433*2". They become the aliases replica_1, replica_2, ... with the credentials of
+# default; apps.users.routers.ReplicaRouter sends the reads of the read-only endpoints to them.
+# DATABASE_REPLICA_SELECTION is 'round_robin' (weighted) or 'random' (weighted). After a write, the
+# users involved read from default for DATABASE_REPLICA_STICKY_SECONDS; the pins are kept in the
+# DATABASE_REPLICA_PIN_CACHE cache, which must be shared between workers (with replicas configured the app
+# refuses to start on a local-memory cache, see Caches above).
+DATABASE_REPLICAS = {}
+if POSTGRES_DB:
+    for _index, _replica in enumerate(filter(None, os.getenv('POSTGRES_REPLICAS', '').split(',')), 1):
+        _address, _, _weight = _replica.strip().partition('*')
+        _host, _, _port = _address.partition(':')
+        DATABASES['replica_%d' % _index] = dict(
+            DATABASES['default'], HOST=_host, PORT=_port or POSTGRES_PORT, TEST={'MIRROR': 'default'}
+        )
+        DATABASE_REPLICAS['replica_%d' % _index] = int(_weight or 1)
+DATABASE_ROUTERS = ['apps.users.routers.ReplicaRouter']
+DATABASE_REPLICA_SELECTION = os.getenv('DATABASE_REPLICA_SELECTION', 'round_robin')
+DATABASE_REPLICA_STICKY_SECONDS = int(os.getenv('DATABASE_REPLICA_STICKY_SECONDS', 10))
+DATABASE_REPLICA_PIN_CACHE = 'default'
+
+# Password hashing
+# PASSWORD_HASH_ALGORITHM picks the hasher for new passwords (pbkdf2_sha256, argon2 or bcrypt_sha256;
+# argon2 needs argon2-cffi and bcrypt_sha256 needs bcrypt). The other hashers stay listed so existing
+# hashes still verify; they are upgraded on the next login, as are hashes made with an older cost.
+PASSWORD_HASH_ALGORITHM = os.getenv('PASSWORD_HASH_ALGORITHM', 'pbkdf2_sha256')
+PASSWORD_HASH_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_HASH_PBKDF2_ITERATIONS', 260000))
+PASSWORD_HASH_ARGON2_TIME_COST = int(os.getenv('PASSWORD_HASH_ARGON2_TIME_COST', 2))
+PASSWORD_HASH_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_HASH_ARGON2_MEMORY_COST', 102400))
+PASSWORD_HASH_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_HASH_ARGON2_PARALLELISM', 8))
+PASSWORD_HASH_BCRYPT_ROUNDS = int(os.getenv('PASSWORD_HASH_BCRYPT_ROUNDS', 12))
+
+_PASSWORD_HASHERS = {
+    'pbkdf2_sha256': 'apps.users.hashers.PBKDF2PasswordHasher',
+    'argon2': 'apps.users.hashers.Argon2PasswordHasher',
+    'bcrypt_sha256': 'apps.users.hashers.BCryptSHA256PasswordHasher',
 }
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASH_ALGORITHM]] + [
+    path for algorithm, path in _PASSWORD_HASHERS.items() if algorithm != PASSWORD_HASH_ALGORITHM
+]
+
+# Signup/login hash on a process pool of this many workers (0 hashes inline on the request thread).
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 0))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 64))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -204,3 +302,142 @@ EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = '587'
 EMAIL_USE_TLS = True
+
+
+# User search
+# Dotted path to the backend used by `UserView.user_search`. When unset, Postgres
+# uses the pg_trgm/full-text backend and every other database uses the in-process index.
+# The in-process indexes share a generation number in the USER_SEARCH_INDEX_CACHE cache, so
+# users written by other workers or bulk loads are picked up (the alias must be shared, see Caches above).
+USER_SEARCH_BACKEND = os.getenv('USER_SEARCH_BACKEND') or None
+USER_SEARCH_MAX_RESULTS = 1000
+USER_SEARCH_INDEX_CACHE = 'default'
+
+
+# JWT authentication cache
+# Validated access tokens and their users are cached per process by
+# apps.users.authentication.CachedJWTAuthentication. Saving a user drops it from this process's cache;
+# other processes, and changes made with QuerySet.update() (e.g. deactivating users in bulk), are
+# picked up after at most JWT_AUTH_CACHE_TTL seconds.
+JWT_AUTH_CACHE_TTL = 60
+JWT_AUTH_CACHE_MAX_ENTRIES = 10000
+
+
+# Rate limits
+# Per-action limits as "<requests>/<period>" (period s, m, h or d), see apps/users/ratelimit.py.
+RATE_LIMITS = {
+    'send_friend_request': '3/m',
+    'login': '10/m',
+    'user_search': '120/m',
+    'export_social_graph': '10/h',
+}
+# Use 'apps.users.ratelimit.CacheRateLimiter' to share limits between workers through the cache.
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'apps.users.ratelimit.InMemoryRateLimiter')
+RATE_LIMIT_MAX_KEYS = 100000
+RATE_LIMIT_CACHE = 'default'
+
+
+# Friend list response cache
+# Cache alias and lifetime (seconds) of the cached list_friends / list_pending_friends_request responses and of
+# the users' list versions. The alias must be shared between processes (see Caches above).
+USER_LIST_CACHE = 'default'
+USER_LIST_CACHE_TIMEOUT = 300
+
+
+# Bulk friend request endpoints
+# Maximum number of ids accepted by one bulk send/accept/reject call.
+BULK_FRIEND_REQUEST_MAX_ITEMS = 500
+
+
+# Friend suggestions
+# Suggestions kept per user, and the friend count above which a user's friends are not updated on
+# accept (rebuild_friend_suggestions picks those up), see apps/users/suggestions.py.
+FRIEND_SUGGESTIONS_MAX = 50
+FRIEND_SUGGESTIONS_MAX_FANOUT = 5000
+
+
+# Transactional outbox
+# Signups and friend request changes write an event in their own transaction; `manage.py dispatch_outbox`
+# delivers them in batches of OUTBOX_BATCH_SIZE to the OUTBOX_SINKS (comma separated dotted paths) and retries
+# failed deliveries with the sinks that failed after OUTBOX_RETRY_DELAY seconds, doubling up to
+# OUTBOX_RETRY_MAX_DELAY, until OUTBOX_MAX_ATTEMPTS failures dead-letter the event, see apps/users/outbox.py.
+# apps.users.outbox.LocalQueueSink only suits an in-process consumer calling LocalQueueSink.drain(); with
+# nothing draining it, it fails every delivery once OUTBOX_LOCAL_QUEUE_SIZE events are queued.
+OUTBOX_SINKS = os.getenv('OUTBOX_SINKS', 'apps.users.outbox.HandlerSink').split(',')
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_POLL_INTERVAL = 1.0
+OUTBOX_RETRY_DELAY = 5
+OUTBOX_RETRY_MAX_DELAY = 3600
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_LOCAL_QUEUE_SIZE = 10000
+
+
+# Friend request archive
+# `manage.py archive_friend_requests` moves rejected requests older than FRIEND_REQUEST_ARCHIVE_REJECTED_DAYS
+# and accepted ones older than FRIEND_REQUEST_ARCHIVE_ACCEPTED_DAYS to FriendRequestArchive, in transactions
+# of FRIEND_REQUEST_ARCHIVE_BATCH_SIZE rows, see apps/users/archive.py. Pending requests stay.
+FRIEND_REQUEST_ARCHIVE_REJECTED_DAYS = 30
+FRIEND_REQUEST_ARCHIVE_ACCEPTED_DAYS = 90
+FRIEND_REQUEST_ARCHIVE_BATCH_SIZE = 5000
+
+
+# Graph queries
+# Mutual friends intersect adjacency arrays of at most GRAPH_MAX_DEGREE friends (larger lists are intersected by
+# the database); connection paths are at most GRAPH_MAX_DEPTH hops, and each hop of the search expands at most
+# GRAPH_FRONTIER_MAX users and reads at most GRAPH_HOP_EDGES_MAX edges, see apps/users/graph.py.
+GRAPH_MAX_DEGREE = 5000
+GRAPH_MAX_DEPTH = 3
+GRAPH_FRONTIER_MAX = 1000
+GRAPH_HOP_EDGES_MAX = 50000
+
+
+# Async views
+# Threads (and so database connections) per process that run the ORM work of the /api/async/ views.
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 16))
+
+
+# Performance instrumentation
+# Fraction of requests for which apps.users.middleware.PerformanceMiddleware records queries,
+# serialization time and response size and sends a Server-Timing header (every request is still
+# counted and timed). /metrics serves the totals in the Prometheus text format; when
+# PERFORMANCE_METRICS_TOKEN is set, scrapers must send it as a bearer token. Without a token
+# /metrics answers 404 unless DEBUG is on.
+PERFORMANCE_SAMPLE_RATE = float(os.getenv('PERFORMANCE_SAMPLE_RATE', 1 if DEBUG else 0.01))
+PERFORMANCE_METRICS_TOKEN = os.getenv('PERFORMANCE_METRICS_TOKEN')
+
+
+# SQL inspection
+# For a QUERY_LOG_SAMPLE_RATE fraction of requests every statement is captured with its origin in apps/
+# (see apps/users/querylog.py). Statements of one shape run QUERY_LOG_REPEAT_THRESHOLD or more times are
+# logged as a possible N+1, and a request running more statements than QUERY_BUDGETS[action] is logged,
+# or fails with QueryBudgetExceeded when QUERY_BUDGET_RAISE is set (the test runner sets it).
+# Statements slower than SLOW_QUERY_THRESHOLD_MS (empty disables) are logged with their EXPLAIN plan.
+QUERY_LOG_SAMPLE_RATE = float(os.getenv('QUERY_LOG_SAMPLE_RATE', 1 if DEBUG else 0.001))
+QUERY_LOG_REPEAT_THRESHOLD = 5
+# Budgets include the authentication query of a token or uncached JWT request.
+QUERY_BUDGETS = {
+    'signup': 4,
+    'login': 3,
+    'name_update': 3,
+    'user_search': 4,
+    # Changes to friend requests also write their outbox events and update the users' counters.
+    'send_friend_request': 5,
+    'accept_friend_request': 7,
+    'reject_friend_request': 6,
+    'send_friend_requests_bulk': 6,
+    'accept_friend_requests_bulk': 7,
+    'reject_friend_requests_bulk': 5,
+    # Users without counters yet get them computed on the first read (two more queries).
+    'counts': 4,
+    'list_pending_friends_request': 3,
+    'list_friends': 3,
+    'list_friend_suggestions': 2,
+    # One more query when either user has more than GRAPH_MAX_DEGREE friends.
+    'mutual_friends': 4,
+    # One query per hop of the search.
+    'connection': 6,
+}
+QUERY_BUDGET_RAISE = False
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200) or 0) or None
+SLOW_QUERY_EXPLAIN = True
+TEST_RUNNER = 'apps.users.testing.TestRunner'
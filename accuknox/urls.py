@@ -16,10 +16,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.users.instrumentation import metrics_view
+
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     path('api/', include('apps.users.urls')),
+
+    path('metrics', metrics_view, name='metrics'),
 ]
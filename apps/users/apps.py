@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.users'
+
+    def ready(self):
+        from apps.users import events  # noqa: F401 (registers the outbox handlers)
+        from apps.users.authentication import invalidate_cached_user
+        from apps.users.cache import check_shared_caches
+        from apps.users.instrumentation import install_query_recorder
+        from apps.users.querylog import install_query_inspector
+        from apps.users.search import remove_from_search_index, update_search_index
+
+        check_shared_caches()
+
+        user_model = self.get_model('User')
+        post_save.connect(update_search_index, sender=user_model, dispatch_uid='users_search_index_update')
+        post_delete.connect(remove_from_search_index, sender=user_model, dispatch_uid='users_search_index_remove')
+        post_save.connect(invalidate_cached_user, sender=user_model, dispatch_uid='users_auth_cache_save')
+        post_delete.connect(invalidate_cached_user, sender=user_model, dispatch_uid='users_auth_cache_delete')
+        connection_created.connect(install_query_recorder, dispatch_uid='users_query_recorder')
+        connection_created.connect(install_query_inspector, dispatch_uid='users_query_inspector')
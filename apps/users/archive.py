@@ -0,0 +1,101 @@
+"""
+Archival of friend request history.
+
+Accepted and rejected requests are only read again by the social graph export and
+``backfill_friendships``, yet they make up most of `FriendRequest` and of its indexes. `archive`
+(``manage.py archive_friend_requests``) moves the rejected ones older than
+``FRIEND_REQUEST_ARCHIVE_REJECTED_DAYS`` and the accepted ones older than
+``FRIEND_REQUEST_ARCHIVE_ACCEPTED_DAYS`` to `FriendRequestArchive`, oldest first, so the hot table
+keeps pending and recent requests only. Pending requests are never archived, and the accepted and
+rejected ones within the rate limit window must stay for ``can_send_friend_request``.
+
+Each batch is one transaction: the ids are found through ``friendreq_archivable_idx`` (locked with
+``SELECT ... FOR UPDATE SKIP LOCKED`` on Postgres), copied with ``INSERT ... SELECT`` and deleted, so
+a request is always in exactly one of the tables and the locks are held for one batch only. Rows keep
+their id; a batch copied before an interrupted run is skipped by ``ON CONFLICT DO NOTHING``.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.users.models import FriendRequest, FriendRequestArchive
+
+
+COLUMNS = ('id', 'created_date', 'requested_user_id', 'request_received_user_id', 'status')
+
+
+def archivable(now=None, rejected_days=None, accepted_days=None):
+    """
+        The condition on `FriendRequest` of the rows due for the archive at `now`.
+    """
+    now = now or timezone.now()
+    if rejected_days is None:
+        rejected_days = settings.FRIEND_REQUEST_ARCHIVE_REJECTED_DAYS
+    if accepted_days is None:
+        accepted_days = settings.FRIEND_REQUEST_ARCHIVE_ACCEPTED_DAYS
+    return (
+        Q(status=3, created_date__lt=now - timedelta(days=rejected_days))
+        | Q(status=2, created_date__lt=now - timedelta(days=accepted_days))
+    )
+
+
+def copy(ids, archived_date):
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in COLUMNS)
+    sql = (
+        'INSERT INTO {archive} ({columns}, {archived}) '
+        'SELECT {columns}, %s FROM {table} WHERE {id} IN ({ids}) '
+        'ON CONFLICT DO NOTHING'
+    ).format(
+        archive=quote(FriendRequestArchive._meta.db_table),
+        table=quote(FriendRequest._meta.db_table),
+        columns=columns,
+        archived=quote('archived_date'),
+        id=quote('id'),
+        ids=', '.join(['%s'] * len(ids)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [archived_date, *ids])
+
+
+def archive_batch(condition, batch_size):
+    """
+        Move up to `batch_size` of the oldest rows matching `condition`; returns how many were moved.
+    """
+    with transaction.atomic():
+        ids = list(
+            FriendRequest.objects.select_for_update(skip_locked=True)
+            .filter(condition)
+            .order_by('created_date', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            copy(ids, timezone.now())
+            FriendRequest.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def archive(condition=None, batch_size=None, max_batches=None, pause=0, progress=None):
+    """
+        Move the rows matching `condition` (default: `archivable`) in batches of `batch_size`, at most
+        `max_batches` of them, sleeping `pause` seconds in between. `progress` is called with the
+        running total after each batch. Returns the number of rows moved.
+    """
+    condition = archivable() if condition is None else condition
+    batch_size = batch_size or settings.FRIEND_REQUEST_ARCHIVE_BATCH_SIZE
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(condition, batch_size)
+        moved += count
+        batches += 1
+        if progress is not None and count:
+            progress(moved)
+        if count < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return moved
@@ -0,0 +1,92 @@
+"""
+Async (ASGI) entry points for the friend and search endpoints.
+
+Django 3.2 has no async ORM and DRF 3.12 cannot run ``async def`` views, so under ASGI Django runs
+every sync view on one shared thread per process, and requests queue behind each other's queries.
+The views in this module are ``async def`` wrappers around the regular DRF views. Each wrapper awaits
+the DRF view on a dedicated pool of ``ASYNC_DB_THREADS`` threads. An ASGI worker
+(a uvicorn worker of ``accuknox.asgi:application``) can then hold thousands of in-flight requests on its event loop,
+while at most ``ASYNC_DB_THREADS`` of them use a database connection at a time.
+
+Every pool thread keeps its own connection. Before and after each request it calls
+`close_old_connections`, just as ``request_started``/``request_finished`` do for sync views, so
+``CONN_MAX_AGE`` and broken-connection handling behave the same as in the WSGI path.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from apps.users.views import FriendRequestView, UserView
+
+
+class DatabaseExecutor:
+    """
+        Lazily started thread pool for the sync (ORM) part of async requests.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='async-db'
+                )
+            return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Carry the request's context variables (such as its performance metrics) into the thread.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._get_executor(), functools.partial(context.run, _run_with_connection, func, *args, **kwargs)
+        )
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+executor = DatabaseExecutor()
+
+
+def _run_with_connection(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = func(*args, **kwargs)
+        # Render on the pool thread too; otherwise Django renders on its shared sync thread.
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """
+        Turn the sync view `view` into an ``async def`` view that runs it on the database executor.
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await executor.run(view, request, *args, **kwargs)
+
+    wrapper.csrf_exempt = getattr(view, 'csrf_exempt', False)
+    return wrapper
+
+
+user_search = async_view(UserView.as_view({'post': 'user_search'}))
+send_friend_request = async_view(FriendRequestView.as_view({'post': 'send_friend_request'}))
+accept_friend_request = async_view(FriendRequestView.as_view({'post': 'accept_friend_request'}))
+reject_friend_request = async_view(FriendRequestView.as_view({'post': 'reject_friend_request'}))
+list_pending_friends_request = async_view(FriendRequestView.as_view({'get': 'list_pending_friends_request'}))
+list_friends = async_view(FriendRequestView.as_view({'get': 'list_friends'}))
@@ -0,0 +1,98 @@
+"""
+JWT authentication backed by small in-process caches.
+
+`CachedJWTAuthentication` keeps validated access tokens and the user rows they resolve to in
+bounded TTL caches, so an authenticated request normally costs no database query. Cached users
+are dropped from this process's cache on every `User` save/delete (see `UsersConfig.ready`).
+Other worker processes, and changes made without signals (`QuerySet.update`, raw SQL), are only
+seen once the entry expires, i.e. at the latest after ``JWT_AUTH_CACHE_TTL`` seconds: a user
+deactivated that way can keep authenticating until then. Lower the TTL if that window matters.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class TTLCache:
+    """
+        Thread-safe LRU mapping whose entries expire after `ttl` seconds (or at an explicit deadline).
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_in=None):
+        ttl = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TTLCache(settings.JWT_AUTH_CACHE_MAX_ENTRIES, settings.JWT_AUTH_CACHE_TTL)
+user_cache = TTLCache(settings.JWT_AUTH_CACHE_MAX_ENTRIES, settings.JWT_AUTH_CACHE_TTL)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+        Drop-in replacement for simplejwt's `JWTAuthentication` that skips signature validation
+        and the user SELECT when the token and user were seen recently.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = token_cache.get(raw_token)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            token_cache.set(raw_token, validated_token, validated_token['exp'] - time.time())
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        elif not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        # Hand every request its own instance so one request's changes cannot leak into another.
+        return copy.copy(user)
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.delete(getattr(instance, api_settings.USER_ID_FIELD))
@@ -0,0 +1,181 @@
+"""
+Fast bulk inserts for seeding and imports.
+
+`load` consumes any iterable of unsaved model instances in batches of `batch_size`, so memory stays
+constant however many rows are loaded. On PostgreSQL each batch is sent with ``COPY ... FROM STDIN``;
+with `ignore_conflicts` it is copied into a temporary table first and moved over with
+``INSERT ... ON CONFLICT DO NOTHING``. Other databases fall back to ``bulk_create``. `load` reports
+how many rows were actually inserted: the ``INSERT``'s row count on PostgreSQL. With
+``bulk_create(ignore_conflicts=True)`` the batch's unique keys are looked up in the transaction that
+inserts it (`count_new_rows`), so the count costs one query per unique key per batch, whatever the size of the table.
+
+Rows may carry explicit primary keys; the table's sequence is reset afterwards so later inserts do
+not collide with them. Bulk inserts send no ``post_save``, so loading users invalidates the in-memory
+search indexes.
+"""
+import io
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q, UniqueConstraint
+
+from apps.users.search import invalidate_search_indexes
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def copy_value(value):
+    """
+        Encode `value` for the text format of ``COPY``.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(connection, model, objs, ignore_conflicts=False):
+    """
+        ``COPY`` `objs` into the table of `model`; returns the number of rows inserted.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not (field.primary_key and getattr(objs[0], field.attname) is None)
+    ]
+    rows = io.StringIO()
+    for obj in objs:
+        rows.write('\t'.join(
+            copy_value(field.get_db_prep_save(field.pre_save(obj, True), connection)) for field in fields
+        ))
+        rows.write('\n')
+    rows.seek(0)
+
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        if not ignore_conflicts:
+            cursor.copy_expert('COPY %s (%s) FROM STDIN' % (table, columns), rows)
+            return len(objs)
+        staging = quote('bulkload_%s' % model._meta.db_table)
+        cursor.execute(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS %s (LIKE %s INCLUDING DEFAULTS) ON COMMIT DROP' % (staging, table)
+        )
+        cursor.copy_expert('COPY %s (%s) FROM STDIN' % (staging, columns), rows)
+        cursor.execute(
+            'INSERT INTO %s (%s) SELECT %s FROM %s ON CONFLICT DO NOTHING' % (table, columns, columns, staging)
+        )
+        inserted = cursor.rowcount
+        cursor.execute('TRUNCATE %s' % staging)
+    return inserted
+
+
+def unique_keys(model):
+    """
+        Return ``(attnames, condition)`` for every unique key of `model`; `condition` is the Q of a
+        partial unique constraint, or None.
+    """
+    opts = model._meta
+    keys = [((field.attname,), None) for field in opts.concrete_fields if field.unique]
+    keys += [(tuple(opts.get_field(name).attname for name in fields), None) for fields in opts.unique_together]
+    keys += [
+        (tuple(opts.get_field(name).attname for name in constraint.fields), constraint.condition)
+        for constraint in opts.constraints
+        if isinstance(constraint, UniqueConstraint) and constraint.fields
+    ]
+    return keys
+
+
+def matches_condition(model, obj, condition):
+    """
+        Whether `obj` falls under a partial unique constraint. Conditions other than a conjunction of
+        ``field=value`` terms are assumed to match.
+    """
+    if condition is None or condition.connector != Q.AND or condition.negated:
+        return True
+    if not all(isinstance(child, tuple) and '__' not in child[0] for child in condition.children):
+        return True
+    return all(getattr(obj, model._meta.get_field(name).attname) == value for name, value in condition.children)
+
+
+def count_new_rows(model, objs, using=DEFAULT_DB_ALIAS):
+    """
+        Count the rows of `objs` that ``bulk_create(ignore_conflicts=True)`` will insert: those whose
+        unique keys are neither in the table nor taken by an earlier row of `objs`. Only the keys of
+        `objs` are looked up; run it in the transaction that inserts them.
+    """
+    taken = []
+    for attnames, condition in unique_keys(model):
+        candidates = [
+            obj for obj in objs
+            if matches_condition(model, obj, condition) and None not in (getattr(obj, name) for name in attnames)
+        ]
+        if not candidates:
+            continue
+        existing = model._base_manager.using(using).filter(**{
+            '%s__in' % name: {getattr(obj, name) for obj in candidates} for name in attnames
+        })
+        if condition is not None:
+            existing = existing.filter(condition)
+        taken.append((attnames, condition, set(existing.values_list(*attnames))))
+
+    new_rows = 0
+    for obj in objs:
+        obj_keys = [
+            (keys, tuple(getattr(obj, name) for name in attnames))
+            for attnames, condition, keys in taken
+            if matches_condition(model, obj, condition)
+        ]
+        obj_keys = [(keys, key) for keys, key in obj_keys if None not in key]
+        if any(key in keys for keys, key in obj_keys):
+            continue
+        for keys, key in obj_keys:
+            keys.add(key)
+        new_rows += 1
+    return new_rows
+
+
+def reset_sequences(model, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def load(model, objs, batch_size=10000, ignore_conflicts=False, using=DEFAULT_DB_ALIAS):
+    """
+        Insert `objs`, one transaction per batch. Returns the number of rows inserted (with
+        `ignore_conflicts`, rows that conflicted are not written and not counted).
+    """
+    connection = connections[using]
+    inserted = 0
+    explicit_ids = False
+    for batch in batched(objs, batch_size):
+        explicit_ids = explicit_ids or batch[0].pk is not None
+        with transaction.atomic(using=using):
+            if connection.vendor == 'postgresql':
+                inserted += copy_rows(connection, model, batch, ignore_conflicts)
+            elif ignore_conflicts:
+                # bulk_create does not report skipped rows, so they are worked out from the batch's keys.
+                inserted += count_new_rows(model, batch, using)
+                model.objects.using(using).bulk_create(batch, ignore_conflicts=True)
+            else:
+                model.objects.using(using).bulk_create(batch)
+                inserted += len(batch)
+    if explicit_ids:
+        reset_sequences(model, using)
+    if inserted and model is get_user_model():
+        invalidate_search_indexes()
+    return inserted
@@ -0,0 +1,129 @@
+"""
+Per-user response cache for `list_friends` and `list_pending_friends_request`.
+
+Every user has a list version token in the ``USER_LIST_CACHE`` cache. Cached responses and ETags are
+keyed by that token, so invalidating a user's lists is a single write of a new token, done after the
+transaction that changed them commits. A request whose ``If-None-Match`` matches the current ETag is
+answered with 304 without touching the database.
+
+Invalidations are only seen by the processes sharing the cache, so ``USER_LIST_CACHE`` must be a shared
+cache such as memcached; `check_shared_caches` refuses a per-process cache unless ``DEBUG`` is on. Versions
+expire after ``USER_LIST_CACHE_TIMEOUT`` like the responses, which bounds how long a process that missed
+an invalidation serves the old list.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from apps.users.routers import pin_to_primary
+
+
+VERSION_KEY = 'users:lists:version:%s'
+RESPONSE_KEY = 'users:lists:response:%s'
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def get_cache():
+    return caches[settings.USER_LIST_CACHE]
+
+
+def require_shared_cache(setting):
+    alias = getattr(settings, setting)
+    if settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            "%s ('%s') is local to each process; configure a shared cache such as memcached "
+            "(MEMCACHED_LOCATION)." % (setting, alias)
+        )
+
+
+def check_shared_caches():
+    """
+        Refuse to start with per-process caches where workers must share state. Called on startup.
+    """
+    if not settings.DEBUG:
+        require_shared_cache('USER_LIST_CACHE')
+        require_shared_cache('USER_SEARCH_INDEX_CACHE')
+    # Read-your-writes pins must reach every worker, whatever DEBUG is, or reads go to a lagging replica.
+    if settings.DATABASE_REPLICAS:
+        require_shared_cache('DATABASE_REPLICA_PIN_CACHE')
+
+
+def get_list_version(user_id):
+    cache = get_cache()
+    key = VERSION_KEY % user_id
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=settings.USER_LIST_CACHE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_lists(*user_ids):
+    """
+        Give `user_ids` new list versions once the current transaction commits, and keep their list
+        reads on the primary database until the replicas have caught up.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    pin_to_primary(*user_ids)
+    transaction.on_commit(
+        lambda: get_cache().set_many(
+            {VERSION_KEY % user_id: uuid.uuid4().hex for user_id in user_ids}, timeout=settings.USER_LIST_CACHE_TIMEOUT
+        )
+    )
+
+
+def invalidate_lists_showing(user):
+    """
+        Invalidate the lists that embed `user`: their friends' friend lists and the pending lists of
+        users waiting on a request to them.
+    """
+    from apps.users.models import FriendRequest, Friendship
+
+    friend_ids = Friendship.objects.filter(user=user).values_list('friend_id', flat=True)
+    requester_ids = FriendRequest.objects.filter(request_received_user=user, status=1).values_list(
+        'requested_user_id', flat=True
+    )
+    invalidate_lists(*friend_ids.union(requester_ids))
+
+
+def cached_list_response(view_func):
+    """
+        Cache the 200 responses of a per-user list action and answer conditional requests.
+    """
+
+    @wraps(view_func)
+    def wrapper(self, request, *args, **kwargs):
+        user_id = request.user.pk
+        version = get_list_version(user_id)
+        digest = hashlib.sha1(
+            ('%s:%s:%s:%s' % (view_func.__name__, user_id, version, request.get_full_path())).encode()
+        ).hexdigest()
+        etag = '"%s"' % digest
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache = get_cache()
+        data = cache.get(RESPONSE_KEY % digest)
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK, headers=headers)
+
+        response = view_func(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(RESPONSE_KEY % digest, response.data, settings.USER_LIST_CACHE_TIMEOUT)
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    return wrapper
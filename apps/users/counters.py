@@ -0,0 +1,137 @@
+"""
+Per-user badge counts: friends, pending requests received and pending requests sent.
+
+`UserCounter` holds one row per user. The friend request endpoints change it in their own transaction
+with a single ``UPDATE ... SET field = CASE ... field + delta`` per transition (`record_sent`,
+`record_accepted`, `record_rejected`), so reading the counts is a primary key lookup. Signup creates
+the row; users without one (loaded in bulk, or created before the table existed) get it computed
+from the tables the first time their counts are read.
+
+Paths that change the tables directly (``import_users``, ``seed_social_graph``,
+``backfill_friendships``) and a transition racing that first read leave counts off. `reconcile`
+(``manage.py reconcile_counters``) recomputes them in batches and repairs what drifted.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce
+
+from apps.users.bulkload import batched
+from apps.users.models import FriendRequest, Friendship, User, UserCounter
+
+
+FIELDS = ('friends', 'pending_received', 'pending_sent')
+
+
+def apply(deltas):
+    """
+        Add `deltas` (``{user_id: {field: delta}}``) to the counters in one UPDATE. Users without a
+        counter row are skipped; their counts are computed when first read.
+    """
+    groups = defaultdict(list)
+    for user_id, delta in deltas.items():
+        change = tuple((field, delta.get(field, 0)) for field in FIELDS)
+        if any(value for _, value in change):
+            groups[change].append(user_id)
+    if not groups:
+        return
+    updates = {}
+    for index, field in enumerate(FIELDS):
+        whens = [
+            When(user_id__in=user_ids, then=F(field) + change[index][1])
+            for change, user_ids in groups.items() if change[index][1]
+        ]
+        if whens:
+            updates[field] = Case(*whens, default=F(field))
+    UserCounter.objects.filter(user_id__in=[user_id for ids in groups.values() for user_id in ids]).update(**updates)
+
+
+def add_deltas(deltas, pairs, sender, receiver):
+    for requested_user_id, request_received_user_id in pairs:
+        deltas[requested_user_id].update(sender)
+        deltas[request_received_user_id].update(receiver)
+    return deltas
+
+
+def record_sent(pairs):
+    """
+        Count the new pending requests of `pairs` (``(requested_user_id, request_received_user_id)``).
+    """
+    apply(add_deltas(defaultdict(Counter), pairs, {'pending_sent': 1}, {'pending_received': 1}))
+
+
+def record_accepted(pairs, already_friends=()):
+    """
+        Count the accepted requests of `pairs`; the friend counts of the pairs in `already_friends` (two
+        pending requests in opposite directions, say) do not change.
+    """
+    already_friends = set(already_friends)
+    deltas = add_deltas(
+        defaultdict(Counter), [pair for pair in pairs if pair not in already_friends],
+        {'pending_sent': -1, 'friends': 1}, {'pending_received': -1, 'friends': 1},
+    )
+    apply(add_deltas(
+        deltas, [pair for pair in pairs if pair in already_friends], {'pending_sent': -1}, {'pending_received': -1}
+    ))
+
+
+def record_rejected(pairs):
+    apply(add_deltas(defaultdict(Counter), pairs, {'pending_sent': -1}, {'pending_received': -1}))
+
+
+def count_of(queryset, column):
+    rows = queryset.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(count=Count('id'))
+    return Coalesce(Subquery(rows.values('count')), 0)
+
+
+def compute(user_ids):
+    """
+        Count the friends and pending requests of the existing users among `user_ids`, in one query.
+    """
+    rows = User.objects.filter(pk__in=user_ids).annotate(
+        friends=count_of(Friendship.objects.all(), 'user_id'),
+        pending_received=count_of(FriendRequest.objects.filter(status=1), 'request_received_user_id'),
+        pending_sent=count_of(FriendRequest.objects.filter(status=1), 'requested_user_id'),
+    ).values_list('pk', *FIELDS)
+    return {user_id: dict(zip(FIELDS, counts)) for user_id, *counts in rows}
+
+
+def get_counts(user_id):
+    counts = UserCounter.objects.filter(user_id=user_id).values(*FIELDS).first()
+    if counts is None:
+        counts = compute([user_id]).get(user_id, dict.fromkeys(FIELDS, 0))
+        UserCounter.objects.bulk_create([UserCounter(user_id=user_id, **counts)], ignore_conflicts=True)
+    return counts
+
+
+def reconcile(user_ids=None, batch_size=1000):
+    """
+        Recompute the counters of `user_ids` (default: every user) and fix the rows that differ,
+        creating missing ones. Returns ``(processed, repaired)``.
+    """
+    users = User.objects.order_by('id')
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    user_ids = users.values_list('id', flat=True).iterator()
+    processed = repaired = 0
+    for batch in batched(user_ids, batch_size):
+        with transaction.atomic():
+            # Locking the rows first holds back transitions on them until the counts are written, so
+            # a transition either is in the counts or is applied on top of them.
+            rows = {row.user_id: row for row in UserCounter.objects.select_for_update().filter(user_id__in=batch)}
+            counts = compute(batch)
+            missing, changed = [], []
+            for user_id, values in counts.items():
+                row = rows.get(user_id)
+                if row is None:
+                    missing.append(UserCounter(user_id=user_id, **values))
+                elif any(getattr(row, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(row, field, value)
+                    changed.append(row)
+            UserCounter.objects.bulk_create(missing, ignore_conflicts=True)
+            UserCounter.objects.bulk_update(changed, FIELDS)
+        processed += len(batch)
+        repaired += len(missing) + len(changed)
+    return processed, repaired
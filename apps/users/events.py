@@ -0,0 +1,14 @@
+"""
+In-process consumers of the outbox events (see apps/users/outbox.py), run by the dispatcher rather
+than on the request path.
+"""
+from apps.users.outbox import FRIEND_REQUEST_ACCEPTED, handler
+from apps.users.suggestions import record_friendships
+
+
+@handler(FRIEND_REQUEST_ACCEPTED)
+def update_friend_suggestions(events):
+    # A batch of accepts costs the same few queries as a single one.
+    record_friendships(
+        (event.payload['requested_user_id'], event.payload['request_received_user_id']) for event in events
+    )
@@ -0,0 +1,119 @@
+"""
+Streaming NDJSON export of the social graph.
+
+`export_user` yields one record per line for a user: the profile, every friend, every pending request
+the user sent (as listed by List Pending Requests) and the user's whole `FriendRequest` history, sent
+and received. `export_all` yields every user, friendship edge and friend request. Both read through
+``.iterator(chunk_size=...)`` (server-side cursors on Postgres), and `ndjson` encodes the records in
+buffered chunks, so memory stays flat however large the graph is.
+
+Friend request history lives in `FriendRequest` and, once archived (see apps/users/archive.py), in
+`FriendRequestArchive`; both tables are read in id order and merged, so the records look the same
+either way. A request archived while an export runs can be missed or listed twice.
+
+Every record has a ``type``: ``user``, ``friend``, ``pending_request``, ``friend_request`` or (full
+export only) ``friendship``.
+"""
+import heapq
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from apps.users.models import FriendRequest, FriendRequestArchive, Friendship, User
+
+
+CHUNK_SIZE = 2000
+# Encoded records are sent in pieces of about this many bytes.
+BUFFER_SIZE = 64 * 1024
+
+STATUS_LABELS = dict(FriendRequest.STATUS)
+USER_FIELDS = ("id", "email", "username", "name", "date_joined")
+
+
+def friend_request_record(row):
+    request_id, created_date, requested_user_id, request_received_user_id, status = row
+    return {
+        "type": "friend_request",
+        "id": request_id,
+        "created_date": created_date,
+        "requested_user_id": requested_user_id,
+        "request_received_user_id": request_received_user_id,
+        "status": STATUS_LABELS.get(status, status),
+    }
+
+
+def friend_requests(condition, chunk_size):
+    """
+        Friend requests matching `condition` from `FriendRequest` and `FriendRequestArchive`, by id.
+    """
+    streams = [
+        model.objects.filter(condition).order_by("id").values_list(
+            "id", "created_date", "requested_user_id", "request_received_user_id", "status"
+        ).iterator(chunk_size=chunk_size)
+        for model in (FriendRequest, FriendRequestArchive)
+    ]
+    for row in heapq.merge(*streams, key=itemgetter(0)):
+        yield friend_request_record(row)
+
+
+def export_user(user_id, chunk_size=CHUNK_SIZE):
+    # The profile is read again rather than taken from request.user, which may come from the auth cache.
+    profile = User.objects.filter(pk=user_id).values(*USER_FIELDS).first()
+    if profile is None:
+        return
+    yield {"type": "user", **profile}
+
+    friends = (
+        Friendship.objects.filter(user_id=user_id)
+        .order_by("friend_id")
+        .values_list("friend_id", "friend__email", "friend__name", "created_date")
+    )
+    for friend_id, email, name, since in friends.iterator(chunk_size=chunk_size):
+        yield {"type": "friend", "id": friend_id, "email": email, "name": name, "since": since}
+
+    pending = (
+        FriendRequest.objects.filter(requested_user_id=user_id, status=1)
+        .order_by("created_date", "id")
+        .values_list(
+            "id", "created_date", "request_received_user_id", "request_received_user__email",
+            "request_received_user__name",
+        )
+    )
+    for request_id, created_date, received_id, email, name in pending.iterator(chunk_size=chunk_size):
+        yield {
+            "type": "pending_request",
+            "id": request_id,
+            "created_date": created_date,
+            "request_received_user": {"id": received_id, "email": email, "name": name},
+        }
+
+    yield from friend_requests(Q(requested_user_id=user_id) | Q(request_received_user_id=user_id), chunk_size)
+
+
+def export_all(chunk_size=CHUNK_SIZE):
+    for row in User.objects.order_by("id").values(*USER_FIELDS).iterator(chunk_size=chunk_size):
+        yield {"type": "user", **row}
+
+    edges = Friendship.objects.order_by("id").values("user_id", "friend_id", "created_date")
+    for row in edges.iterator(chunk_size=chunk_size):
+        yield {"type": "friendship", **row}
+
+    yield from friend_requests(Q(), chunk_size)
+
+
+def ndjson(records, buffer_size=BUFFER_SIZE):
+    """
+        Encode `records` as newline-delimited JSON, yielding bytes of roughly `buffer_size`.
+    """
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    lines, size = [], 0
+    for record in records:
+        line = encoder.encode(record)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= buffer_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines, size = [], 0
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
@@ -0,0 +1,143 @@
+"""
+Graph queries over the friendship graph: mutual friends and degrees of separation.
+
+Both read the `Friendship` edges (every accepted friend request, both directions). Its
+``(user, friend)`` unique index returns a user's adjacency already sorted by friend id, so no
+recursive queries and no sorting are needed:
+
+    - `mutual_friend_ids` loads the two sorted adjacency arrays in one query and intersects them
+      (binary searches of the shorter one into the longer one when their sizes are far apart). The
+      query reads at most ``2 * GRAPH_MAX_DEGREE + 1`` edges; when a user has more friends than
+      ``GRAPH_MAX_DEGREE`` the database intersects the lists on the index instead.
+    - `find_path` runs a bidirectional breadth-first search, one query per hop, always expanding the
+      smaller frontier. Paths are at most ``GRAPH_MAX_DEPTH`` hops. A hop expands at most
+      ``GRAPH_FRONTIER_MAX`` users and reads at most ``GRAPH_HOP_EDGES_MAX`` edges, so a hop through a
+      high-degree user costs the same as any other. When a limit cuts the search, the result is marked
+      incomplete: "not found" then means "not found within the limits".
+"""
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+
+from apps.users.models import Friendship
+
+
+# Above this length ratio, binary searches beat hashing the longer array.
+GALLOP_RATIO = 16
+
+Path = namedtuple('Path', ['nodes', 'complete'])
+
+
+def intersect(first, second):
+    """
+        The values common to the sorted arrays `first` and `second`, sorted.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    if len(second) > GALLOP_RATIO * len(first):
+        common, low, high = array('q'), 0, len(second)
+        for value in first:
+            low = bisect_left(second, value, low)
+            if low == high:
+                break
+            if second[low] == value:
+                common.append(value)
+        return common
+    lookup = set(second)
+    return array('q', [value for value in first if value in lookup])
+
+
+def mutual_friend_ids(user_id, other_id):
+    """
+        Ids of the friends `user_id` and `other_id` have in common, as a sorted array.
+    """
+    if user_id == other_id:
+        return array('q')
+    limit = settings.GRAPH_MAX_DEGREE
+    adjacency = {user_id: array('q'), other_id: array('q')}
+    # Two lists of at most `limit` friends each never reach the slice, so both were read whole.
+    edges = (
+        Friendship.objects.filter(user_id__in=adjacency)
+        .order_by('user_id', 'friend_id')
+        .values_list('user_id', 'friend_id')[:2 * limit + 1]
+    )
+    for edge_user_id, friend_id in edges:
+        adjacency[edge_user_id].append(friend_id)
+    if all(len(friend_ids) <= limit for friend_ids in adjacency.values()):
+        return intersect(adjacency[user_id], adjacency[other_id])
+    common = (
+        Friendship.objects.filter(
+            user_id=user_id, friend_id__in=Friendship.objects.filter(user_id=other_id).values('friend_id')
+        )
+        .order_by('friend_id')
+        .values_list('friend_id', flat=True)
+    )
+    return array('q', common)
+
+
+def expand(frontier):
+    """
+        Read the `Friendship` edges of the users in `frontier`, within the per-hop limits. Returns the
+        ``(user_id, friend_id)`` pairs and whether every edge was read.
+    """
+    complete = len(frontier) <= settings.GRAPH_FRONTIER_MAX
+    if not complete:
+        frontier = sorted(frontier)[:settings.GRAPH_FRONTIER_MAX]
+    limit = settings.GRAPH_HOP_EDGES_MAX
+    edges = list(Friendship.objects.filter(user_id__in=frontier).values_list('user_id', 'friend_id')[:limit + 1])
+    if len(edges) > limit:
+        return edges[:limit], False
+    return edges, complete
+
+
+def walk(parents, node):
+    nodes = []
+    while node is not None:
+        nodes.append(node)
+        node = parents[node]
+    return nodes
+
+
+def find_path(source, target, max_depth=None):
+    """
+        A shortest path of at most `max_depth` hops (capped at ``GRAPH_MAX_DEPTH``) from `source` to
+        `target`. Returns a `Path` with the user ids from `source` to `target` (None when no path was
+        found) and whether the search ran within the per-hop limits.
+    """
+    max_depth = min(max_depth or settings.GRAPH_MAX_DEPTH, settings.GRAPH_MAX_DEPTH)
+    if source == target:
+        return Path([source], True)
+
+    # One side searches from `source`, the other from `target`; `parents` maps every user a side
+    # reached to the user it was reached from.
+    parents = ({source: None}, {target: None})
+    frontiers = ([source], [target])
+    complete = True
+    depth = 0
+    while depth < max_depth and frontiers[0] and frontiers[1]:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        edges, read_all = expand(frontiers[side])
+        complete = complete and read_all
+        reached, other = parents[side], parents[1 - side]
+        frontier = []
+        meetings = []
+        for user_id, friend_id in edges:
+            if friend_id in reached:
+                continue
+            reached[friend_id] = user_id
+            frontier.append(friend_id)
+            if friend_id in other:
+                meetings.append(friend_id)
+        depth += 1
+        if meetings:
+            # The shortest of the paths through the users both sides reached in this hop.
+            halves = min(
+                ((walk(reached, node), walk(other, node)) for node in meetings),
+                key=lambda pair: len(pair[0]) + len(pair[1]),
+            )
+            nodes = halves[0][::-1] + halves[1][1:]
+            return Path(nodes if side == 0 else nodes[::-1], complete)
+        frontiers = (frontier, frontiers[1]) if side == 0 else (frontiers[0], frontier)
+    return Path(None, complete)
@@ -0,0 +1,140 @@
+"""
+Password hashing for signup and login.
+
+The hashers below read their cost parameters from settings, so raising ``PASSWORD_HASH_PBKDF2_ITERATIONS``
+(or the Argon2/bcrypt equivalents) or switching ``PASSWORD_HASH_ALGORITHM`` takes effect without a
+migration: Django reports the old hashes as outdated and `check_user_password` re-hashes them on the
+next successful login.
+
+With ``PASSWORD_HASH_WORKERS`` > 0, hashing and verification run on a bounded process pool so the
+CPU-heavy key derivation neither holds the GIL nor piles up on request threads. At most
+``PASSWORD_HASH_MAX_PENDING`` jobs are queued; further callers wait for a free slot.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_PBKDF2_ITERATIONS
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """
+        Needs the ``argon2-cffi`` package.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_HASH_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_HASH_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_HASH_ARGON2_PARALLELISM
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    """
+        Needs the ``bcrypt`` package.
+    """
+
+    @property
+    def rounds(self):
+        return settings.PASSWORD_HASH_BCRYPT_ROUNDS
+
+
+def _setup_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+
+    django.setup()
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _check_password(password, encoded):
+    updates = []
+    valid = hashers.check_password(password, encoded, setter=updates.append)
+    return valid, bool(updates)
+
+
+class HashingPool:
+    """
+        Lazily started process pool. Workers are spawned (not forked) so they never inherit
+        database connections or locks held by request threads.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return settings.PASSWORD_HASH_WORKERS > 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_setup_worker,
+                    initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'accuknox.settings'),),
+                )
+            return self._executor
+
+    def run(self, func, *args):
+        if not self.enabled:
+            return func(*args)
+        executor = self._get_executor()
+        with self._slots:
+            return executor.submit(func, *args).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+pool = HashingPool()
+
+
+def hash_password(password):
+    return pool.run(_make_password, password)
+
+
+def verify_password(password, encoded):
+    """
+        Return ``(valid, must_update)`` for `password` against the stored hash `encoded`.
+    """
+    if not encoded:
+        return False, False
+    return pool.run(_check_password, password, encoded)
+
+
+def check_user_password(user, password):
+    """
+        Verify `password` for `user` and, when the stored hash uses an outdated algorithm or cost,
+        replace it with a fresh hash.
+    """
+    valid, must_update = verify_password(password, user.password)
+    if valid and must_update:
+        user.password = hash_password(password)
+        user.save(update_fields=['password'])
+    return valid
@@ -0,0 +1,230 @@
+"""
+Per-request performance instrumentation.
+
+`PerformanceMiddleware` (apps/users/middleware.py) counts every request and times it. A sampled
+fraction of requests (``PERFORMANCE_SAMPLE_RATE``) additionally records:
+
+    - database queries and their total time, through an execute wrapper installed on every connection;
+    - serialization time, measured by the renderers in apps/users/renderers.py;
+    - response size;
+    - any section a view wraps in `timing` (the profiling hook).
+
+Sampled responses carry a ``Server-Timing`` header. Totals per view action are kept in `registry` and
+served in the Prometheus text format by `metrics_view`. They are per process: scrape every worker, or
+run one worker per container.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+        Measurements of one sampled request.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.sections = {}
+
+    def record_query(self, sql, params, many, duration):
+        self.queries += 1
+        self.db_time += duration
+
+    def add_section(self, name, duration):
+        self.sections[name] = self.sections.get(name, 0.0) + duration
+
+    def server_timing(self, total):
+        entries = [
+            'total;dur=%.1f' % (total * 1000),
+            'db;dur=%.1f;desc="%d queries"' % (self.db_time * 1000, self.queries),
+            'serialize;dur=%.1f' % (self.serialize_time * 1000),
+        ]
+        entries.extend('%s;dur=%.1f' % (name, duration * 1000) for name, duration in self.sections.items())
+        return ', '.join(entries)
+
+
+def get_current():
+    """
+        The `RequestMetrics` of the current request, or None when it is not sampled.
+    """
+    return _current.get()
+
+
+@contextmanager
+def measure(metrics):
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timing(name):
+    """
+        Profiling hook: time the enclosed block as the Server-Timing entry `name` of a sampled request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_section(name, time.perf_counter() - started)
+
+
+def record_queries(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, params, many, time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Connected to connection_created in UsersConfig.ready(). Outside sampled requests the wrapper
+    # only costs a context variable lookup.
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """
+        Thread-safe counters and duration histograms keyed by view action, rendered as Prometheus text.
+    """
+
+    counters = {
+        'http_requests_total': 'Requests handled.',
+        'http_sampled_requests_total': 'Requests sampled for the detailed measurements below.',
+        'http_request_db_queries_total': 'Database queries run by sampled requests.',
+        'http_request_db_seconds_total': 'Database time of sampled requests.',
+        'http_request_serialize_seconds_total': 'Response serialization time of sampled requests.',
+        'http_response_bytes_total': 'Response body size of sampled requests.',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._durations = {}
+
+    def _inc(self, name, labels, value=1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, action, method, status_code, duration, metrics=None, size=None):
+        with self._lock:
+            self._inc('http_requests_total', (('action', action), ('method', method), ('status', str(status_code))))
+            histogram = self._durations.get(action)
+            if histogram is None:
+                histogram = self._durations[action] = Histogram(DURATION_BUCKETS)
+            histogram.observe(duration)
+            if metrics is not None:
+                labels = (('action', action),)
+                self._inc('http_sampled_requests_total', labels)
+                self._inc('http_request_db_queries_total', labels, metrics.queries)
+                self._inc('http_request_db_seconds_total', labels, metrics.db_time)
+                self._inc('http_request_serialize_seconds_total', labels, metrics.serialize_time)
+                if size is not None:
+                    self._inc('http_response_bytes_total', labels, size)
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, help_text in self.counters.items():
+                lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s counter' % name]
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append('%s{%s} %s' % (name, format_labels(labels), format_value(value)))
+
+            name = 'http_request_duration_seconds'
+            lines += ['# HELP %s Request wall time.' % name, '# TYPE %s histogram' % name]
+            for action, histogram in sorted(self._durations.items()):
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    labels = (('action', action), ('le', '+Inf' if bound == float('inf') else repr(bound)))
+                    lines.append('%s_bucket{%s} %d' % (name, format_labels(labels), cumulative))
+                labels = format_labels((('action', action),))
+                lines.append('%s_sum{%s} %s' % (name, labels, format_value(histogram.sum)))
+                lines.append('%s_count{%s} %d' % (name, labels, cumulative))
+
+        lines += render_pool_stats()
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels)
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_pool_stats():
+    """
+        Gauges for the connection pools of the pooled Postgres backend, when it is in use.
+    """
+    if not any(database['ENGINE'] == 'accuknox.pooled_postgresql' for database in settings.DATABASES.values()):
+        return []
+    from accuknox.pooled_postgresql.base import pool_stats
+
+    lines = []
+    for alias, stats in sorted(pool_stats().items()):
+        for name, value in sorted(stats.items()):
+            metric = 'db_pool_%s' % name
+            lines.append('%s{database="%s"} %s' % (metric, alias, format_value(value)))
+    return lines
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    """
+        Prometheus scrape endpoint. When ``PERFORMANCE_METRICS_TOKEN`` is set, the scraper must send it
+        as a bearer token; without a token the endpoint is only served with ``DEBUG`` on.
+    """
+    token = settings.PERFORMANCE_METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        raise Http404
+    if token and request.META.get('HTTP_AUTHORIZATION') != 'Bearer %s' % token:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
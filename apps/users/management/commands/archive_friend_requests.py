@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.users.archive import archivable, archive
+from apps.users.models import FriendRequest
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old rejected and accepted friend requests to FriendRequestArchive, in batches of one "
+        "transaction each. Pending requests are never archived."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rejected-days", type=int, default=settings.FRIEND_REQUEST_ARCHIVE_REJECTED_DAYS,
+            help="archive rejected requests older than this many days",
+        )
+        parser.add_argument(
+            "--accepted-days", type=int, default=settings.FRIEND_REQUEST_ARCHIVE_ACCEPTED_DAYS,
+            help="archive accepted requests older than this many days",
+        )
+        parser.add_argument("--batch-size", type=int, default=settings.FRIEND_REQUEST_ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--max-batches", type=int, help="stop after this many batches")
+        parser.add_argument("--pause", type=float, default=0, help="seconds to sleep between batches")
+        parser.add_argument("--dry-run", action="store_true", help="only count the requests due")
+
+    def handle(self, *args, **options):
+        condition = archivable(rejected_days=options["rejected_days"], accepted_days=options["accepted_days"])
+        if options["dry_run"]:
+            due = FriendRequest.objects.filter(condition).count()
+            self.stdout.write("%d friend requests are due for the archive." % due)
+            return
+
+        moved = archive(
+            condition,
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+            pause=options["pause"],
+            progress=lambda total: self.stdout.write("Archived %d friend requests..." % total),
+        )
+        self.stdout.write(self.style.SUCCESS("Archived %d friend requests." % moved))
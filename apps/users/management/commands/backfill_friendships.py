@@ -0,0 +1,36 @@
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+
+from apps.users.models import FriendRequest, FriendRequestArchive, Friendship
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the Friendship edges (both directions) for every accepted FriendRequest, archived ones included."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        accepted = chain.from_iterable(
+            model.objects.filter(status=2)
+            .order_by()
+            .values_list("requested_user_id", "request_received_user_id", "created_date")
+            .iterator(chunk_size=batch_size)
+            for model in (FriendRequest, FriendRequestArchive)
+        )
+
+        batch, processed = [], 0
+        for user_id, friend_id, created_date in accepted:
+            batch += Friendship.edges(user_id, friend_id, created_date)
+            processed += 1
+            if len(batch) >= batch_size:
+                Friendship.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            Friendship.objects.bulk_create(batch, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS("Backfilled friendships for %d accepted requests." % processed))
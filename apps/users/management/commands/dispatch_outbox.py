@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.users.outbox import dispatch, get_sinks, requeue_dead
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver the outbox events (signups and friend request changes) to the OUTBOX_SINKS in batches, "
+        "polling every OUTBOX_POLL_INTERVAL seconds when there is nothing to send. With --once, drain "
+        "what is due and exit. With --requeue-dead, first make the dead-lettered events due again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument("--interval", type=float, default=settings.OUTBOX_POLL_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="exit when no event is due")
+        parser.add_argument("--requeue-dead", action="store_true", help="retry the dead-lettered events")
+
+    def handle(self, *args, **options):
+        if options["requeue_dead"]:
+            self.stdout.write("Requeued %d dead-lettered outbox events." % requeue_dead())
+        sinks = get_sinks()
+        delivered = 0
+        while True:
+            close_old_connections()
+            claimed = dispatch(options["batch_size"], sinks)
+            delivered += claimed
+            if claimed == options["batch_size"]:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS("Dispatched %d outbox events." % delivered))
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.users.export import CHUNK_SIZE, export_all, export_user, ndjson
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Export social graphs as NDJSON: one user's profile, friends, pending requests and friend "
+        "request history (--user, by id or email), or every user, friendship and friend request (--all)."
+    )
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument("--user", help="id or email of the user to export")
+        target.add_argument("--all", action="store_true", help="export the whole graph")
+        parser.add_argument("--output", help="file to write (default: stdout)")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            records = export_all(options["chunk_size"])
+        else:
+            lookup = {"email": options["user"]} if "@" in options["user"] else {"pk": options["user"]}
+            try:
+                user_id = User.objects.values_list("pk", flat=True).get(**lookup)
+            except (User.DoesNotExist, ValueError):
+                raise CommandError("User %s not found." % options["user"])
+            records = export_user(user_id, options["chunk_size"])
+
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        size = 0
+        try:
+            for chunk in ndjson(records):
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if options["output"]:
+                output.close()
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS("Wrote %d bytes to %s." % (size, options["output"])))
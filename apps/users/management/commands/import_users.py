@@ -0,0 +1,225 @@
+import csv
+import json
+import sys
+import time
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.users.bulkload import batched, load
+from apps.users.cache import invalidate_lists
+from apps.users.hashers import hash_password
+from apps.users.models import Friendship, User
+
+
+# Upper bound on the ids/emails of one IN (...) lookup, well below SQLite's variable limit.
+LOOKUP_CHUNK = 500
+# Invalid rows reported individually before only counting them.
+MAX_REPORTED_ERRORS = 20
+
+
+def get_format(path, format_name):
+    if format_name:
+        return format_name
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise CommandError("Cannot tell the format of %s, pass --format." % path)
+
+
+def read_rows(path, format_name):
+    """
+        Yield ``(line_number, row)`` for every record of `path` ("-" reads stdin); `row` is a dict, or
+        None when the line is not valid JSON.
+    """
+    handle = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if format_name == "csv":
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(handle, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_number, row if isinstance(row, dict) else None
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def existing(queryset, field, values):
+    found = set()
+    for chunk in batched(values, LOOKUP_CHUNK):
+        found.update(queryset.filter(**{"%s__in" % field: chunk}).values_list(field, flat=True))
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users, and optionally friendships, from CSV or JSONL files in batches, in constant "
+        "memory. User records have email, username, name and password; passwords must already be "
+        "hashed by one of PASSWORD_HASHERS unless --hash-passwords is given. Users whose email or "
+        "username is taken are skipped. Friendship records have user_email, friend_email and an "
+        "optional ISO 8601 created_date; both directions are stored."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("users", nargs="?", help='users file, or "-" for stdin')
+        parser.add_argument("--friendships", help="friendships file")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument(
+            "--hash-passwords", action="store_true", help="passwords are plain text (one hash per user, slow)"
+        )
+
+    def handle(self, *args, **options):
+        if not options["users"] and not options["friendships"]:
+            raise CommandError("Give a users file, --friendships, or both.")
+        self.errors = 0
+        if options["users"]:
+            rows = read_rows(options["users"], get_format(options["users"], options["format"]))
+            self.import_users(rows, options["batch_size"], options["hash_passwords"])
+        if options["friendships"]:
+            rows = read_rows(options["friendships"], get_format(options["friendships"], options["format"]))
+            self.import_friendships(rows, options["batch_size"])
+
+    def invalid(self, line_number, reason):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write("Line %d skipped: %s" % (line_number, reason))
+
+    def build_user(self, line_number, row, hash_passwords):
+        if row is None:
+            return self.invalid(line_number, "not a JSON object")
+        email = clean(row.get("email"))
+        try:
+            validate_email(email)
+        except ValidationError:
+            return self.invalid(line_number, "invalid email %r" % email)
+        username, name, password = clean(row.get("username")), clean(row.get("name")), clean(row.get("password"))
+        if (username and len(username) > 150) or (name and len(name) > 150):
+            return self.invalid(line_number, "username or name longer than 150 characters")
+        if password and not hash_passwords and not password.startswith(UNUSABLE_PASSWORD_PREFIX):
+            try:
+                identify_hasher(password)
+            except ValueError:
+                return self.invalid(line_number, "password is not hashed by one of PASSWORD_HASHERS")
+        return User(email=User.objects.normalize_email(email), username=username, name=name, password=password)
+
+    def progress(self, label, counts, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write("%s: %s (%.0f rows/s)" % (
+            label, ", ".join("%d %s" % (count, name) for name, count in counts.items()), counts["read"] / elapsed,
+        ))
+
+    def import_users(self, rows, batch_size, hash_passwords):
+        started = time.monotonic()
+        counts = {"read": 0, "imported": 0, "duplicates": 0, "invalid": 0}
+        for batch in batched(rows, batch_size):
+            counts["read"] += len(batch)
+            users, usernames = {}, set()
+            for line_number, row in batch:
+                user = self.build_user(line_number, row, hash_passwords)
+                if user is None:
+                    counts["invalid"] += 1
+                elif user.email in users or (user.username and user.username in usernames):
+                    counts["duplicates"] += 1
+                else:
+                    users[user.email] = user
+                    usernames.add(user.username)
+            usernames.discard(None)
+
+            # Rows from earlier batches are in the database by now, so this also catches duplicates
+            # across the whole file.
+            taken_emails = existing(User.objects, "email", list(users))
+            taken_usernames = existing(User.objects, "username", list(usernames))
+            new_users = [
+                user for user in users.values()
+                if user.email not in taken_emails and user.username not in taken_usernames
+            ]
+            counts["duplicates"] += len(users) - len(new_users)
+
+            if hash_passwords:
+                for user in new_users:
+                    if user.password:
+                        user.password = hash_password(user.password)
+            # ignore_conflicts covers rows inserted concurrently since the lookup above.
+            imported = load(User, new_users, batch_size, ignore_conflicts=True)
+            counts["imported"] += imported
+            counts["duplicates"] += len(new_users) - imported
+            self.progress("Users", counts, started)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Imported %d users in %.1fs." % (counts["imported"], time.monotonic() - started)
+        ))
+
+    def import_friendships(self, rows, batch_size):
+        started = time.monotonic()
+        counts = {"read": 0, "imported": 0, "existing": 0, "unknown users": 0, "invalid": 0}
+        for batch in batched(rows, batch_size):
+            counts["read"] += len(batch)
+            pairs = []
+            for line_number, row in batch:
+                if row is None:
+                    self.invalid(line_number, "not a JSON object")
+                    counts["invalid"] += 1
+                    continue
+                user_email, friend_email = clean(row.get("user_email")), clean(row.get("friend_email"))
+                raw_date = clean(row.get("created_date"))
+                try:
+                    created_date = parse_datetime(raw_date) if raw_date else None
+                except ValueError:
+                    created_date = None
+                if not user_email or not friend_email or user_email == friend_email:
+                    reason = "needs two different emails"
+                elif raw_date and created_date is None:
+                    reason = "invalid created_date %r" % raw_date
+                else:
+                    if created_date and timezone.is_naive(created_date):
+                        created_date = timezone.make_aware(created_date)
+                    pairs.append((
+                        User.objects.normalize_email(user_email),
+                        User.objects.normalize_email(friend_email),
+                        created_date,
+                    ))
+                    continue
+                self.invalid(line_number, reason)
+                counts["invalid"] += 1
+
+            emails = list({email for pair in pairs for email in pair[:2]})
+            ids = {}
+            for chunk in batched(emails, LOOKUP_CHUNK):
+                ids.update(User.objects.filter(email__in=chunk).values_list("email", "id"))
+            edges = []
+            for user_email, friend_email, created_date in pairs:
+                if user_email in ids and friend_email in ids:
+                    edges += Friendship.edges(ids[user_email], ids[friend_email], created_date)
+                else:
+                    counts["unknown users"] += 1
+            # Both edges of a pair are new, or both existed already (or repeat a pair of the file).
+            imported = load(Friendship, edges, batch_size * 2, ignore_conflicts=True) // 2
+            counts["imported"] += imported
+            counts["existing"] += len(edges) // 2 - imported
+            invalidate_lists(*{edge.user_id for edge in edges})
+            self.progress("Friendships", counts, started)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Imported %d friendships in %.1fs." % (counts["imported"], time.monotonic() - started)
+        ))
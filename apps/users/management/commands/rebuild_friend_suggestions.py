@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.users.suggestions import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the friend suggestions of every user (or of --user ids) from the Friendship table. "
+        "Run it after loading friendships in bulk, and periodically to pick up the updates skipped for "
+        "users with more than FRIEND_SUGGESTIONS_MAX_FANOUT friends."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users", help="user id (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed = rebuild(options["users"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            "Rebuilt friend suggestions for %d users in %.1fs." % (processed, time.monotonic() - started)
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.users.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the badge counts (friends, pending requests received and sent) of every user, or of "
+        "--user ids, from the tables and repair the counters that drifted. Run it after loading users or "
+        "friendships in bulk, and periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users", help="user id (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed, repaired = reconcile(options["users"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            "Checked the counters of %d users, repaired %d, in %.1fs."
+            % (processed, repaired, time.monotonic() - started)
+        ))
@@ -0,0 +1,109 @@
+import bisect
+import random
+import time
+from array import array
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from apps.users.bulkload import load
+from apps.users.hashers import hash_password
+from apps.users.models import FriendRequest, Friendship, User
+
+
+SYLLABLES = [
+    'ka', 'ro', 'mi', 'ne', 'lu', 'sa', 'to', 'vi', 'an', 'el', 'jo', 'ri', 'da', 'be', 'no',
+    'sha', 'li', 'mar', 'ven', 'tor', 'is', 'ga', 'pe', 'qu', 'zel', 'ha', 'ur', 'fi', 'yo', 'cha',
+]
+
+
+def random_name(rng):
+    def word():
+        return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+    return '%s %s' % (word(), word())
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic social graph: users whose friend counts follow a power law, plus pending "
+        "friend requests. Every seeded user can log in as user<id>@<domain> with --password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--alpha", type=float, default=2.5, help="power-law exponent of the friend degree")
+        parser.add_argument("--min-degree", type=int, default=1)
+        parser.add_argument("--max-degree", type=int, default=1000)
+        parser.add_argument("--pending", type=int, default=2, help="pending requests sent per user")
+        parser.add_argument("--password", default="bench-password")
+        parser.add_argument("--domain", default="bench.local")
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["alpha"] <= 1:
+            raise CommandError("--alpha must be greater than 1.")
+        started = time.monotonic()
+        rng = random.Random(options["seed"])
+        count = options["users"]
+        batch_size = options["batch_size"]
+        first_id = (User.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+
+        # One hash for everybody: hashing millions of passwords would dominate the run.
+        password = hash_password(options["password"])
+        load(
+            User,
+            (
+                User(
+                    id=user_id,
+                    email="user%d@%s" % (user_id, options["domain"]),
+                    username="user%d" % user_id,
+                    name=random_name(rng),
+                    password=password,
+                )
+                for user_id in range(first_id, first_id + count)
+            ),
+            batch_size,
+        )
+
+        # Degrees from a Pareto distribution (inverse transform sampling), kept as cumulative weights
+        # so partners can be drawn in proportion to their degree (Chung-Lu model).
+        cumulative = array("d")
+        total = 0.0
+        for _ in range(count):
+            u = 1.0 - rng.random()
+            degree = min(options["max_degree"], int(options["min_degree"] * u ** (-1 / (options["alpha"] - 1))))
+            total += degree
+            cumulative.append(total)
+
+        def pick():
+            return min(count - 1, bisect.bisect_right(cumulative, rng.random() * total))
+
+        def friendships():
+            previous = 0.0
+            for index in range(count):
+                degree, previous = cumulative[index] - previous, cumulative[index]
+                # Every edge has two ends, so each user initiates half of its expected degree.
+                partners = {pick() for _ in range(int(degree + 1) // 2)}
+                partners.discard(index)
+                for partner in partners:
+                    yield from Friendship.edges(first_id + index, first_id + partner)
+
+        edges = load(Friendship, friendships(), batch_size, ignore_conflicts=True)
+
+        def pending_requests():
+            for index in range(count):
+                for _ in range(options["pending"]):
+                    other = rng.randrange(count)
+                    if other != index:
+                        yield FriendRequest(
+                            requested_user_id=first_id + index, request_received_user_id=first_id + other
+                        )
+
+        requests = load(FriendRequest, pending_requests(), batch_size, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded users %d-%d with %d friendship edges and %d pending requests in %.1fs."
+            % (first_id, first_id + count - 1, edges, requests, time.monotonic() - started)
+        ))
@@ -0,0 +1,80 @@
+import asyncio
+import random
+import time
+
+from django.conf import settings
+
+from apps.users.instrumentation import RequestMetrics, measure, registry
+from apps.users.querylog import QueryLog, capture
+
+
+def get_action(request):
+    """
+        Label for the view that handled `request`: the DRF action name (``send_friend_request``, ...),
+        otherwise the URL name.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    actions = getattr(match.func, 'actions', None) or {}
+    return actions.get(request.method.lower()) or match.view_name or match.func.__name__
+
+
+def sampled(rate):
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class PerformanceMiddleware:
+    """
+        Time every request and, for a ``PERFORMANCE_SAMPLE_RATE`` fraction of them, record queries,
+        serialization time and response size and add a ``Server-Timing`` header. For a
+        ``QUERY_LOG_SAMPLE_RATE`` fraction, capture every statement and check it for N+1 patterns and
+        the action's query budget (see apps/users/querylog.py). Works in both the WSGI and the ASGI
+        handler without forcing async views onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Same marker Django's MiddlewareMixin sets so the handler treats this instance as async.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics, query_log = self.sample()
+        started = time.perf_counter()
+        with measure(metrics), capture(query_log):
+            response = self.get_response(request)
+        self.finish(request, response, metrics, query_log, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        metrics, query_log = self.sample()
+        started = time.perf_counter()
+        with measure(metrics), capture(query_log):
+            response = await self.get_response(request)
+        self.finish(request, response, metrics, query_log, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def sample():
+        return (
+            RequestMetrics() if sampled(settings.PERFORMANCE_SAMPLE_RATE) else None,
+            QueryLog() if sampled(settings.QUERY_LOG_SAMPLE_RATE) else None,
+        )
+
+    @staticmethod
+    def finish(request, response, metrics, query_log, duration):
+        action = get_action(request)
+        if query_log is not None:
+            query_log.report(action)
+        size = None
+        if metrics is not None:
+            if not response.streaming:
+                size = len(response.content)
+            response['Server-Timing'] = metrics.server_timing(duration)
+        registry.observe(action, request.method, response.status_code, duration, metrics, size)
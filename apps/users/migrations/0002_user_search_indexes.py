@@ -0,0 +1,49 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+# Postgres-only indexes for `UserView.user_search`. The expressions have to match the
+# SQL produced by `apps.users.search.PostgresSearchBackend` for the planner to use them.
+SEARCH_INDEXES = [
+    (
+        'users_user_name_upper_trgm',
+        'CREATE INDEX IF NOT EXISTS users_user_name_upper_trgm '
+        'ON users_user USING gin ((UPPER(name::text)) gin_trgm_ops)',
+    ),
+    (
+        'users_user_email_upper',
+        'CREATE INDEX IF NOT EXISTS users_user_email_upper '
+        'ON users_user ((UPPER(email::text)))',
+    ),
+    (
+        'users_user_search_vector',
+        'CREATE INDEX IF NOT EXISTS users_user_search_vector '
+        "ON users_user USING gin ((to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(email, ''))))",
+    ),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, sql in SEARCH_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in SEARCH_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
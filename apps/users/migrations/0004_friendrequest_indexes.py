@@ -0,0 +1,66 @@
+# Generated by Django 3.2.4 on 2026-10-18 09:40
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+logger = logging.getLogger(__name__)
+
+
+def reject_duplicate_pending_requests(apps, schema_editor):
+    """
+    Keep only the oldest pending request per (requested_user, request_received_user) pair so the
+    partial unique constraint can be created. The newer duplicates are marked rejected (status 3),
+    and their number is logged.
+    """
+    FriendRequest = apps.get_model('users', 'FriendRequest')
+    duplicates = (
+        FriendRequest.objects.filter(status=1)
+        .values('requested_user', 'request_received_user')
+        .annotate(keep=models.Min('id'), total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    rejected = 0
+    for row in duplicates.iterator():
+        rejected += FriendRequest.objects.filter(
+            status=1,
+            requested_user=row['requested_user'],
+            request_received_user=row['request_received_user'],
+        ).exclude(pk=row['keep']).update(status=3)
+    if rejected:
+        logger.warning('Rejected %d duplicate pending friend requests, keeping the oldest of each pair.', rejected)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_friendship'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['requested_user', 'created_date'], name='friendreq_sender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['requested_user', 'request_received_user', 'status'], name='friendreq_pair_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('status', 1)), fields=['requested_user', 'created_date', 'id'], name='friendreq_pending_idx'),
+        ),
+        migrations.RunPython(reject_duplicate_pending_requests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 1)), fields=('requested_user', 'request_received_user'), name='friendreq_one_pending_per_pair'),
+        ),
+        # The composite indexes above start with requested_user, so its single-column FK index goes last.
+        migrations.AlterField(
+            model_name='friendrequest',
+            name='requested_user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='requested_user', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.4 on 2026-10-18 19:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to='users.user')),
+                ('friends', models.IntegerField(default=0)),
+                ('pending_received', models.IntegerField(default=0)),
+                ('pending_sent', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
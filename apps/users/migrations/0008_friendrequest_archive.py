@@ -0,0 +1,47 @@
+# Generated by Django 3.2.4 on 2026-10-18 19:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_usercounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendRequestArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField()),
+                ('status', models.IntegerField(choices=[(1, 'Requested'), (2, 'Accepted'), (3, 'Rejected')])),
+                ('archived_date', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('status__in', [2, 3])), fields=['created_date', 'id'], name='friendreq_archivable_idx'),
+        ),
+        migrations.AddField(
+            model_name='friendrequestarchive',
+            name='request_received_user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='friendrequestarchive',
+            name='requested_user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequestarchive',
+            index=models.Index(fields=['requested_user', 'id'], name='friendreqarchive_sender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequestarchive',
+            index=models.Index(fields=['request_received_user', 'id'], name='friendreqarchive_receiver_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.4 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_friendrequest_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='dead_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='pending_sinks',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import django
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 
 
@@ -23,19 +24,114 @@ class FriendRequest(models.Model):
         (3, 'Rejected'),
     ]
     created_date = models.DateTimeField(default=django.utils.timezone.now)
-    requested_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='requested_user')
+    # requested_user is the leading column of the composite indexes below, so it needs no index of its own.
+    requested_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='requested_user', db_index=False)
     request_received_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='request_received_user')
     status = models.IntegerField(choices=STATUS, default=1)
 
+    MAX_REQUESTS_PER_MINUTE = 3
+
+    class Meta:
+        indexes = [
+            # can_send_friend_request: requests sent by a user since a cutoff.
+            models.Index(fields=['requested_user', 'created_date'], name='friendreq_sender_created_idx'),
+            # check_already_request_send and other per-pair status lookups.
+            models.Index(
+                fields=['requested_user', 'request_received_user', 'status'], name='friendreq_pair_status_idx',
+            ),
+            # list_pending_friends_request pages on (created_date, id) over pending rows only.
+            models.Index(
+                fields=['requested_user', 'created_date', 'id'],
+                name='friendreq_pending_idx',
+                condition=models.Q(status=1),
+            ),
+            # archive_friend_requests finds the accepted and rejected rows due for the archive, oldest first.
+            models.Index(
+                fields=['created_date', 'id'],
+                name='friendreq_archivable_idx',
+                condition=models.Q(status__in=[2, 3]),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['requested_user', 'request_received_user'],
+                condition=models.Q(status=1),
+                name='friendreq_one_pending_per_pair',
+            ),
+        ]
+
     @classmethod
     def can_send_friend_request(cls, user):
+        """
+        Database check of the per-minute send limit. The API enforces the limit through
+        `apps.users.ratelimit` instead; this is kept for scripts and as the benchmark baseline.
+        """
         cutoff_time = timezone.now() - timezone.timedelta(minutes=1)
         recent_requests_count = cls.objects.filter(
             requested_user=user,
             created_date__gte=cutoff_time
         ).count()
 
-        return recent_requests_count < 3
+        return recent_requests_count < cls.MAX_REQUESTS_PER_MINUTE
+
+    @classmethod
+    def get_send_state(cls, requested_user, request_received_user_id):
+        """
+        Load the receiving user together with the pair state `send_friend_request` checks, in a
+        single query: a pending request for the pair and an existing friendship. Returns None
+        when the receiving user does not exist.
+        """
+        return cls.annotate_send_state(requested_user, User.objects.filter(pk=request_received_user_id)).first()
+
+    @classmethod
+    def annotate_send_state(cls, requested_user, users):
+        """
+        Annotate a `User` queryset with ``has_pending_request`` and ``is_friend`` relative to `requested_user`.
+        """
+        return users.annotate(
+            has_pending_request=Exists(
+                cls.objects.filter(requested_user=requested_user, request_received_user=OuterRef('pk'), status=1)
+            ),
+            is_friend=Exists(Friendship.objects.filter(user=requested_user, friend=OuterRef('pk'))),
+        )
+
+    @classmethod
+    def create_pending(cls, friend_requests):
+        """
+        Insert the pending `friend_requests` and return the ones written, with their ids. A request for a
+        pair that already has a pending one (sent concurrently) trips the one-pending-per-pair constraint
+        and is left out. The batch is one INSERT unless that happens; then every request gets a savepoint.
+        """
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(friend_requests)
+        except IntegrityError:
+            created = []
+            for friend_request in friend_requests:
+                try:
+                    with transaction.atomic():
+                        friend_request.save(force_insert=True)
+                except IntegrityError:
+                    continue
+                created.append(friend_request)
+            return created
+
+        if any(friend_request.pk is None for friend_request in friend_requests):
+            # The backend returns no ids from bulk inserts (SQLite). Every pair now has exactly one pending
+            # request, the one inserted above, and it stays invisible to others until the transaction commits.
+            ids = {
+                (sender_id, receiver_id): pk
+                for pk, sender_id, receiver_id in cls.objects.filter(
+                    requested_user_id__in={friend_request.requested_user_id for friend_request in friend_requests},
+                    request_received_user_id__in={
+                        friend_request.request_received_user_id for friend_request in friend_requests
+                    },
+                    status=1,
+                ).values_list('id', 'requested_user_id', 'request_received_user_id')
+            }
+            for friend_request in friend_requests:
+                friend_request.pk = ids[(friend_request.requested_user_id, friend_request.request_received_user_id)]
+        return friend_requests
     
     @classmethod
     def check_already_request_send(cls, requested_user, secondary_user):
@@ -47,9 +143,113 @@ class FriendRequest(models.Model):
         
     @classmethod
     def check_already_friend(cls, requested_user, secondary_user):
-        return cls.objects.filter(
-            requested_user=requested_user,
-            request_received_user=secondary_user,
-            status=2
-        ).exists()
-        
\ No newline at end of file
+        return Friendship.are_friends(requested_user, secondary_user)
+
+
+class FriendRequestArchive(models.Model):
+    """
+    Cold storage for accepted and rejected friend requests past their retention in `FriendRequest`,
+    moved in batches by ``manage.py archive_friend_requests`` (see `apps.users.archive`) so the hot
+    table and its indexes only hold pending and recent requests. Rows keep their original id.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    created_date = models.DateTimeField()
+    requested_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    request_received_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    status = models.IntegerField(choices=FriendRequest.STATUS)
+    archived_date = models.DateTimeField(default=django.utils.timezone.now)
+
+    class Meta:
+        indexes = [
+            # The export reads a user's history, sent and received, in id order.
+            models.Index(fields=['requested_user', 'id'], name='friendreqarchive_sender_idx'),
+            models.Index(fields=['request_received_user', 'id'], name='friendreqarchive_receiver_idx'),
+        ]
+
+
+class Friendship(models.Model):
+    """
+    Materialized friendship graph. Every accepted `FriendRequest` is stored as two edges,
+    one per direction, so both friend lists and "are we friends" checks are a lookup on
+    the (user, friend) unique index without OR-ing over the request table.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friendships', db_index=False)
+    friend = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_date = models.DateTimeField(default=django.utils.timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'friend'], name='users_friendship_user_friend_uniq'),
+        ]
+
+    @classmethod
+    def edges(cls, user_id, friend_id, created_date=None):
+        created_date = created_date or timezone.now()
+        return [
+            cls(user_id=user_id, friend_id=friend_id, created_date=created_date),
+            cls(user_id=friend_id, friend_id=user_id, created_date=created_date),
+        ]
+
+    @classmethod
+    def add(cls, user_id, friend_id):
+        cls.objects.bulk_create(cls.edges(user_id, friend_id), ignore_conflicts=True)
+
+    @classmethod
+    def are_friends(cls, user, friend):
+        return cls.objects.filter(user=user, friend=friend).exists()
+
+
+class FriendSuggestion(models.Model):
+    """
+    Precomputed "people you may know": for every user, at most ``FRIEND_SUGGESTIONS_MAX`` users who
+    are not their friends yet, ranked by the number of friends they have in common. Maintained by
+    `apps.users.suggestions`.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friend_suggestions', db_index=False)
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    mutual_friends = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'candidate'], name='users_friendsuggestion_user_candidate_uniq'),
+        ]
+        indexes = [
+            # The suggestions endpoint reads one user's rows in rank order, keyset paginated.
+            models.Index(fields=['user', '-mutual_friends', 'candidate'], name='friendsugg_rank_idx'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """
+    Transactional outbox: an event is written in the same transaction as the change it describes and
+    delivered to the ``OUTBOX_SINKS`` by ``manage.py dispatch_outbox``, which deletes it once every sink
+    took it (see `apps.users.outbox`).
+    """
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created_date = models.DateTimeField(default=django.utils.timezone.now)
+    # Failed deliveries are retried from this time on.
+    available_date = models.DateTimeField(default=django.utils.timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Dotted paths of the sinks that failed to take the event, the only ones it is retried with; empty
+    # until a delivery fails.
+    pending_sinks = models.JSONField(default=list, blank=True)
+    # Set once the event failed OUTBOX_MAX_ATTEMPTS times; it is then no longer dispatched.
+    dead_date = models.DateTimeField(null=True, blank=True)
+
+
+class UserCounter(models.Model):
+    """
+    Badge counts of a user: friends, pending requests received and pending requests sent. Changed
+    with ``F()`` updates on every friend request transition, see `apps.users.counters`.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+    friends = models.IntegerField(default=0)
+    pending_received = models.IntegerField(default=0)
+    pending_sent = models.IntegerField(default=0)
@@ -0,0 +1,198 @@
+"""
+Transactional outbox for signups and the friend request lifecycle.
+
+`publish` writes an `OutboxEvent` in the caller's transaction, so an event exists exactly when the
+change it describes was committed. `dispatch` (``manage.py dispatch_outbox``) drains the table oldest
+first in batches of at most ``OUTBOX_BATCH_SIZE`` and hands each batch to every sink of
+``OUTBOX_SINKS``:
+
+    - `HandlerSink` calls the functions registered with ``@handler(topic)`` (see apps/users/events.py)
+      with the batch's events of that topic, in the dispatcher's transaction
+    - `LocalQueueSink` puts the events on a bounded in-process queue, a stand-in for a broker, read with
+      `LocalQueueSink.drain` by a consumer running in the dispatcher's process
+
+Delivery is at least once. An event is deleted only after every sink took it. When a sink fails, it
+is given each event of the batch again on its own, so one bad event does not hold back the others.
+The events that still fail are retried after a backoff, only with the sinks that failed
+(``pending_sinks``), and after ``OUTBOX_MAX_ATTEMPTS`` failures they are dead-lettered: they stay in
+the table with ``dead_date`` set until ``dispatch_outbox --requeue-dead``. Consumers must tolerate
+duplicates (the ``id`` of an event identifies it), and a retried event can arrive after later ones.
+On Postgres batches are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED``, so several dispatchers
+can run side by side.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from queue import Empty, Full, Queue
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.users.models import OutboxEvent
+
+
+logger = logging.getLogger(__name__)
+
+USER_SIGNED_UP = 'user.signed_up'
+FRIEND_REQUEST_SENT = 'friend_request.sent'
+FRIEND_REQUEST_ACCEPTED = 'friend_request.accepted'
+FRIEND_REQUEST_REJECTED = 'friend_request.rejected'
+
+handlers = defaultdict(list)
+
+
+def handler(topic):
+    """
+        Register the decorated function with `HandlerSink`. It is called with a list of the
+        `OutboxEvent` rows of `topic` in a batch.
+    """
+
+    def register(func):
+        handlers[topic].append(func)
+        return func
+
+    return register
+
+
+def publish(topic, *payloads):
+    """
+        Write one event per payload. Must run inside the transaction that makes the change.
+    """
+    if not connection.in_atomic_block:
+        raise transaction.TransactionManagementError('publish() must be called inside a transaction.')
+    OutboxEvent.objects.bulk_create([OutboxEvent(topic=topic, payload=payload) for payload in payloads])
+
+
+def friend_request_payload(request_id, requested_user_id, request_received_user_id):
+    return {
+        'id': request_id,
+        'requested_user_id': requested_user_id,
+        'request_received_user_id': request_received_user_id,
+    }
+
+
+class HandlerSink:
+
+    def send(self, events):
+        by_topic = defaultdict(list)
+        for event in events:
+            by_topic[event.topic].append(event)
+        for topic, topic_events in by_topic.items():
+            for func in handlers[topic]:
+                func(topic_events)
+
+
+class LocalQueueSink:
+    """
+        Puts ``{"id", "topic", "payload", "created_date"}`` messages on `queue`. A full queue fails the
+        delivery, so the events wait in the outbox until a consumer catches up with `drain`.
+    """
+    queue = Queue(maxsize=settings.OUTBOX_LOCAL_QUEUE_SIZE)
+
+    @classmethod
+    def drain(cls, max_items=None):
+        """
+            Take up to `max_items` (default: all) messages off the queue, oldest first, without waiting.
+        """
+        messages = []
+        while max_items is None or len(messages) < max_items:
+            try:
+                messages.append(cls.queue.get_nowait())
+            except Empty:
+                break
+        return messages
+
+    def send(self, events):
+        if self.queue.maxsize and self.queue.qsize() + len(events) > self.queue.maxsize:
+            raise Full('local outbox queue is full')
+        for event in events:
+            self.queue.put_nowait({
+                'id': event.id,
+                'topic': event.topic,
+                'payload': event.payload,
+                'created_date': event.created_date.isoformat(),
+            })
+
+
+def get_sinks():
+    return [import_string(path)() for path in settings.OUTBOX_SINKS]
+
+
+def sink_name(sink):
+    return '%s.%s' % (type(sink).__module__, type(sink).__qualname__)
+
+
+def deliver(sink, events):
+    """
+        Send `events` to `sink` in a savepoint; returns the error, or None.
+    """
+    try:
+        with transaction.atomic():
+            sink.send(events)
+    except Exception as exc:
+        logger.exception('Delivering %d outbox events to %s failed', len(events), type(sink).__name__)
+        return exc
+    return None
+
+
+def retry_delay(attempts):
+    return min(settings.OUTBOX_RETRY_DELAY * 2 ** attempts, settings.OUTBOX_RETRY_MAX_DELAY)
+
+
+def dispatch(batch_size=None, sinks=None):
+    """
+        Deliver one batch of due events. Returns the number of events claimed; 0 means the outbox has
+        nothing due.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    sinks = get_sinks() if sinks is None else sinks
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(available_date__lte=now, dead_date__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        # {event: {sink name: error}} of the deliveries that failed.
+        failed = defaultdict(dict)
+        for sink in sinks:
+            name = sink_name(sink)
+            owed = [event for event in events if not event.pending_sinks or name in event.pending_sinks]
+            error = deliver(sink, owed) if owed else None
+            if error is not None and len(owed) == 1:
+                failed[owed[0]][name] = error
+            elif error is not None:
+                # One by one, so that a bad event does not hold back the rest of the batch.
+                for event in owed:
+                    error = deliver(sink, [event])
+                    if error is not None:
+                        failed[event][name] = error
+
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in events if event not in failed]).delete()
+        for event, errors in failed.items():
+            attempts = event.attempts + 1
+            dead = attempts >= settings.OUTBOX_MAX_ATTEMPTS
+            OutboxEvent.objects.filter(pk=event.pk).update(
+                attempts=attempts,
+                pending_sinks=sorted(errors),
+                last_error='; '.join('%s: %s' % (type(error).__name__, error) for error in errors.values()),
+                available_date=now + timedelta(seconds=retry_delay(event.attempts)),
+                dead_date=now if dead else None,
+            )
+            if dead:
+                logger.error('Outbox event %d (%s) dead-lettered after %d attempts', event.pk, event.topic, attempts)
+    return len(events)
+
+
+def requeue_dead():
+    """
+        Make the dead-lettered events due again, with a fresh attempt count. Returns how many.
+    """
+    return OutboxEvent.objects.filter(dead_date__isnull=False).update(
+        dead_date=None, attempts=0, available_date=timezone.now()
+    )
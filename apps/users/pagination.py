@@ -0,0 +1,202 @@
+import base64
+import bisect
+import binascii
+import json
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import models
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+        Cursor pagination over a unique ordering key such as ``('id',)`` or ``('created_date', 'id')``.
+
+        Each page is fetched with ``WHERE key > last_key ORDER BY key LIMIT page_size + 1``, so page N
+        costs the same as page 1. The cursor is an opaque, URL-safe token holding the key of the last
+        row of the previous page. No ``COUNT(*)`` is run unless the client passes ``?count=true``.
+
+        The ordering is taken from the queryset's ``order_by()`` when present, otherwise from
+        `ordering`. The last field must be unique for the ordering to be stable.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = tuple(ordering or self.get_queryset_ordering(queryset) or self.ordering)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def paginate_keys(self, keys, request, view=None):
+        """
+            Paginate a sorted sequence of unique integer ids held in memory, with the same cursors and
+            page sizes as `paginate_queryset`. The count is always known, so it is always included.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = ('id',)
+        self.count = len(keys)
+
+        position = self.decode_cursor(request, None)
+        start = 0 if position is None else bisect.bisect_right(keys, position[0])
+
+        page = list(keys[start:start + self.page_size])
+        self.has_next = start + self.page_size < len(keys)
+        self.next_position = page[-1:] if self.has_next else None
+        return page
+
+    @staticmethod
+    def get_queryset_ordering(queryset):
+        ordering = queryset.query.order_by
+        if ordering and all(isinstance(field, str) for field in ordering):
+            return ordering
+        return None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def keyset_filter(self, position):
+        """
+            Build ``(a > x) OR (a = x AND b > y) OR ...`` for the ordering fields, flipping the
+            comparison for descending fields.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = '%s__lt' % name if field.startswith('-') else '%s__gt' % name
+            condition |= equal & Q(**{lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_position(self, row):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            position.append(row[name] if isinstance(row, dict) else getattr(row, name))
+        return position
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset):
+        """
+            Decode the cursor of `request` into the key of the last row of the previous page, each value
+            converted to the type of its ordering field (`queryset` None means integer ids). A cursor that
+            does not decode or convert is answered with 404 rather than reaching the database.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        for index, field in enumerate(self.ordering):
+            model_field = self.get_ordering_field(queryset, field.lstrip('-'))
+            try:
+                values[index] = model_field.to_python(values[index])
+                model_field.run_validators(values[index])
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            # Some backends (SQLite) declare no integer ranges; no key is wider than a signed 64-bit integer.
+            if values[index] is None or isinstance(values[index], int) and not -2 ** 63 <= values[index] < 2 ** 63:
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    @staticmethod
+    def get_ordering_field(queryset, name):
+        """
+            The field whose `to_python` checks cursor values of `name`: a model field, or the output field
+            of an annotation such as ``rank``.
+        """
+        if queryset is None:
+            return models.BigIntegerField()
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise NotFound(KeysetPagination.invalid_cursor_message)
+        # The range validators of a foreign key are those of the key it points to.
+        return field.target_field if field.is_relation else field
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_page_info(self):
+        """
+            Pagination keys to merge into responses that keep their own envelope.
+        """
+        info = {'next': self.get_next_link()}
+        if self.count is not None:
+            info['count'] = self.count
+        return info
+
+    def get_paginated_response(self, data):
+        return Response(dict(self.get_page_info(), results=data))
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Include the total number of results.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
@@ -0,0 +1,191 @@
+"""
+SQL inspection: statement capture, N+1 detection, query budgets and the slow-query log.
+
+For a ``QUERY_LOG_SAMPLE_RATE`` fraction of requests, `PerformanceMiddleware` captures every statement
+with the code in ``apps/`` that ran it. After the response:
+
+    - statements of the same shape (same SQL once ``IN (...)`` lists are collapsed) that ran
+      ``QUERY_LOG_REPEAT_THRESHOLD`` or more times are logged as a possible N+1;
+    - if the request ran more statements than ``QUERY_BUDGETS[action]``, the full list is logged, or
+      `QueryBudgetExceeded` is raised when ``QUERY_BUDGET_RAISE`` is on (as under the test runner).
+
+Independently of sampling, every statement slower than ``SLOW_QUERY_THRESHOLD_MS`` is logged with its
+origin and, with ``SLOW_QUERY_EXPLAIN``, its EXPLAIN plan.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError
+
+
+logger = logging.getLogger(__name__)
+
+IN_LIST_RE = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+TRANSACTION_CONTROL = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+# Frames in these modules are part of the instrumentation, not the origin of a query.
+SKIPPED_MODULES = ('querylog.py', 'instrumentation.py')
+
+_current = ContextVar('query_log', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def get_shape(sql):
+    return IN_LIST_RE.sub('(%s, ...)', sql)
+
+
+def get_origin(depth=3):
+    """
+        Up to `depth` innermost frames of project code (under ``BASE_DIR/apps``) on the current stack,
+        as ``"apps/users/pagination.py:51 in paginate_queryset <- apps/users/views.py:531 in list_friends"``.
+    """
+    root = os.path.join(str(settings.BASE_DIR), 'apps') + os.sep
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < depth:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and not filename.endswith(SKIPPED_MODULES):
+            frames.append('%s:%d in %s' % (
+                os.path.relpath(filename, str(settings.BASE_DIR)), frame.f_lineno, frame.f_code.co_name,
+            ))
+        frame = frame.f_back
+    return ' <- '.join(frames) or None
+
+
+class QueryLog:
+    """
+        The statements run while the log is active (see `capture`).
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    def statements(self):
+        """
+            The captured queries without transaction control, which differs between tests and production.
+        """
+        return [query for query in self.queries if not query['sql'].lstrip().upper().startswith(TRANSACTION_CONTROL)]
+
+    def record(self, sql, params, many, duration, database):
+        self.queries.append({
+            'sql': sql,
+            'params': params,
+            'many': many,
+            'duration': duration,
+            'database': database,
+            'origin': get_origin(),
+        })
+
+    def repeated(self, threshold=None):
+        """
+            Groups of statements with the same shape, run at least `threshold` times.
+        """
+        threshold = threshold or settings.QUERY_LOG_REPEAT_THRESHOLD
+        groups = {}
+        for query in self.queries:
+            groups.setdefault((query['database'], get_shape(query['sql'])), []).append(query)
+        return [group for group in groups.values() if len(group) >= threshold]
+
+    def format(self):
+        return '\n'.join(
+            '  %.1f ms  %s  [%s]' % (query['duration'] * 1000, query['sql'], query['origin'])
+            for query in self.queries
+        )
+
+    def report(self, action):
+        for group in self.repeated():
+            logger.warning(
+                'Possible N+1 in %s: %d queries of the same shape from %s: %s',
+                action, len(group), group[0]['origin'], get_shape(group[0]['sql']),
+            )
+        budget = settings.QUERY_BUDGETS.get(action)
+        if budget is not None and len(self.statements()) > budget:
+            message = '%s ran %d queries, over its budget of %d:\n%s' % (
+                action, len(self.statements()), budget, self.format(),
+            )
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+@contextmanager
+def capture(query_log):
+    """
+        Record the statements run inside the block in `query_log` (nothing happens when it is None).
+    """
+    if query_log is None:
+        yield None
+        return
+    token = _current.set(query_log)
+    try:
+        yield query_log
+    finally:
+        _current.reset(token)
+
+
+def explain(connection, sql, params):
+    """
+        EXPLAIN `sql` on a cursor that bypasses the execute wrappers. Inside a transaction it runs in a
+        savepoint, so a failing EXPLAIN cannot abort the caller's transaction.
+    """
+    in_transaction = not connection.get_autocommit()
+    cursor = connection.create_cursor()
+    try:
+        if in_transaction:
+            cursor.execute('SAVEPOINT query_log_explain')
+        try:
+            cursor.execute('%s %s' % (connection.ops.explain_query_prefix(), sql), params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+        except DatabaseError as exc:
+            if in_transaction:
+                cursor.execute('ROLLBACK TO SAVEPOINT query_log_explain')
+            return 'EXPLAIN failed: %s' % exc
+        finally:
+            if in_transaction:
+                cursor.execute('RELEASE SAVEPOINT query_log_explain')
+    finally:
+        cursor.close()
+
+
+def log_slow_query(connection, sql, params, many, duration):
+    plan = None
+    if settings.SLOW_QUERY_EXPLAIN and not many and sql.lstrip()[:6].upper().startswith(EXPLAINABLE):
+        plan = explain(connection, sql, params)
+    logger.warning(
+        'Slow query (%.1f ms) on %s from %s: %s%s',
+        duration * 1000, connection.alias, get_origin(), sql, '\n' + plan if plan else '',
+    )
+
+
+def inspect_queries(execute, sql, params, many, context):
+    query_log = _current.get()
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if query_log is None and threshold is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - started
+    connection = context['connection']
+    if query_log is not None:
+        query_log.record(sql, params, many, duration, connection.alias)
+    if threshold is not None and duration * 1000 >= threshold:
+        log_slow_query(connection, sql, params, many, duration)
+    return result
+
+
+def install_query_inspector(sender, connection, **kwargs):
+    # Connected to connection_created in UsersConfig.ready().
+    if inspect_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(inspect_queries)
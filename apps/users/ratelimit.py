@@ -0,0 +1,219 @@
+"""
+Rate limiting for the users API.
+
+Limits are configured per action in ``RATE_LIMITS`` (``"<requests>/<period>"``, period one of
+``s``, ``m``, ``h``, ``d``) and enforced by the backend named in ``RATE_LIMIT_BACKEND``:
+
+    - `InMemoryRateLimiter`: exact sliding window kept per process, bounded to
+      ``RATE_LIMIT_MAX_KEYS`` keys with LRU eviction.
+    - `CacheRateLimiter`: sliding window counter stored in the Django cache, shared by every
+      worker that uses the same cache.
+
+Views either call `check_rate_limit` directly (when only some outcomes should count, as in
+`send_friend_request`) or use `ActionRateThrottle`, which limits every request to an action.
+A view that counted a hit and then did not perform the action hands it back with `release_rate_limit`.
+"""
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+PERIOD_NAMES = {1: 'a second', 60: 'a minute', 3600: 'an hour', 86400: 'a day'}
+
+
+class Rate(namedtuple('Rate', ['limit', 'period'])):
+
+    @classmethod
+    def parse(cls, rate):
+        limit, period = rate.split('/')
+        return cls(int(limit), PERIODS[period.strip()[0].lower()])
+
+    def describe(self):
+        return PERIOD_NAMES.get(self.period, '%d seconds' % self.period)
+
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'remaining', 'retry_after'])
+
+
+class BaseRateLimiter:
+    """
+        A backend records hits for ``(action, key)`` and answers whether the hit fits in `rate`.
+        Rejected hits are not recorded.
+    """
+
+    def hit(self, action, key, rate, now=None):
+        raise NotImplementedError('subclasses of BaseRateLimiter must provide a hit() method')
+
+    def release(self, action, key, rate):
+        raise NotImplementedError('subclasses of BaseRateLimiter must provide a release() method')
+
+    def reset(self):
+        raise NotImplementedError('subclasses of BaseRateLimiter must provide a reset() method')
+
+
+class InMemoryRateLimiter(BaseRateLimiter):
+    """
+        Sliding window log per key: the timestamps of the last `limit` accepted hits. Memory is
+        bounded by ``RATE_LIMIT_MAX_KEYS``; the least recently used key is evicted first.
+    """
+
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys or settings.RATE_LIMIT_MAX_KEYS
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, action, key, rate, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            window = self._windows.get((action, key))
+            if window is None or window.maxlen != rate.limit:
+                window = deque(maxlen=rate.limit)
+                self._windows[(action, key)] = window
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end((action, key))
+
+            while window and window[0] <= now - rate.period:
+                window.popleft()
+            if len(window) >= rate.limit:
+                return RateLimitResult(False, 0, window[0] + rate.period - now)
+            window.append(now)
+            return RateLimitResult(True, rate.limit - len(window), 0)
+
+    def release(self, action, key, rate):
+        with self._lock:
+            window = self._windows.get((action, key))
+            if window:
+                window.pop()
+
+    def reset(self):
+        with self._lock:
+            self._windows.clear()
+
+
+class CacheRateLimiter(BaseRateLimiter):
+    """
+        Sliding window counter on top of the Django cache (``RATE_LIMIT_CACHE`` alias). The count is
+        the current fixed window plus the previous window weighted by how much of it still overlaps
+        the sliding window. Increments use `cache.incr`, which is atomic on Redis and Memcached.
+        `reset` clears the whole cache alias, so point ``RATE_LIMIT_CACHE`` at a dedicated cache.
+    """
+
+    key_prefix = 'ratelimit'
+
+    def __init__(self, cache_alias=None):
+        self.cache = caches[cache_alias or getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+    def _key(self, action, key, rate, window):
+        return '%s:%s:%s:%d:%d' % (self.key_prefix, action, key, rate.period, window)
+
+    def hit(self, action, key, rate, now=None):
+        now = time.time() if now is None else now
+        window, elapsed = divmod(now, rate.period)
+        window = int(window)
+        current_key = self._key(action, key, rate, window)
+        previous_key = self._key(action, key, rate, window - 1)
+
+        # Count the hit first so concurrent workers never both squeeze into the last slot.
+        # Counters live for two periods so they can still serve as the previous window.
+        if self.cache.add(current_key, 1, timeout=rate.period * 2):
+            current = 1
+        else:
+            try:
+                current = self.cache.incr(current_key)
+            except ValueError:
+                self.cache.set(current_key, 1, timeout=rate.period * 2)
+                current = 1
+        previous = self.cache.get(previous_key, 0)
+        estimated = current + previous * (1 - elapsed / rate.period)
+
+        if estimated > rate.limit:
+            try:
+                self.cache.decr(current_key)
+            except ValueError:
+                pass
+            return RateLimitResult(False, 0, rate.period - elapsed)
+        return RateLimitResult(True, int(rate.limit - estimated), 0)
+
+    def release(self, action, key, rate):
+        # A hit counted at the very end of the previous window is taken from the current one instead.
+        current_key = self._key(action, key, rate, int(time.time() // rate.period))
+        try:
+            if self.cache.decr(current_key) < 0:
+                self.cache.incr(current_key)
+        except ValueError:
+            pass
+
+    def reset(self):
+        self.cache.clear()
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter():
+    return import_string(settings.RATE_LIMIT_BACKEND)()
+
+
+def get_rate(action):
+    rate = settings.RATE_LIMITS.get(action)
+    return Rate.parse(rate) if rate else None
+
+
+def check_rate_limit(action, key):
+    """
+        Record a hit for `key` on `action`. Returns a `RateLimitResult`; actions without a configured
+        limit are always allowed.
+    """
+    rate = get_rate(action)
+    if rate is None:
+        return RateLimitResult(True, None, 0)
+    return get_rate_limiter().hit(action, key, rate)
+
+
+def release_rate_limit(action, key, count=1):
+    """
+        Give back `count` hits recorded by `check_rate_limit` for actions that did not happen.
+    """
+    rate = get_rate(action)
+    if rate is None:
+        return
+    for _ in range(count):
+        get_rate_limiter().release(action, key, rate)
+
+
+def retry_after_header(result):
+    return {'Retry-After': '%d' % max(1, round(result.retry_after))}
+
+
+class ActionRateThrottle(BaseThrottle):
+    """
+        DRF throttle applying ``RATE_LIMITS[view.action]``. Authenticated requests are keyed by user id,
+        anonymous ones by client address. DRF turns a refusal into a 429 with ``Retry-After``.
+    """
+
+    def allow_request(self, request, view):
+        action = getattr(view, 'action', None)
+        if request.user and request.user.is_authenticated:
+            key = 'user:%s' % request.user.pk
+        else:
+            key = 'ip:%s' % self.get_ident(request)
+        self.result = check_rate_limit(action, key)
+        return self.result.allowed
+
+    def wait(self):
+        return self.result.retry_after
+
+
+@receiver(setting_changed)
+def _reset_rate_limiter(setting, **kwargs):
+    if setting in ('RATE_LIMIT_BACKEND', 'RATE_LIMIT_MAX_KEYS', 'RATE_LIMIT_CACHE'):
+        get_rate_limiter.cache_clear()
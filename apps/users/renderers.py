@@ -0,0 +1,61 @@
+import time
+
+from rest_framework import renderers
+
+from apps.users.instrumentation import get_current
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class TimedRendererMixin:
+    """
+        Add the render time of sampled requests to their serialization time. The browsable API
+        renders its embedded JSON through `JSONRenderer`, so only that one is timed.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        metrics = get_current()
+        if metrics is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics.serialize_time += time.perf_counter() - started
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+        Encode with ``orjson`` (pinned in requirements.txt) to the same bytes as DRF's encoder: compact,
+        UTF-8, with ``\\u2028``/``\\u2029`` escaped, and types orjson does not know (or whose format
+        differs, such as datetimes) handed to `encoder_class`. Indented output, ``UNICODE_JSON = False``,
+        data orjson rejects (non-string keys, integers over 64 bits) and installs without orjson fall
+        back to DRF. Floats are the exception: orjson writes exponents differently (``1e-5`` for ``1e-05``) and
+        NaN or infinity as null. No endpoint returns floats.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class JSONRenderer(TimedRendererMixin, FastJSONRenderer):
+    pass
@@ -0,0 +1,125 @@
+"""
+Read-replica routing for the read-only endpoints.
+
+Views wrapped in `read_from_replica` (user search and the friend lists) send their reads to one of the
+``DATABASE_REPLICAS`` aliases, picked once per request: ``DATABASE_REPLICA_SELECTION = 'round_robin'``
+cycles through them in proportion to their weights (smooth weighted round robin), ``'random'`` draws
+one with probability proportional to its weight. Everything else, including every write, uses
+``default``.
+
+Read-your-writes: `pin_to_primary` keeps a user's replica-routed reads on ``default`` for
+``DATABASE_REPLICA_STICKY_SECONDS``. Friend request writes pin every user whose lists they change
+(through `apps.users.cache.invalidate_lists`), so neither the user nor the list cache sees a replica
+that has not caught up yet. Pins live in the ``DATABASE_REPLICA_PIN_CACHE`` cache, which has to be
+shared by all workers for the pin to hold across them; `apps.users.cache.check_shared_caches` refuses
+a per-process cache when replicas are configured.
+"""
+import contextlib
+import random
+import threading
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+
+PIN_KEY = 'db:pin:%s'
+
+_replica = ContextVar('replica', default=None)
+
+
+class ReplicaSelector:
+    """
+        Smooth weighted round robin: every alias is picked `weight` times per cycle, interleaved.
+    """
+
+    def __init__(self):
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def choose(self, replicas):
+        if settings.DATABASE_REPLICA_SELECTION == 'random':
+            aliases = list(replicas)
+            return random.choices(aliases, weights=[replicas[alias] for alias in aliases])[0]
+        with self._lock:
+            total = sum(replicas.values())
+            for alias, weight in replicas.items():
+                self._current[alias] = self._current.get(alias, 0) + weight
+            chosen = max(replicas, key=lambda alias: self._current[alias])
+            self._current[chosen] -= total
+            return chosen
+
+
+selector = ReplicaSelector()
+
+
+def get_pin_cache():
+    return caches[settings.DATABASE_REPLICA_PIN_CACHE]
+
+
+def pin_to_primary(*user_ids):
+    """
+        Route the replica reads of `user_ids` to ``default`` for the next ``DATABASE_REPLICA_STICKY_SECONDS``.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if settings.DATABASE_REPLICAS and user_ids:
+        get_pin_cache().set_many(
+            {PIN_KEY % user_id: 1 for user_id in user_ids}, settings.DATABASE_REPLICA_STICKY_SECONDS
+        )
+
+
+def is_pinned(user_id):
+    return get_pin_cache().get(PIN_KEY % user_id) is not None
+
+
+@contextlib.contextmanager
+def use_replica(user=None):
+    """
+        Route reads inside the block to one replica, unless there are none or `user` is pinned to the
+        primary. Yields the chosen alias or None.
+    """
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or (user is not None and user.is_authenticated and is_pinned(user.pk)):
+        yield None
+        return
+    token = _replica.set(selector.choose(replicas))
+    try:
+        yield _replica.get()
+    finally:
+        _replica.reset(token)
+
+
+def read_from_replica(view_func):
+    """
+        Run a read-only view action under `use_replica` for the requesting user.
+    """
+
+    @wraps(view_func)
+    def wrapper(self, request, *args, **kwargs):
+        with use_replica(request.user):
+            return view_func(self, request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        # Without this, saving an instance read from a replica would write to that replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
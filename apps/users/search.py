@@ -0,0 +1,406 @@
+"""
+Search backends behind `UserView.user_search`.
+
+Name search supports three modes:
+
+    - ``contains``: case-insensitive substring match (the original behaviour).
+    - ``trigram``: fuzzy match ranked by trigram similarity.
+    - ``fulltext``: word match over name and email ranked by relevance.
+
+On Postgres the queries are served by the pg_trgm and full-text GIN indexes created in
+``0002_user_search_indexes``. Other databases (SQLite for local and test runs) use an
+in-process inverted index that narrows the candidates before hitting the database.
+The backend can be swapped through the ``USER_SEARCH_BACKEND`` setting.
+
+Each process builds its own index, so the indexes share a generation number in the
+``USER_SEARCH_INDEX_CACHE`` cache. Every committed name or email change and every bulk load
+(`invalidate_search_indexes`) bumps it, and an index that has not seen the current generation is
+rebuilt before it answers. Writes that bypass both (``QuerySet.update``, raw SQL) must call
+`invalidate_search_indexes` themselves.
+"""
+import heapq
+import random
+import re
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Upper
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+CONTAINS = 'contains'
+TRIGRAM = 'trigram'
+FULLTEXT = 'fulltext'
+SEARCH_MODES = [CONTAINS, TRIGRAM, FULLTEXT]
+
+# Same default as pg_trgm's `pg_trgm.similarity_threshold`.
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+
+# Must stay identical to the expression indexed in 0002_user_search_indexes,
+# otherwise Postgres will not match the query to the index.
+FULLTEXT_VECTOR_SQL = "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(email, ''))"
+
+# Above this many substring candidates an id list costs more than letting the database scan.
+MAX_CONTAINS_CANDIDATES = 10000
+
+GENERATION_KEY = 'users:search:generation'
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def trigrams(value):
+    """
+        Return the set of trigrams of `value` the way pg_trgm builds them: lower-cased words,
+        each padded with two leading spaces and one trailing space.
+    """
+    grams = set()
+    for word in _WORD_RE.findall((value or '').lower()):
+        padded = '  %s ' % word
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def substring_trigrams(value):
+    """
+        Return the unpadded trigrams of `value`. Every string containing `value` also contains
+        all of these, which makes them usable as an index filter for substring search.
+    """
+    value = (value or '').lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def words(value):
+    return set(_WORD_RE.findall((value or '').lower()))
+
+
+def similarity(left, right):
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def get_generation():
+    cache = caches[settings.USER_SEARCH_INDEX_CACHE]
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # A random start keeps a recreated key from matching a generation some index has already seen.
+        cache.add(GENERATION_KEY, random.getrandbits(48), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """
+        Move every index to a new generation. Returns it, or None when the key had to be recreated.
+    """
+    try:
+        return caches[settings.USER_SEARCH_INDEX_CACHE].incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+        return None
+
+
+class BaseSearchBackend:
+    """
+        Interface of a user search backend. `search` receives the base user queryset and
+        returns it narrowed (and, for ranked modes, annotated with ``rank`` and ordered).
+    """
+
+    def search(self, queryset, name, mode=CONTAINS):
+        raise NotImplementedError('subclasses of BaseSearchBackend must provide a search() method')
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+        Plain ORM search without any index support. Only the ``contains`` mode is available.
+    """
+
+    def search(self, queryset, name, mode=CONTAINS):
+        return queryset.filter(name__icontains=name).order_by('id')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+        Search served by the pg_trgm GIN index on ``UPPER(name)`` and the GIN index on the
+        ``simple`` tsvector of name and email.
+    """
+
+    def search(self, queryset, name, mode=CONTAINS):
+        if mode == TRIGRAM:
+            from django.contrib.postgres.search import TrigramSimilarity
+
+            return (
+                queryset.annotate(name_upper=Upper('name'))
+                .filter(name_upper__trigram_similar=name.upper())
+                # Cast to float8 so a rank read back from a pagination cursor compares exactly.
+                .annotate(rank=Cast(TrigramSimilarity(Upper('name'), name.upper()), FloatField()))
+                .order_by('-rank', 'id')
+            )
+        if mode == FULLTEXT:
+            return (
+                queryset.annotate(
+                    rank=RawSQL(
+                        "ts_rank(%s, plainto_tsquery('simple', %%s))::float8" % FULLTEXT_VECTOR_SQL,
+                        (name,),
+                        output_field=FloatField(),
+                    )
+                )
+                .extra(where=["%s @@ plainto_tsquery('simple', %%s)" % FULLTEXT_VECTOR_SQL], params=[name])
+                .order_by('-rank', 'id')
+            )
+        # `icontains` renders as UPPER(name::text) LIKE UPPER(%s), which the trigram index covers.
+        return queryset.filter(name__icontains=name).order_by('id')
+
+
+class InMemoryIndex:
+    """
+        Process-local inverted index of user names and emails.
+
+        The index is only used to find candidate ids; rows are always re-read from the database,
+        so a stale entry can never leak a wrong result, but a missing one would hide a match. It is
+        loaded lazily, kept current by the `post_save`/`post_delete` handlers wired in
+        `UsersConfig.ready`, and rebuilt when the shared generation shows a change it has not seen.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._generation = None
+        self._docs = {}
+        self._substring_postings = {}
+        self._trigram_postings = {}
+        self._word_postings = {}
+
+    def clear(self):
+        with self._lock:
+            self._loaded = False
+            self._generation = None
+            self._docs = {}
+            self._substring_postings = {}
+            self._trigram_postings = {}
+            self._word_postings = {}
+
+    def _ensure_loaded(self):
+        generation = get_generation()
+        if self._loaded and self._generation == generation:
+            return
+        from apps.users.models import User
+
+        with self._lock:
+            if self._loaded and self._generation == generation:
+                return
+            self.clear()
+            # The generation is read before the rows, so a change made during the load triggers another one.
+            rows = User.objects.values_list('id', 'name', 'email').iterator(chunk_size=5000)
+            for user_id, name, email in rows:
+                self._add(user_id, name, email)
+            self._generation = generation
+            self._loaded = True
+
+    def _postings(self, doc):
+        name, email = doc
+        return (
+            (self._substring_postings, substring_trigrams(name)),
+            (self._trigram_postings, trigrams(name)),
+            (self._word_postings, words(name) | words(email)),
+        )
+
+    def _add(self, user_id, name, email):
+        doc = (name or '', email or '')
+        self._docs[user_id] = doc
+        for postings, keys in self._postings(doc):
+            for key in keys:
+                postings.setdefault(key, set()).add(user_id)
+
+    def _remove(self, user_id):
+        doc = self._docs.pop(user_id, None)
+        if doc is None:
+            return
+        for postings, keys in self._postings(doc):
+            for key in keys:
+                ids = postings.get(key)
+                if ids is not None:
+                    ids.discard(user_id)
+                    if not ids:
+                        del postings[key]
+
+    def update(self, user_id, name, email):
+        with self._lock:
+            if not self._loaded:
+                return
+            self._remove(user_id)
+            self._add(user_id, name, email)
+
+    def changed(self):
+        """
+            Publish a change this index already holds. The index keeps its contents unless another
+            process moved the generation in the meantime.
+        """
+        with self._lock:
+            generation = bump_generation()
+            if self._loaded and generation is not None and generation == self._generation + 1:
+                self._generation = generation
+
+    def remove(self, user_id):
+        with self._lock:
+            if self._loaded:
+                self._remove(user_id)
+
+    @staticmethod
+    def _intersect(postings, keys):
+        sets = sorted((postings.get(key, set()) for key in keys), key=len)
+        if not sets:
+            return set()
+        result = set(sets[0])
+        for ids in sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def documents(self, user_ids):
+        """
+            Yield ``(id, name, email)`` for the given ids as currently held in the index.
+        """
+        with self._lock:
+            docs = [(user_id, self._docs.get(user_id)) for user_id in user_ids]
+        for user_id, doc in docs:
+            if doc is not None:
+                yield (user_id,) + doc
+
+    def contains_candidates(self, value):
+        """
+            Return candidate ids for a substring search, or None when `value` is too short
+            to produce a trigram and the caller has to scan.
+        """
+        keys = substring_trigrams(value)
+        if not keys:
+            return None
+        self._ensure_loaded()
+        with self._lock:
+            return self._intersect(self._substring_postings, keys)
+
+    def trigram_candidates(self, value):
+        keys = trigrams(value)
+        self._ensure_loaded()
+        with self._lock:
+            candidates = set()
+            for key in keys:
+                candidates |= self._trigram_postings.get(key, set())
+            return candidates
+
+    def fulltext_candidates(self, value):
+        keys = words(value)
+        self._ensure_loaded()
+        with self._lock:
+            return self._intersect(self._word_postings, keys)
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+        Fallback for databases without trigram/full-text indexes. Candidates come from the
+        process-local `InMemoryIndex` and are re-checked against rows fetched from the database.
+        Ranked modes return at most ``USER_SEARCH_MAX_RESULTS`` rows.
+    """
+
+    index = InMemoryIndex()
+
+    def search(self, queryset, name, mode=CONTAINS):
+        if mode == TRIGRAM:
+            return self._ranked(queryset, name, self.index.trigram_candidates(name), self._trigram_score)
+        if mode == FULLTEXT:
+            return self._ranked(queryset, name, self.index.fulltext_candidates(name), self._fulltext_score)
+
+        candidates = self.index.contains_candidates(name)
+        if candidates is not None and len(candidates) <= MAX_CONTAINS_CANDIDATES:
+            queryset = queryset.filter(pk__in=candidates)
+        return queryset.filter(name__icontains=name).order_by('id')
+
+    @staticmethod
+    def _trigram_score(query, name, email):
+        score = similarity(trigrams(query), trigrams(name))
+        return score if score >= TRIGRAM_SIMILARITY_THRESHOLD else None
+
+    @staticmethod
+    def _fulltext_score(query, name, email):
+        terms = words(query)
+        document = list(_WORD_RE.findall(('%s %s' % (name or '', email or '')).lower()))
+        if not terms or not terms.issubset(document):
+            return None
+        hits = sum(1 for word in document if word in terms)
+        return hits / len(document)
+
+    def _ranked(self, queryset, query, candidates, score):
+        shortlist = []
+        for user_id, name, email in self.index.documents(candidates):
+            rank = score(query, name, email)
+            if rank is not None:
+                shortlist.append((-rank, user_id))
+        shortlist = heapq.nsmallest(settings.USER_SEARCH_MAX_RESULTS, shortlist)
+
+        scored = []
+        rows = queryset.filter(pk__in=[user_id for _, user_id in shortlist]).values_list('id', 'name', 'email')
+        for user_id, name, email in rows:
+            rank = score(query, name, email)
+            if rank is not None:
+                scored.append((rank, user_id))
+        if not scored:
+            return queryset.none().annotate(rank=Value(0.0, output_field=FloatField()))
+
+        return (
+            queryset.filter(pk__in=[user_id for _, user_id in scored])
+            .annotate(
+                rank=Case(
+                    *[When(pk=user_id, then=Value(rank)) for rank, user_id in scored],
+                    output_field=FloatField(),
+                )
+            )
+            .order_by('-rank', 'id')
+        )
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+        Return the configured search backend instance. Without ``USER_SEARCH_BACKEND`` the
+        backend is picked from the database vendor.
+    """
+    path = settings.USER_SEARCH_BACKEND
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return InMemorySearchBackend()
+
+
+@receiver(setting_changed)
+def _reset_search_backend(setting, **kwargs):
+    if setting == 'USER_SEARCH_BACKEND':
+        get_search_backend.cache_clear()
+
+
+def invalidate_search_indexes():
+    """
+        Make every process rebuild its in-memory index on its next search. Call after writing
+        users without `post_save` (bulk loads, ``QuerySet.update``).
+    """
+    InMemorySearchBackend.index.clear()
+    bump_generation()
+
+
+def update_search_index(sender, instance, created=False, update_fields=None, **kwargs):
+    InMemorySearchBackend.index.update(instance.pk, instance.name, instance.email)
+    # Saves that cannot change the indexed fields, such as the last_login update, are not published.
+    if created or update_fields is None or {'name', 'email'} & set(update_fields):
+        transaction.on_commit(InMemorySearchBackend.index.changed)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    InMemorySearchBackend.index.remove(instance.pk)
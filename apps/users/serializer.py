@@ -1,10 +1,16 @@
-from django.contrib.auth.hashers import make_password
+from datetime import timedelta
+
+from django.conf import settings
 from django.core.validators import EmailValidator
+from django.utils import timezone
 
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.tokens import RefreshToken
+from apps.users.hashers import check_user_password, hash_password
 from apps.users.models import User, FriendRequest
+from apps.users.search import CONTAINS, SEARCH_MODES
 
 
 class UserSignupSerializer(serializers.ModelSerializer):
@@ -20,7 +26,7 @@ class UserSignupSerializer(serializers.ModelSerializer):
         extra_kwargs = {"password": {"write_only": True}}
 
     def create(self, validated_data):
-        validated_data["password"] = make_password(validated_data["password"])
+        validated_data["password"] = hash_password(validated_data["password"])
         return super(UserSignupSerializer, self).create(validated_data)
 
 
@@ -64,7 +70,7 @@ class LoginSerializer(serializers.Serializer):
                     {"status": False, "message": "User not registered."}
                 )
 
-            if user.password and user.check_password(password):
+            if user.password and check_user_password(user, password):
                 refresh = self.get_token(user)
                 access = str(refresh.access_token)
                 refresh = str(refresh)
@@ -86,6 +92,7 @@ class LoginSerializer(serializers.Serializer):
 class UserSearchSerializer(serializers.Serializer):
     email = serializers.EmailField(required=False, allow_blank=True)
     name = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    mode = serializers.ChoiceField(choices=SEARCH_MODES, required=False, default=CONTAINS)
 
     def validate(self, attrs):
         email = attrs.get("email")
@@ -99,9 +106,170 @@ class UserSearchSerializer(serializers.Serializer):
         return attrs
 
 
+class BulkSendFriendRequestSerializer(serializers.Serializer):
+    request_received_user_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.BULK_FRIEND_REQUEST_MAX_ITEMS,
+    )
+
+
+class BulkFriendRequestActionSerializer(serializers.Serializer):
+    request_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.BULK_FRIEND_REQUEST_MAX_ITEMS,
+    )
+
+
+class MutualFriendsSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+
+
+class ConnectionSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    max_depth = serializers.IntegerField(
+        min_value=1, max_value=settings.GRAPH_MAX_DEPTH, default=settings.GRAPH_MAX_DEPTH
+    )
+
+
 class FriendRequestSerializer(serializers.ModelSerializer):
     request_received_user = UserDisplaySerializer(read_only=True)
 
     class Meta:
         model = FriendRequest
         fields = ["id", "created_date", "request_received_user"]
+
+
+class DateTimeFormat:
+    """
+        Format like ``DateTimeField().to_representation``. `bind()` looks the current time zone up once
+        per response (the lookup costs more than the formatting) and skips the conversion for values
+        already in that zone, pytz's ``astimezone`` being most of the field's cost.
+    """
+    field = serializers.DateTimeField()
+
+    def __call__(self, value):
+        return self.bind()(value)
+
+    def bind(self):
+        to_representation = self.field.to_representation
+        if api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+            return to_representation
+        current = timezone.get_current_timezone()
+        zero = timedelta(0)
+
+        def format_datetime(value):
+            if value.tzinfo is not current and not (current is timezone.utc and value.utcoffset() == zero):
+                return to_representation(value)
+            value = value.isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+        return format_datetime
+
+
+class RowSerializer:
+    """
+        Read-only stand-in for a ModelSerializer on the list endpoints: the same output, without DRF's
+        field-by-field machinery for every row.
+
+        `fields` lists the output keys in order; ``(key, OtherRowSerializer)`` nests another one. A row is
+        either a tuple from ``values_list()`` (plain or ``named=True``) holding the columns in `fields`
+        order, a nested serializer's columns inline and any extra columns last, or an object read by
+        attribute (``__slots__`` rows, model instances). `formats` maps a key to a function applied to its
+        non-null values, as the matching DRF field would; one with a ``bind()`` method is bound once per
+        call.
+    """
+    fields = ()
+    formats = {}
+
+    def __init__(self, instance=None, many=False):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def columns(cls, prefix=""):
+        """
+            The ``values_list()`` names to select for tuple rows, e.g. ``request_received_user__email``.
+        """
+        names = []
+        for field in cls.fields:
+            if isinstance(field, tuple):
+                names += field[1].columns(prefix + field[0] + "__")
+            else:
+                names.append(prefix + field)
+        return names
+
+    @classmethod
+    def bind(cls):
+        """
+            Return ``(key, nested plan, format)`` for each field, or the keys alone when no field is nested
+            or formatted (tuples then map straight onto them).
+        """
+        plan = []
+        for field in cls.fields:
+            if isinstance(field, tuple):
+                plan.append((field[0], field[1].bind(), None))
+            else:
+                format = cls.formats.get(field)
+                plan.append((field, None, format.bind() if hasattr(format, "bind") else format))
+        if not any(nested or format for _, nested, format in plan):
+            return tuple(cls.fields)
+        return plan
+
+    @classmethod
+    def to_representation(cls, row, plan=None):
+        if plan is None:
+            plan = cls.bind()
+        if isinstance(row, tuple):
+            return from_tuple(plan, row, 0)[0]
+        return from_object(plan, row)
+
+    @property
+    def data(self):
+        plan = self.bind()
+        if self.many:
+            return [self.to_representation(row, plan) for row in self.instance]
+        return self.to_representation(self.instance, plan)
+
+
+def from_tuple(plan, row, index):
+    if isinstance(plan, tuple):
+        return dict(zip(plan, row[index:] if index else row)), index + len(plan)
+    data = {}
+    for key, nested, format in plan:
+        if nested:
+            data[key], index = from_tuple(nested, row, index)
+        else:
+            value = row[index]
+            index += 1
+            data[key] = value if format is None or value is None else format(value)
+    return data, index
+
+
+def from_object(plan, row):
+    if isinstance(plan, tuple):
+        return {key: getattr(row, key) for key in plan}
+    data = {}
+    for key, nested, format in plan:
+        value = getattr(row, key)
+        if value is not None:
+            if nested:
+                value = from_object(nested, value)
+            elif format is not None:
+                value = format(value)
+        data[key] = value
+    return data
+
+
+class UserRowSerializer(RowSerializer):
+    fields = ("id", "email", "name")
+
+
+class FriendRequestRowSerializer(RowSerializer):
+    fields = ("id", "created_date", ("request_received_user", UserRowSerializer))
+    formats = {"created_date": DateTimeFormat()}
+
+
+class FriendSuggestionRowSerializer(RowSerializer):
+    fields = ("id", "email", "name", "mutual_friends")
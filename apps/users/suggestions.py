@@ -0,0 +1,165 @@
+"""
+Friend-of-friend suggestions ("people you may know").
+
+`FriendSuggestion` holds, per user, the top ``FRIEND_SUGGESTIONS_MAX`` non-friends by mutual friend
+count, so the suggestions endpoint is a single range read of ``friendsugg_rank_idx``.
+
+The table is kept current incrementally: when users A and B become friends, A is a new mutual friend
+of B and every friend F of A (and the other way round), so `record_friendships` recomputes exactly
+those (F, B) and (B, F) pairs, writes them, removes A and B from each other's suggestions and trims
+every touched user back to the top K. It runs a fixed number of queries however many friendships it
+records. Friends of a user with more than ``FRIEND_SUGGESTIONS_MAX_FANOUT`` friends are not updated
+(that would touch every one of them on each accept); `rebuild` (``manage.py
+rebuild_friend_suggestions``) recomputes everything, including after friendships are loaded in bulk.
+
+Counts are always exact, but a candidate trimmed from a full list only comes back when its count
+changes again or on a rebuild, so a list can hold fewer than K rows until then.
+
+Concurrent accepts touching the same pair can leave its count off by one until the next update or
+rebuild; suggestions are derived data, so this is not worth serializing accepts for.
+"""
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+
+from apps.users.bulkload import batched
+from apps.users.models import Friendship, FriendSuggestion
+
+
+def get_neighbors(user_ids):
+    neighbors = defaultdict(set)
+    for user_id, friend_id in Friendship.objects.filter(user_id__in=user_ids).values_list('user_id', 'friend_id'):
+        neighbors[user_id].add(friend_id)
+    return neighbors
+
+
+def record_friendships(pairs):
+    """
+        Update the suggestions after the `Friendship` edges of `pairs` (``(user_id, friend_id)``) were
+        written. Call it in the same transaction.
+    """
+    pairs = {(a, b) for a, b in pairs if a != b}
+    if not pairs:
+        return
+    endpoints = {user_id for pair in pairs for user_id in pair}
+    neighbors = get_neighbors(endpoints)
+    fanout = settings.FRIEND_SUGGESTIONS_MAX_FANOUT
+
+    # (user, candidate) pairs with a new mutual friend: the friends of A gain B and B gains them.
+    # `sources` are the endpoints whose friends are updated.
+    affected = set()
+    sources = set()
+    for a, b in pairs:
+        for source, target in ((a, b), (b, a)):
+            if len(neighbors[source]) > fanout:
+                continue
+            sources.add(source)
+            for friend_id in neighbors[source]:
+                if friend_id != target and friend_id not in neighbors[target]:
+                    affected.add((friend_id, target))
+
+    # Friends of the affected users among the targets' friends, to count the mutual friends exactly.
+    user_friends = defaultdict(set)
+    if affected:
+        cross_edges = Friendship.objects.filter(
+            user_id__in=Friendship.objects.filter(user_id__in=sources).values('friend_id'),
+            friend_id__in=Friendship.objects.filter(user_id__in=endpoints).values('friend_id'),
+        ).values_list('user_id', 'friend_id')
+        for user_id, friend_id in cross_edges:
+            user_friends[user_id].add(friend_id)
+
+    rows = []
+    for user_id, candidate_id in affected:
+        mutual = len(user_friends[user_id] & neighbors[candidate_id])
+        rows.append(FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_friends=mutual))
+        rows.append(FriendSuggestion(user_id=candidate_id, candidate_id=user_id, mutual_friends=mutual))
+
+    # Every replaced row matches one of these conditions (a superset is fine: a friend of a target is
+    # never a suggestion for it).
+    stale = Q()
+    for a, b in pairs:
+        stale |= Q(user_id=a, candidate_id=b) | Q(user_id=b, candidate_id=a)
+    for source in sources:
+        friends = Friendship.objects.filter(user_id=source).values('friend_id')
+        for target in {b if a == source else a for a, b in pairs if source in (a, b)}:
+            stale |= Q(user_id__in=friends, candidate_id=target) | Q(user_id=target, candidate_id__in=friends)
+
+    with transaction.atomic():
+        FriendSuggestion.objects.filter(stale).delete()
+        FriendSuggestion.objects.bulk_create(rows, ignore_conflicts=True)
+        if rows:
+            trim(sources, endpoints)
+
+
+def trim(sources, endpoints):
+    """
+        Keep the top ``FRIEND_SUGGESTIONS_MAX`` rows of the `endpoints` and of every friend of `sources`.
+    """
+    quote = connection.ops.quote_name
+    table = quote(FriendSuggestion._meta.db_table)
+    friendship = quote(Friendship._meta.db_table)
+    sql = (
+        'DELETE FROM {table} WHERE {id} IN ('
+        'SELECT {id} FROM ('
+        'SELECT {id}, ROW_NUMBER() OVER (PARTITION BY {user} ORDER BY {mutual} DESC, {candidate}) AS suggestion_rank '
+        'FROM {table} WHERE {user} IN ({endpoints}) OR {user} IN ('
+        'SELECT {friend} FROM {friendship} WHERE {user} IN ({sources}))'
+        ') ranked WHERE suggestion_rank > %s)'
+    ).format(
+        table=table,
+        friendship=friendship,
+        id=quote('id'),
+        user=quote('user_id'),
+        friend=quote('friend_id'),
+        mutual=quote('mutual_friends'),
+        candidate=quote('candidate_id'),
+        endpoints=', '.join(['%s'] * len(endpoints)),
+        sources=', '.join(['%s'] * len(sources)) or 'NULL',
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*endpoints, *sources, settings.FRIEND_SUGGESTIONS_MAX])
+
+
+def top_candidates(user_id, counts, limit):
+    return heapq.nsmallest(limit, counts, key=lambda item: (-item[1], item[0]))
+
+
+def rebuild(user_ids=None, batch_size=500):
+    """
+        Recompute the suggestions of `user_ids` (default: every user with friends) from `Friendship`.
+        Returns the number of users processed.
+    """
+    if user_ids is None:
+        user_ids = (
+            Friendship.objects.order_by('user_id').values_list('user_id', flat=True).distinct().iterator()
+        )
+    limit = settings.FRIEND_SUGGESTIONS_MAX
+    processed = 0
+    for batch in batched(user_ids, batch_size):
+        neighbors = get_neighbors(batch)
+        # Friend-of-friend paths: user -> friend -> candidate, counted per (user, candidate).
+        paths = (
+            Friendship.objects.filter(user_id__in=batch)
+            .values('user_id', candidate_id=F('friend__friendships__friend_id'))
+            .annotate(mutual=Count('id'))
+            .order_by()
+        )
+        counts = defaultdict(list)
+        for row in paths.iterator():
+            user_id, candidate_id = row['user_id'], row['candidate_id']
+            if candidate_id is not None and candidate_id != user_id and candidate_id not in neighbors[user_id]:
+                counts[user_id].append((candidate_id, row['mutual']))
+
+        rows = [
+            FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_friends=mutual)
+            for user_id, candidates in counts.items()
+            for candidate_id, mutual in top_candidates(user_id, candidates, limit)
+        ]
+        with transaction.atomic():
+            FriendSuggestion.objects.filter(user_id__in=batch).delete()
+            FriendSuggestion.objects.bulk_create(rows, batch_size=5000)
+        processed += len(batch)
+    return processed
@@ -0,0 +1,18 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+        Inspect the queries of every request made by the tests and fail a test whose request goes over
+        the ``QUERY_BUDGETS`` of its action.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._query_budgets = override_settings(QUERY_LOG_SAMPLE_RATE=1, QUERY_BUDGET_RAISE=True)
+        self._query_budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._query_budgets.disable()
+        super().teardown_test_environment(**kwargs)
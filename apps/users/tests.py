@@ -1,3 +1,1756 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from queue import Queue
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from rest_framework import renderers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accuknox.asgi import ASGIHandler
+from accuknox.pooled_postgresql.pool import ConnectionPool, PoolTimeout
+from apps.users.authentication import token_cache, user_cache
+from apps.users.bulkload import load
+from apps.users.cache import check_shared_caches, get_cache as list_cache, get_list_version
+from apps.users.archive import archive, archivable
+from apps.users.counters import FIELDS as COUNTER_FIELDS, compute as compute_counts, reconcile
+from apps.users.export import ndjson
+from apps.users.graph import find_path, intersect, mutual_friend_ids
+from apps.users.hashers import hash_password, pool as hashing_pool, verify_password
+from apps.users.instrumentation import RequestMetrics, measure, registry, timing
+from apps.users.models import (
+    FriendRequest,
+    FriendRequestArchive,
+    FriendSuggestion,
+    Friendship,
+    OutboxEvent,
+    User,
+    UserCounter,
+)
+from apps.users.outbox import HandlerSink, LocalQueueSink, dispatch, handler, handlers, publish, sink_name
+from apps.users.querylog import QueryBudgetExceeded, QueryLog, capture, get_shape
+from apps.users.renderers import JSONRenderer
+from apps.users.ratelimit import CacheRateLimiter, InMemoryRateLimiter, Rate, get_rate_limiter
+from apps.users.routers import ReplicaRouter, ReplicaSelector, is_pinned, use_replica
+from apps.users.search import InMemorySearchBackend, PostgresSearchBackend, bump_generation, get_search_backend
+from apps.users.serializer import (
+    FriendRequestRowSerializer,
+    FriendRequestSerializer,
+    UserDisplaySerializer,
+    UserRowSerializer,
+)
+from apps.users.suggestions import rebuild, record_friendships
+
+
+class UserSearchTests(TestCase):
+
+    def setUp(self):
+        InMemorySearchBackend.index.clear()
+        get_rate_limiter().reset()
+        self.user = User.objects.create(email="owner@mail.com", username="owner")
+        self.alice = User.objects.create(email="alice@mail.com", username="alice", name="Alice Smith")
+        self.alicia = User.objects.create(email="alicia@mail.com", username="alicia", name="Alicia Keys")
+        self.bob = User.objects.create(email="bob@mail.com", username="bob", name="Bob Stone")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        response = self.client.post(reverse("user-search") + "?" + "&".join(
+            "%s=%s" % item for item in params.items()
+        ))
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_contains_search(self):
+        self.assertEqual(self.search(name="ALIC"), [self.alice.id, self.alicia.id])
+        self.assertEqual(self.search(name="ic"), [self.alice.id, self.alicia.id])
+
+    def test_contains_search_follows_renames(self):
+        self.search(name="alic")
+        self.bob.name = "Alice Cooper"
+        self.bob.save()
+        self.assertEqual(self.search(name="alice"), [self.alice.id, self.bob.id])
+
+    def test_trigram_search_is_ranked(self):
+        self.assertEqual(self.search(name="Alice+Smyth", mode="trigram"), [self.alice.id])
+
+    def test_fulltext_search_matches_name_and_email(self):
+        self.assertEqual(self.search(name="stone", mode="fulltext"), [self.bob.id])
+        self.assertEqual(self.search(name="alicia", mode="fulltext"), [self.alicia.id])
+
+    def test_email_search(self):
+        self.assertEqual(self.search(email="BOB@mail.com"), [self.bob.id])
+
+    def test_bulk_loaded_users_are_found(self):
+        self.search(name="alic")
+        load(User, [User(email="cooper@mail.com", username="cooper", name="Alice Cooper")])
+        cooper = User.objects.get(username="cooper")
+        self.assertEqual(self.search(name="alice"), [self.alice.id, cooper.id])
+
+    def test_changes_from_other_processes_are_found(self):
+        self.search(name="alic")
+        User.objects.filter(pk=self.bob.id).update(name="Alice Cooper")
+        # What another worker does once its rename commits.
+        bump_generation()
+        self.assertEqual(self.search(name="alice"), [self.alice.id, self.bob.id])
+        self.assertEqual(self.search(name="alice+cooper", mode="fulltext"), [self.bob.id])
+
+
+@override_settings(USER_SEARCH_BACKEND="apps.users.search.PostgresSearchBackend")
+class PostgresSearchBackendTests(UserSearchTests):
+    # Inherits the API tests; the contains and email searches run on every database.
+
+    def test_backend_is_selected(self):
+        self.assertIsInstance(get_search_backend(), PostgresSearchBackend)
+
+    @skipUnless(connection.vendor == "postgresql", "pg_trgm similarity needs PostgreSQL")
+    def test_trigram_search_is_ranked(self):
+        super().test_trigram_search_is_ranked()
+
+    @skipUnless(connection.vendor == "postgresql", "full-text search needs PostgreSQL")
+    def test_fulltext_search_matches_name_and_email(self):
+        super().test_fulltext_search_matches_name_and_email()
+
+    @skipUnless(connection.vendor == "postgresql", "full-text search needs PostgreSQL")
+    def test_changes_from_other_processes_are_found(self):
+        super().test_changes_from_other_processes_are_found()
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        list_cache().clear()
+        InMemorySearchBackend.index.clear()
+        get_rate_limiter().reset()
+        self.user = User.objects.create(email="owner@mail.com", username="owner")
+        self.others = [
+            User.objects.create(email="friend%d@mail.com" % i, username="friend%d" % i, name="Friend %d" % i)
+            for i in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url, key):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url) if key == "data" else self.client.post(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row["id"] for row in response.data[key]]
+            url, pages = response.data["next"], pages + 1
+        return ids, pages
+
+    def test_user_search_walks_all_pages(self):
+        ids, pages = self.collect(reverse("user-search") + "?name=friend&page_size=2", "results")
+        self.assertEqual(ids, [user.id for user in self.others])
+        self.assertEqual(pages, 3)
+
+    def test_ranked_search_walks_all_pages(self):
+        ids, _ = self.collect(reverse("user-search") + "?name=friend&mode=fulltext&page_size=2", "results")
+        self.assertEqual(ids, [user.id for user in self.others])
+
+    def test_count_only_when_requested(self):
+        url = reverse("user-search") + "?name=friend&page_size=2"
+        self.assertNotIn("count", self.client.post(url).data)
+        self.assertEqual(self.client.post(url + "&count=true").data["count"], 5)
+
+    def test_list_friends_and_pending_are_paginated(self):
+        for other in self.others[:3]:
+            Friendship.add(self.user.id, other.id)
+        for other in self.others[3:]:
+            FriendRequest.objects.create(requested_user=self.user, request_received_user=other)
+
+        ids, pages = self.collect(reverse("list-friends") + "?page_size=2", "data")
+        self.assertEqual(ids, [user.id for user in self.others[:3]])
+        self.assertEqual(pages, 2)
+
+        response = self.client.get(reverse("list-pending-requests") + "?page_size=1")
+        self.assertEqual(len(response.data["data"]), 1)
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.data["data"][0]["request_received_user"]["id"], self.others[4].id)
+        self.assertIsNone(response.data["next"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("list-friends") + "?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_forged_cursors_are_rejected(self):
+        Friendship.add(self.user.id, self.others[0].id)
+        FriendRequest.objects.create(requested_user=self.user, request_received_user=self.others[1])
+
+        def cursor(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+        for url, values in [
+            (reverse("list-friends"), ["abc"]),
+            (reverse("list-friends"), [[1]]),
+            (reverse("list-friends"), [None]),
+            (reverse("list-friends"), [2 ** 80]),
+            (reverse("list-pending-requests"), [5, 1]),
+            (reverse("list-pending-requests"), ["2020-13-45T00:00:00", 1]),
+            (reverse("list-pending-requests"), ["2020-01-01T00:00:00+00:00", "x"]),
+            (reverse("friend-suggestions"), ["many", 1]),
+        ]:
+            response = self.client.get(url, {"cursor": cursor(values)})
+            self.assertEqual(response.status_code, 404, (url, values))
+
+        url = reverse("user-search") + "?name=friend&mode=fulltext&cursor=%s"
+        self.assertEqual(self.client.post(url % cursor(["high", self.others[0].id])).status_code, 404)
+        self.assertEqual(self.client.post(url % cursor([0.5, self.others[0].id])).status_code, 200)
+        self.assertEqual(self.client.get(reverse("list-friends"), {"cursor": cursor([0])}).status_code, 200)
+
+
+class FriendListQueryCountTests(TestCase):
+    """
+        Query budgets for the list endpoints. The count must not depend on the number of friends.
+    """
+
+    LIST_FRIENDS_QUERIES = 1
+    LIST_PENDING_QUERIES = 1
+
+    def setUp(self):
+        list_cache().clear()
+        self.user = User.objects.create(email="owner@mail.com", username="owner")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_requests(self, count, status):
+        offset = User.objects.count()
+        for i in range(offset, offset + count):
+            other = User.objects.create(email="user%d@mail.com" % i, username="user%d" % i, name="User %d" % i)
+            FriendRequest.objects.create(requested_user=self.user, request_received_user=other, status=status)
+            if status == 2:
+                Friendship.add(self.user.id, other.id)
+
+    def assert_constant_queries(self, url, status, budget):
+        for count in (1, 9):
+            self.add_requests(count, status)
+            list_cache().clear()
+            with self.assertNumQueries(budget):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_list_friends(self):
+        self.assert_constant_queries(reverse("list-friends"), 2, self.LIST_FRIENDS_QUERIES)
+
+    def test_list_pending_friends_request(self):
+        self.assert_constant_queries(reverse("list-pending-requests"), 1, self.LIST_PENDING_QUERIES)
+
+    def test_list_friends_payload(self):
+        self.add_requests(2, 2)
+        response = self.client.get(reverse("list-friends"))
+        friend = User.objects.get(username="user1")
+        self.assertEqual(response.data["data"][0], {"id": friend.id, "email": friend.email, "name": friend.name})
+
+
+class FriendshipTests(TestCase):
+
+    def setUp(self):
+        list_cache().clear()
+        self.alice = User.objects.create(email="alice@mail.com", username="alice")
+        self.bob = User.objects.create(email="bob@mail.com", username="bob")
+        self.client = APIClient()
+
+    def test_accept_creates_symmetric_friendship(self):
+        friend_request = FriendRequest.objects.create(requested_user=self.alice, request_received_user=self.bob)
+        self.client.force_authenticate(self.alice)
+        response = self.client.post(reverse("accept-friend-request"), {"request_id": friend_request.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(FriendRequest.check_already_friend(self.alice, self.bob))
+        self.assertTrue(FriendRequest.check_already_friend(self.bob, self.alice))
+
+        self.client.force_authenticate(self.bob)
+        response = self.client.get(reverse("list-friends"))
+        self.assertEqual([row["id"] for row in response.data["data"]], [self.alice.id])
+
+    def test_backfill_command(self):
+        FriendRequest.objects.create(requested_user=self.alice, request_received_user=self.bob, status=2)
+        call_command("backfill_friendships", stdout=StringIO())
+        call_command("backfill_friendships", stdout=StringIO())
+        self.assertEqual(Friendship.objects.count(), 2)
+        self.assertTrue(Friendship.are_friends(self.bob, self.alice))
+
+
+class FriendRequestIndexTests(TestCase):
+    """
+        EXPLAIN the hot FriendRequest queries on a few thousand rows and check the planner picks
+        the composite/partial indexes from 0004_friendrequest_indexes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            [User(email="user%d@mail.com" % i, username="user%d" % i) for i in range(60)]
+        )
+        users = list(User.objects.order_by("id"))
+        now = timezone.now()
+        FriendRequest.objects.bulk_create(
+            [
+                FriendRequest(
+                    requested_user=sender,
+                    request_received_user=receiver,
+                    status=(i + j) % 3 + 1,
+                    created_date=now - timedelta(minutes=i + j),
+                )
+                for i, sender in enumerate(users)
+                for j, receiver in enumerate(users)
+                if sender != receiver
+            ]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.sender, cls.receiver = users[0], users[1]
+
+    def assert_uses_index(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_rate_limit_query(self):
+        cutoff = timezone.now() - timedelta(minutes=1)
+        self.assert_uses_index(
+            FriendRequest.objects.filter(requested_user=self.sender, created_date__gte=cutoff),
+            "friendreq_sender_created_idx",
+        )
+
+    def test_pair_status_query(self):
+        self.assert_uses_index(
+            FriendRequest.objects.filter(
+                requested_user=self.sender, request_received_user=self.receiver, status=2
+            ),
+            "friendreq_pair_status_idx",
+        )
+
+    def test_pending_list_query(self):
+        self.assert_uses_index(
+            FriendRequest.objects.filter(requested_user=self.sender, status=1).order_by("created_date", "id"),
+            "friendreq_pending_idx",
+            "friendreq_pair_status_idx",
+        )
+
+    def test_only_one_pending_request_per_pair(self):
+        sender, receiver = User.objects.filter(username__in=["user0", "user2"]).order_by("id")
+        FriendRequest.objects.filter(requested_user=sender, request_received_user=receiver).delete()
+        FriendRequest.objects.create(requested_user=sender, request_received_user=receiver)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FriendRequest.objects.create(requested_user=sender, request_received_user=receiver)
+        FriendRequest.objects.create(requested_user=sender, request_received_user=receiver, status=3)
+
+
+class SendFriendRequestTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email="owner@mail.com", username="owner")
+        self.others = [User.objects.create(email="user%d@mail.com" % i, username="user%d" % i) for i in range(4)]
+        get_rate_limiter().reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, user_id):
+        return self.client.post("/api/send-friends-requests/", {"request_received_user_id": user_id})
+
+    def test_send_runs_one_select_two_inserts_and_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send(self.others[0].id)
+        self.assertEqual(response.status_code, 201)
+        statements = [
+            query["sql"].split()[0] for query in queries.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        # The friend request, its outbox event and the counters of both users.
+        self.assertEqual(statements, ["SELECT", "INSERT", "INSERT", "UPDATE"])
+
+    def test_duplicate_and_friend_checks(self):
+        self.assertEqual(self.send(self.others[0].id).status_code, 201)
+        self.assertEqual(self.send(self.others[0].id).data, {"message": "Already have pending request."})
+        Friendship.add(self.user.id, self.others[1].id)
+        self.assertEqual(self.send(self.others[1].id).data, {"message": "Already your friend."})
+
+    def test_validation(self):
+        self.assertEqual(self.send(self.user.id).status_code, 400)
+        self.assertEqual(self.send(0).status_code, 404)
+        self.assertEqual(self.send("abc").status_code, 404)
+
+    def test_send_losing_a_race_keeps_its_rate_limit_slot(self):
+        with mock.patch.object(FriendRequest.objects, "create", side_effect=IntegrityError):
+            for _ in range(3):
+                self.assertEqual(self.send(self.others[0].id).data, {"message": "Already have pending request."})
+        for other in self.others[:3]:
+            self.assertEqual(self.send(other.id).status_code, 201)
+
+    def test_rate_limit(self):
+        for other in self.others[:3]:
+            self.assertEqual(self.send(other.id).status_code, 201)
+        response = self.send(self.others[3].id)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+        self.assertEqual(
+            response.data, {"error": "You cannot send more than 3 friend requests within a minute."}
+        )
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    rate = Rate.parse("3/m")
+
+    def assert_sliding_window(self, limiter):
+        self.assertEqual([limiter.hit("send", 1, self.rate, now=t).allowed for t in (0, 10, 20, 30)],
+                         [True, True, True, False])
+        self.assertEqual(limiter.hit("send", 1, self.rate, now=30).retry_after, 30)
+        self.assertTrue(limiter.hit("send", 2, self.rate, now=30).allowed)
+        self.assertTrue(limiter.hit("send", 1, self.rate, now=130).allowed)
+
+    def test_in_memory_limiter(self):
+        self.assert_sliding_window(InMemoryRateLimiter())
+
+    def test_in_memory_limiter_is_bounded(self):
+        limiter = InMemoryRateLimiter(max_keys=2)
+        for key in range(3):
+            limiter.hit("send", key, self.rate, now=0)
+        self.assertEqual(list(limiter._windows), [("send", 1), ("send", 2)])
+
+    def test_cache_limiter(self):
+        limiter = CacheRateLimiter()
+        limiter.reset()
+        self.assert_sliding_window(limiter)
+
+    def test_release(self):
+        cache_limiter = CacheRateLimiter()
+        cache_limiter.reset()
+        clock = {"time.return_value": 1000.0, "monotonic.return_value": 1000.0}
+        for limiter in (InMemoryRateLimiter(), cache_limiter):
+            with mock.patch("apps.users.ratelimit.time", **clock):
+                for _ in range(3):
+                    limiter.hit("send", 1, self.rate)
+                limiter.release("send", 1, self.rate)
+                self.assertTrue(limiter.hit("send", 1, self.rate).allowed)
+                self.assertFalse(limiter.hit("send", 1, self.rate).allowed)
+
+    def test_parse(self):
+        self.assertEqual(Rate.parse("10/hour"), Rate(10, 3600))
+
+
+@override_settings(RATE_LIMITS={"login": "2/m"})
+class LoginThrottleTests(TestCase):
+
+    def test_login_is_throttled(self):
+        get_rate_limiter().reset()
+        client = APIClient()
+        for _ in range(2):
+            self.assertNotEqual(client.get(reverse("user-login")).status_code, 429)
+        response = client.get(reverse("user-login"))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        list_cache().clear()
+        token_cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create(email="owner@mail.com", username="owner", name="Owner")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer %s" % RefreshToken.for_user(self.user).access_token)
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(reverse("list-friends")).status_code, 200)
+        list_cache().clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse("list-friends")).status_code, 200)
+
+    def test_name_update_invalidates_cached_user(self):
+        self.client.get(reverse("list-friends"))
+        response = self.client.post(reverse("user-name-update"), {"name": "Renamed"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(user_cache.get(self.user.id))
+        self.assertEqual(User.objects.get(pk=self.user.id).name, "Renamed")
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(reverse("list-friends"))
+        user = User.objects.get(pk=self.user.id)
+        user.is_active = False
+        user.save()
+        self.assertIsNone(user_cache.get(self.user.id))
+        self.assertEqual(self.client.get(reverse("list-friends")).status_code, 401)
+
+    def test_update_is_seen_when_the_cached_user_expires(self):
+        self.client.get(reverse("list-friends"))
+        # QuerySet.update sends no signal, so the cached user stays valid until its TTL runs out.
+        User.objects.filter(pk=self.user.id).update(is_active=False)
+        list_cache().clear()
+        self.assertEqual(self.client.get(reverse("list-friends")).status_code, 200)
+
+        expired = time.monotonic() + settings.JWT_AUTH_CACHE_TTL
+        with mock.patch("apps.users.authentication.time.monotonic", return_value=expired):
+            self.assertEqual(self.client.get(reverse("list-friends")).status_code, 401)
+
+
+class PasswordHashingTests(TestCase):
+
+    def login(self, email, password):
+        return APIClient().generic(
+            "GET", reverse("user-login"), json.dumps({"email": email, "password": password}),
+            content_type="application/json",
+        )
+
+    def setUp(self):
+        get_rate_limiter().reset()
+
+    def test_signup_and_login(self):
+        response = self.client.post(reverse("user-signup"), {"email": "new@mail.com", "password": "s3cret-pass"})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(email="new@mail.com").password.startswith("pbkdf2_sha256$"))
+        self.assertEqual(self.login("new@mail.com", "s3cret-pass").status_code, 200)
+        self.assertEqual(self.login("new@mail.com", "wrong").status_code, 401)
+
+    def test_login_rehashes_outdated_hash(self):
+        with override_settings(PASSWORD_HASH_PBKDF2_ITERATIONS=1000):
+            User.objects.create(email="old@mail.com", password=hash_password("s3cret-pass"))
+        with override_settings(PASSWORD_HASH_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self.login("old@mail.com", "s3cret-pass").status_code, 200)
+        self.assertTrue(User.objects.get(email="old@mail.com").password.startswith("pbkdf2_sha256$2000$"))
+
+    @override_settings(PASSWORD_HASH_WORKERS=1)
+    def test_process_pool(self):
+        try:
+            encoded = hash_password("s3cret-pass")
+            self.assertEqual(verify_password("s3cret-pass", encoded), (True, False))
+            self.assertEqual(verify_password("wrong", encoded)[0], False)
+        finally:
+            hashing_pool.shutdown()
+
+
+class ListResponseCacheTests(TestCase):
+
+    def setUp(self):
+        list_cache().clear()
+        get_rate_limiter().reset()
+        self.alice = User.objects.create(email="alice@mail.com", username="alice", name="Alice")
+        self.bob = User.objects.create(email="bob@mail.com", username="bob", name="Bob")
+        self.carol = User.objects.create(email="carol@mail.com", username="carol", name="Carol")
+        Friendship.add(self.alice.id, self.bob.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_if_none_match_returns_304_without_queries(self):
+        response = self.client.get(reverse("list-friends"))
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("list-friends"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_accept_invalidates_both_users(self):
+        etag = self.client.get(reverse("list-friends"))["ETag"]
+        friend_request = FriendRequest.objects.create(requested_user=self.alice, request_received_user=self.carol)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("accept-friend-request"), {"request_id": friend_request.id})
+        response = self.client.get(reverse("list-friends"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.data["data"]], [self.bob.id, self.carol.id])
+
+    def test_send_invalidates_pending_list(self):
+        self.assertEqual(len(self.client.get(reverse("list-pending-requests")).data.get("data", [])), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/send-friends-requests/", {"request_received_user_id": self.carol.id})
+        self.assertEqual(len(self.client.get(reverse("list-pending-requests")).data["data"]), 1)
+
+    def test_friend_rename_invalidates_friend_list(self):
+        self.assertEqual(self.client.get(reverse("list-friends")).data["data"][0]["name"], "Bob")
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse("user-name-update"), {"name": "Robert"})
+        self.assertEqual(self.client.get(reverse("list-friends")).data["data"][0]["name"], "Robert")
+
+
+    def test_process_local_cache_is_refused_without_debug(self):
+        with override_settings(DEBUG=True):
+            check_shared_caches()
+        with override_settings(DEBUG=False), self.assertRaises(ImproperlyConfigured):
+            check_shared_caches()
+        memcached = {"default": {"BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache"}}
+        with override_settings(DEBUG=False, CACHES=memcached):
+            check_shared_caches()
+        with override_settings(DEBUG=True, DATABASE_REPLICAS={"replica_1": 1}), self.assertRaises(ImproperlyConfigured):
+            check_shared_caches()
+        with override_settings(DEBUG=True, DATABASE_REPLICAS={"replica_1": 1}, CACHES=memcached):
+            check_shared_caches()
+
+    def test_versions_expire(self):
+        with mock.patch.object(list_cache(), "add", wraps=list_cache().add) as add:
+            get_list_version(self.alice.id)
+        self.assertEqual(add.call_args.kwargs["timeout"], settings.USER_LIST_CACHE_TIMEOUT)
+
+class BulkFriendRequestTests(TestCase):
+
+    def setUp(self):
+        get_rate_limiter().reset()
+        list_cache().clear()
+        self.user = User.objects.create(email="owner@mail.com", username="owner")
+        self.others = [User.objects.create(email="user%d@mail.com" % i, username="user%d" % i) for i in range(6)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_send(self):
+        Friendship.add(self.user.id, self.others[0].id)
+        FriendRequest.objects.create(requested_user=self.user, request_received_user=self.others[1])
+        ids = [other.id for other in self.others] + [self.user.id, 0, self.others[2].id]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("send-friend-requests-bulk"), {"request_received_user_ids": ids}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["result"] for row in response.data["data"]],
+            ["already_friend", "already_pending", "sent", "sent", "sent", "rate_limited", "same_user", "not_found"],
+        )
+        statements = [
+            query["sql"].split()[0] for query in queries.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        # The requests, then their ids, outbox events and counters.
+        self.assertEqual(statements, ["SELECT", "INSERT", "SELECT", "INSERT", "UPDATE"])
+        self.assertEqual(FriendRequest.objects.filter(requested_user=self.user, status=1).count(), 4)
+        self.assertEqual(OutboxEvent.objects.filter(topic="friend_request.sent").count(), 3)
+
+    def test_request_sent_concurrently_is_reported_pending(self):
+        annotate_send_state = FriendRequest.annotate_send_state
+
+        def race(*args):
+            states = mock.Mock()
+            states.values.return_value = list(annotate_send_state(*args).values(
+                "id", "has_pending_request", "is_friend"
+            ))
+            # Another request for the same pair lands after the pair states were read.
+            FriendRequest.objects.create(requested_user=self.user, request_received_user=self.others[0])
+            return states
+
+        with mock.patch.object(FriendRequest, "annotate_send_state", side_effect=race):
+            response = self.client.post(
+                reverse("send-friend-requests-bulk"),
+                {"request_received_user_ids": [self.others[0].id, self.others[1].id]},
+                format="json",
+            )
+        self.assertEqual([row["result"] for row in response.data["data"]], ["already_pending", "sent"])
+        sent = FriendRequest.objects.get(requested_user=self.user, request_received_user=self.others[1])
+        self.assertEqual(
+            [event.payload["id"] for event in OutboxEvent.objects.filter(topic="friend_request.sent")], [sent.id]
+        )
+
+        # The skipped request gave its rate limit slot back.
+        response = self.client.post(
+            reverse("send-friend-requests-bulk"),
+            {"request_received_user_ids": [self.others[2].id, self.others[3].id]},
+            format="json",
+        )
+        self.assertEqual([row["result"] for row in response.data["data"]], ["sent", "sent"])
+
+    def test_bulk_accept_and_reject(self):
+        mine = [
+            FriendRequest.objects.create(requested_user=self.user, request_received_user=other)
+            for other in self.others[:3]
+        ]
+        theirs = FriendRequest.objects.create(requested_user=self.others[4], request_received_user=self.user)
+
+        response = self.client.post(
+            reverse("accept-friend-requests-bulk"),
+            {"request_ids": [mine[0].id, mine[1].id, theirs.id]},
+            format="json",
+        )
+        self.assertEqual([row["result"] for row in response.data["data"]], ["accepted", "accepted", "forbidden"])
+        self.assertTrue(Friendship.are_friends(self.others[1], self.user))
+
+        response = self.client.post(
+            reverse("reject-friend-requests-bulk"), {"request_ids": [mine[0].id, mine[2].id]}, format="json"
+        )
+        self.assertEqual([row["result"] for row in response.data["data"]], ["not_pending", "rejected"])
+        self.assertEqual(FriendRequest.objects.get(pk=mine[2].id).status, 3)
+
+    def test_validation(self):
+        response = self.client.post(reverse("accept-friend-requests-bulk"), {"request_ids": []}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # The async views query from the executor's own threads, so the data has to be committed.
+
+    def setUp(self):
+        get_rate_limiter().reset()
+        list_cache().clear()
+        self.alice = User.objects.create(email="alice@mail.com", username="alice", name="Alice Smith")
+        self.bob = User.objects.create(email="bob@mail.com", username="bob", name="Bob Stone")
+        # Django 3.2's AsyncClient takes raw header names.
+        self.auth = {"authorization": "Bearer %s" % RefreshToken.for_user(self.alice).access_token}
+
+    async def test_list_friends(self):
+        await sync_to_async(Friendship.add)(self.alice.id, self.bob.id)
+        response = await self.async_client.get(reverse("async-list-friends"), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        # Queries run on the executor thread are still attributed to the request.
+        self.assertNotIn('"0 queries"', response["Server-Timing"])
+        self.assertEqual([row["id"] for row in response.json()["data"]], [self.bob.id])
+
+    async def test_send_and_search(self):
+        response = await self.async_client.post(
+            reverse("async-send-friend-request"),
+            {"request_received_user_id": self.bob.id},
+            content_type="application/json",
+            **self.auth
+        )
+        self.assertEqual(response.status_code, 201)
+        response = await self.async_client.post(reverse("async-user-search") + "?name=stone", **self.auth)
+        self.assertEqual([row["id"] for row in response.json()["results"]], [self.bob.id])
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get(reverse("async-list-pending-requests"))
+        self.assertEqual(response.status_code, 401)
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = 0
+        self.in_transaction = False
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_INTRANS if self.in_transaction else TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def make_pool(self, **options):
+        options = dict({"max_size": 2, "timeout": 0.05, "max_idle": 60, "max_lifetime": 60, "check_after": 60}, **options)
+        return ConnectionPool(FakeConnection, **options)
+
+    def test_connections_are_reused(self):
+        pool = self.make_pool()
+        first = pool.acquire()
+        first.in_transaction = True
+        pool.release(first)
+        self.assertFalse(first.in_transaction)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.stats()["opened"], 1)
+        self.assertEqual(pool.stats()["checked_out"], 1)
+
+    def test_pool_is_bounded(self):
+        pool = self.make_pool(max_size=1)
+        connection = pool.acquire()
+        with self.assertRaises(PoolTimeout), self.assertLogs("accuknox.pooled_postgresql.pool", "WARNING"):
+            pool.acquire()
+
+        threading.Timer(0.01, pool.release, [connection]).start()
+        self.assertIs(pool.acquire(), connection)
+        stats = pool.stats()
+        self.assertEqual((stats["timeouts"], stats["waits"], stats["size"]), (1, 1, 1))
+
+    def test_broken_and_stale_connections_are_replaced(self):
+        pool = self.make_pool(max_idle=0)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertTrue(connection.closed)
+
+        pool = self.make_pool()
+        connection = pool.acquire()
+        connection.close()
+        pool.release(connection)
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, connection)
+        self.assertEqual(pool.stats()["size"], 1)
+
+        # A connection that is never returned frees its slot once it is garbage collected.
+        del replacement
+        self.assertEqual(pool.stats()["size"], 0)
+
+
+@override_settings(DATABASE_REPLICAS={"replica_1": 2, "replica_2": 1})
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        list_cache().clear()
+        self.alice = User.objects.create(email="alice@mail.com", username="alice")
+        self.bob = User.objects.create(email="bob@mail.com", username="bob")
+
+    def test_weighted_round_robin(self):
+        selector = ReplicaSelector()
+        choices = [selector.choose({"replica_1": 2, "replica_2": 1}) for _ in range(6)]
+        self.assertEqual(choices, ["replica_1", "replica_2", "replica_1"] * 2)
+
+    def test_only_replica_blocks_read_from_replicas(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(User))
+        with use_replica(self.alice) as alias:
+            self.assertIn(alias, ["replica_1", "replica_2"])
+            self.assertEqual(router.db_for_read(User), alias)
+            self.assertEqual(router.db_for_write(User), "default")
+        self.assertIsNone(router.db_for_read(User))
+        self.assertFalse(router.allow_migrate("replica_1", "users"))
+
+    def test_writes_pin_users_to_primary(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.post("/api/send-friends-requests/", {"request_received_user_id": self.bob.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(is_pinned(self.alice.id))
+        self.assertFalse(is_pinned(self.bob.id))
+
+        friend_request = FriendRequest.objects.get(requested_user=self.alice)
+        response = client.post(reverse("accept-friend-request"), {"request_id": friend_request.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_pinned(self.bob.id))
+        with use_replica(self.bob) as alias:
+            self.assertIsNone(alias)
+            self.assertIsNone(ReplicaRouter().db_for_read(User))
+
+    @override_settings(DATABASE_REPLICAS={"default": 1})
+    def test_read_only_endpoints_use_the_replica(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        with mock.patch.object(ReplicaRouter, "db_for_read", autospec=True, return_value="default") as db_for_read:
+            response = client.get(reverse("list-friends"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(db_for_read.called)
+
+
+@override_settings(PERFORMANCE_SAMPLE_RATE=1, PERFORMANCE_METRICS_TOKEN=None)
+class PerformanceInstrumentationTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        list_cache().clear()
+        self.alice = User.objects.create(email="alice@mail.com", username="alice")
+        self.bob = User.objects.create(email="bob@mail.com", username="bob")
+        Friendship.add(self.alice.id, self.bob.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_sampled_request_is_measured(self):
+        response = self.client.get(reverse("list-friends"))
+        self.assertRegex(response["Server-Timing"], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries", serialize;dur=')
+        self.assertEqual(registry.value("http_sampled_requests_total", action="list_friends"), 1)
+        self.assertEqual(registry.value("http_request_db_queries_total", action="list_friends"), 1)
+        self.assertEqual(registry.value("http_response_bytes_total", action="list_friends"), len(response.content))
+
+        with override_settings(DEBUG=True):
+            metrics = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('http_requests_total{action="list_friends",method="GET",status="200"} 1\n', metrics)
+        self.assertIn('http_request_duration_seconds_count{action="list_friends"} 1\n', metrics)
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_unsampled_request_is_only_counted(self):
+        response = self.client.get(reverse("list-friends"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(registry.value("http_requests_total", action="list_friends", method="GET", status="200"), 1)
+        self.assertEqual(registry.value("http_sampled_requests_total", action="list_friends"), 0)
+
+    def test_timing_hook(self):
+        metrics = RequestMetrics()
+        with measure(metrics), timing("search"):
+            pass
+        self.assertIn("search", metrics.sections)
+        self.assertIn("search;dur=", metrics.server_timing(0.01))
+
+    @override_settings(PERFORMANCE_METRICS_TOKEN="scrape")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape").status_code, 200)
+
+    def test_metrics_are_hidden_without_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+
+class QueryLogTests(TestCase):
+
+    def setUp(self):
+        list_cache().clear()
+        self.users = [User.objects.create(email="user%d@mail.com" % i, username="user%d" % i) for i in range(5)]
+
+    def test_repeated_queries_are_flagged_with_their_origin(self):
+        with capture(QueryLog()) as query_log:
+            for user in self.users:
+                User.objects.get(pk=user.pk)
+            list(User.objects.filter(pk__in=[user.pk for user in self.users]))
+
+        self.assertEqual(len(query_log), 6)
+        [group] = query_log.repeated(threshold=5)
+        self.assertEqual(len(group), 5)
+        self.assertRegex(group[0]["origin"], r"^apps/users/tests\.py:\d+ in test_repeated_queries")
+        self.assertEqual(get_shape("WHERE id IN (%s, %s, %s)"), get_shape("WHERE id IN (%s)"))
+
+    @override_settings(QUERY_LOG_SAMPLE_RATE=1, QUERY_BUDGET_RAISE=True, QUERY_BUDGETS={"list_friends": 0})
+    def test_query_budget(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        with self.assertRaisesRegex(QueryBudgetExceeded, "list_friends ran 1 queries, over its budget of 0"):
+            client.get(reverse("list-friends"))
+
+    def test_slow_queries_are_logged_with_their_plan(self):
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=0.000001), self.assertLogs("apps.users.querylog", "WARNING") as logs:
+            User.objects.filter(name="nobody").count()
+        self.assertIn("Slow query", logs.output[0])
+        self.assertIn("in test_slow_queries_are_logged_with_their_plan", logs.output[0])
+        self.assertIn("SCAN", logs.output[0])
+        # The EXPLAIN ran in a savepoint and left the test transaction usable.
+        self.assertEqual(User.objects.count(), 5)
+
+
+class SeedSocialGraphTests(TestCase):
+
+    def test_seeds_users_friendships_and_pending_requests(self):
+        User.objects.create(email="existing@mail.com", username="existing")
+        call_command("seed_social_graph", users=200, pending=2, batch_size=64, stdout=StringIO())
+
+        seeded = User.objects.exclude(email="existing@mail.com")
+        self.assertEqual(seeded.count(), 200)
+        user = seeded.order_by("id").first()
+        self.assertEqual(user.email, "user%d@bench.local" % user.pk)
+        self.assertTrue(verify_password("bench-password", user.password)[0])
+
+        edges = set(Friendship.objects.values_list("user_id", "friend_id"))
+        self.assertTrue(edges)
+        self.assertTrue(all((friend, user) in edges for user, friend in edges))
+        self.assertFalse(any(user == friend for user, friend in edges))
+        self.assertTrue(FriendRequest.objects.filter(status=1).exists())
+
+        # Sequences are reset, so regular inserts continue after the seeded ids.
+        self.assertGreater(User.objects.create(email="later@mail.com", username="later").pk, user.pk + 199)
+
+    def test_is_reproducible(self):
+        def graph():
+            call_command("seed_social_graph", users=100, stdout=StringIO())
+            first = User.objects.order_by("id").values_list("id", flat=True).first()
+            result = sorted(
+                (user - first, friend - first)
+                for user, friend in Friendship.objects.values_list("user_id", "friend_id")
+            )
+            Friendship.objects.all().delete()
+            FriendRequest.objects.all().delete()
+            User.objects.all().delete()
+            return result
+
+        self.assertEqual(graph(), graph())
+
+
+class ImportUsersTests(TestCase):
+
+    def write(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False)
+        handle.write(content)
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+    def import_users(self, *args, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("import_users", *args, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_imports_csv_with_hashed_passwords_and_skips_duplicates(self):
+        User.objects.create(email="taken@mail.com", username="taken")
+        hashed = hash_password("secret")
+        path = self.write(".csv", "\n".join([
+            "email,username,name,password",
+            "ann@mail.com,ann,Ann Lee,%s" % hashed,
+            "ann@mail.com,ann2,Ann Again,%s" % hashed,
+            "taken@mail.com,other,Taken,",
+            "new@mail.com,taken,Username Taken,",
+            "not-an-email,x,Bad,",
+            "bob@mail.com,,Bob,plaintext",
+            "cy@mail.com,,Cy,",
+        ]))
+
+        stdout, stderr = self.import_users(path, batch_size=3)
+
+        self.assertEqual(
+            set(User.objects.values_list("email", flat=True)), {"taken@mail.com", "ann@mail.com", "cy@mail.com"}
+        )
+        ann = User.objects.get(email="ann@mail.com")
+        self.assertEqual((ann.username, ann.name), ("ann", "Ann Lee"))
+        self.assertTrue(verify_password("secret", ann.password)[0])
+        self.assertIn("2 imported, 3 duplicates, 2 invalid", stdout)
+        self.assertIn("rows/s", stdout)
+        self.assertIn("Line 6 skipped: invalid email", stderr)
+        self.assertIn("Line 7 skipped: password is not hashed", stderr)
+
+    def test_imports_jsonl_hashing_plain_passwords_and_friendships(self):
+        users = self.write(".jsonl", "\n".join([
+            json.dumps({"email": "ann@mail.com", "password": "secret"}),
+            json.dumps({"email": "bob@mail.com", "password": "secret"}),
+            "not json",
+        ]))
+        friendships = self.write(".csv", "\n".join([
+            "user_email,friend_email,created_date",
+            "ann@mail.com,bob@mail.com,2020-01-02T03:04:05Z",
+            "ann@mail.com,nobody@mail.com,",
+            "ann@mail.com,ann@mail.com,",
+        ]))
+
+        self.import_users(users, friendships=friendships, hash_passwords=True)
+
+        ann, bob = User.objects.get(email="ann@mail.com"), User.objects.get(email="bob@mail.com")
+        self.assertTrue(verify_password("secret", ann.password)[0])
+        self.assertEqual(
+            set(Friendship.objects.values_list("user_id", "friend_id")), {(ann.pk, bob.pk), (bob.pk, ann.pk)}
+        )
+        self.assertEqual(Friendship.objects.get(user=ann).created_date.year, 2020)
+
+    def test_reports_only_the_rows_inserted(self):
+        ann = User.objects.create(email="ann@mail.com", username="ann")
+        bob = User.objects.create(email="bob@mail.com", username="bob")
+        User.objects.create(email="cy@mail.com", username="cy")
+        Friendship.add(ann.id, bob.id)
+        users = self.write(".csv", "email,username\nann@mail.com,ann\ndee@mail.com,dee\n")
+        friendships = self.write(".csv", "\n".join([
+            "user_email,friend_email",
+            "ann@mail.com,bob@mail.com",
+            "ann@mail.com,cy@mail.com",
+            "cy@mail.com,ann@mail.com",
+        ]))
+
+        # As if ann had been inserted by someone else between the lookup and the insert.
+        with mock.patch("apps.users.management.commands.import_users.existing", return_value=set()):
+            stdout, _ = self.import_users(users, friendships=friendships)
+
+        self.assertIn("Imported 1 users", stdout)
+        self.assertIn("1 imported, 1 duplicates", stdout)
+        self.assertIn("1 imported, 2 existing", stdout)
+        self.assertEqual(load(User, [User(email="ann@mail.com", username="ann")], ignore_conflicts=True), 0)
+
+    def test_load_counts_from_the_batch_keys(self):
+        ann = User.objects.create(email="ann@mail.com", username="ann")
+        bob = User.objects.create(email="bob@mail.com", username="bob")
+        FriendRequest.objects.create(requested_user=ann, request_received_user=bob)
+        FriendRequest.objects.create(requested_user=bob, request_received_user=ann, status=3)
+        requests = [
+            FriendRequest(requested_user=ann, request_received_user=bob),
+            FriendRequest(requested_user=bob, request_received_user=ann),
+            FriendRequest(requested_user=bob, request_received_user=ann),
+            FriendRequest(requested_user=bob, request_received_user=ann, status=3),
+        ]
+        # One lookup of the batch's pending pairs, then the insert, in a savepoint.
+        with self.assertNumQueries(4):
+            self.assertEqual(load(FriendRequest, requests, ignore_conflicts=True), 2)
+        self.assertEqual(FriendRequest.objects.filter(requested_user=bob, request_received_user=ann).count(), 3)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        get_rate_limiter().reset()
+        self.alice = User.objects.create(email="alice@mail.com", username="alice", name="Alice Smith")
+        self.bob = User.objects.create(email="bob@mail.com", username="bob", name="Bob Stone")
+        self.carol = User.objects.create(email="carol@mail.com", username="carol", name="Carol King")
+        FriendRequest.objects.create(requested_user=self.alice, request_received_user=self.bob, status=2)
+        Friendship.add(self.alice.id, self.bob.id)
+        self.pending = FriendRequest.objects.create(requested_user=self.alice, request_received_user=self.carol)
+        FriendRequest.objects.create(requested_user=self.carol, request_received_user=self.alice, status=3)
+        FriendRequest.objects.create(requested_user=self.bob, request_received_user=self.carol)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def records(self, content):
+        return [json.loads(line) for line in content.decode().splitlines()]
+
+    def test_streams_the_users_graph(self):
+        response = self.client.get(reverse("export-social-graph"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = self.records(b"".join(response.streaming_content))
+        self.assertEqual(records[0]["type"], "user")
+        self.assertEqual(records[0]["email"], "alice@mail.com")
+        self.assertEqual(
+            [(record["type"], record["id"]) for record in records[1:3]],
+            [("friend", self.bob.id), ("pending_request", self.pending.id)],
+        )
+        self.assertEqual(records[2]["request_received_user"]["email"], "carol@mail.com")
+        history = [record for record in records if record["type"] == "friend_request"]
+        self.assertEqual([record["status"] for record in history], ["Accepted", "Requested", "Rejected"])
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse("export-social-graph")).status_code, 401)
+
+    def test_command_exports_one_user_or_everything(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "export.ndjson")
+
+        call_command("export_social_graph", user="carol@mail.com", output=path, stdout=StringIO())
+        with open(path, "rb") as handle:
+            records = self.records(handle.read())
+        self.assertEqual([record["type"] for record in records], ["user"] + ["friend_request"] * 3)
+
+        call_command("export_social_graph", all=True, output=path, chunk_size=2, stdout=StringIO())
+        with open(path, "rb") as handle:
+            types = [record["type"] for record in self.records(handle.read())]
+        self.assertEqual((types.count("user"), types.count("friendship"), types.count("friend_request")), (3, 2, 4))
+
+    def test_ndjson_buffers_records(self):
+        chunks = list(ndjson(({"n": n} for n in range(100)), buffer_size=50))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(self.records(b"".join(chunks)), [{"n": n} for n in range(100)])
+
+
+class StreamingASGIHandlerTests(TransactionTestCase):
+    # The parts are produced on the handler's own thread, so the data has to be committed.
+
+    def test_streams_query_results_off_the_event_loop(self):
+        User.objects.create(email="alice@mail.com", username="alice")
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        def parts():
+            yield b"users:"
+            yield str(User.objects.count()).encode()
+
+        async_to_sync(ASGIHandler().send_response)(StreamingHttpResponse(parts()), send)
+
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(b"".join(message.get("body", b"") for message in messages[1:]), b"users:1")
+        self.assertFalse(messages[-1].get("more_body", False))
+
+
+class FriendSuggestionTests(TestCase):
+
+    def setUp(self):
+        get_rate_limiter().reset()
+        list_cache().clear()
+        self.users = [
+            User.objects.create(email="user%d@mail.com" % index, username="user%d" % index) for index in range(12)
+        ]
+
+    def befriend(self, *pairs):
+        for a, b in pairs:
+            Friendship.add(a.id, b.id)
+        record_friendships([(a.id, b.id) for a, b in pairs])
+
+    def table(self):
+        return set(FriendSuggestion.objects.values_list("user_id", "candidate_id", "mutual_friends"))
+
+    def test_incremental_updates_match_a_rebuild(self):
+        rng = random.Random(7)
+        ids = [user.id for user in self.users]
+        for _ in range(15):
+            pairs = {tuple(rng.sample(self.users, 2)) for _ in range(rng.randint(1, 3))}
+            self.befriend(*pairs)
+        incremental = self.table()
+
+        self.assertTrue(incremental)
+        self.assertEqual(rebuild(ids), len(ids))
+        self.assertEqual(incremental, self.table())
+
+    @override_settings(FRIEND_SUGGESTIONS_MAX=2)
+    def test_keeps_the_top_k_with_exact_counts(self):
+        hub, *others = self.users[:6]
+        self.befriend(*[(hub, other) for other in others])
+        self.befriend((others[0], self.users[6]), (others[1], self.users[6]))
+
+        rows = self.table()
+        for user in self.users:
+            self.assertLessEqual(len([row for row in rows if row[0] == user.id]), 2)
+        rebuild()
+        exact = {(user_id, candidate_id): mutual for user_id, candidate_id, mutual in self.table()}
+        self.assertTrue(all(exact.get((user_id, candidate_id)) == mutual for user_id, candidate_id, mutual in rows))
+        self.assertIn((hub.id, self.users[6].id, 2), rows)
+
+    @override_settings(FRIEND_SUGGESTIONS_MAX_FANOUT=1)
+    def test_skips_the_friends_of_users_over_the_fanout(self):
+        alice, bob, carol, dave = self.users[:4]
+        self.befriend((alice, bob), (alice, carol))
+        self.befriend((alice, dave))
+        # Alice has three friends, so Bob and Carol do not learn about Dave until a rebuild.
+        self.assertFalse(FriendSuggestion.objects.filter(user=bob, candidate=dave).exists())
+        call_command("rebuild_friend_suggestions", stdout=StringIO())
+        self.assertTrue(FriendSuggestion.objects.filter(user=bob, candidate=dave, mutual_friends=1).exists())
+
+    def test_accept_updates_the_suggestions_endpoint(self):
+        alice, bob, carol, dave = self.users[:4]
+        self.befriend((alice, bob), (alice, dave), (carol, dave))
+        friend_request = FriendRequest.objects.create(requested_user=carol, request_received_user=bob)
+        client = APIClient()
+        client.force_authenticate(carol)
+        response = client.post(reverse("accept-friend-request"), {"request_id": friend_request.id}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dispatch(), 1)
+
+        client.force_authenticate(alice)
+        response = client.get(reverse("friend-suggestions"))
+        self.assertEqual(
+            [(row["id"], row["mutual_friends"]) for row in response.json()["data"]], [(carol.id, 2)]
+        )
+        client.force_authenticate(carol)
+        with self.assertNumQueries(1):
+            response = client.get(reverse("friend-suggestions") + "?page_size=1")
+        self.assertEqual([row["id"] for row in response.json()["data"]], [alice.id])
+        self.assertIsNone(response.json()["next"])
+
+    def test_bulk_accept_records_every_friendship(self):
+        alice, bob, carol = self.users[:3]
+        self.befriend((alice, bob))
+        request_ids = [
+            FriendRequest.objects.create(requested_user=carol, request_received_user=user).id for user in (alice, bob)
+        ]
+        client = APIClient()
+        client.force_authenticate(carol)
+        response = client.post(reverse("accept-friend-requests-bulk"), {"request_ids": request_ids}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dispatch(), 2)
+        self.assertFalse(FriendSuggestion.objects.filter(user__in=[alice, bob, carol]).exists())
+
+
+class FastSerializationTests(TestCase):
+    """
+        The row serializers and the renderer must produce the same bytes as DRF's serializers and encoder.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(email="owner@mail.com", username="owner")
+        names = [None, "Zoë \u2028 Ünal", "名前", 'quote " and \\ backslash']
+        for index, name in enumerate(names):
+            other = User.objects.create(email="user%d@mail.com" % index, username="user%d" % index, name=name)
+            FriendRequest.objects.create(requested_user=self.user, request_received_user=other)
+
+    def assert_same_bytes(self, expected, data):
+        self.assertEqual(renderers.JSONRenderer().render(expected), JSONRenderer().render(data))
+
+    def test_friend_request_rows_match_the_model_serializer(self):
+        queryset = FriendRequest.objects.order_by("id")
+        instances = queryset.select_related("request_received_user")
+        expected = FriendRequestSerializer(instances, many=True).data
+        columns = FriendRequestRowSerializer.columns()
+
+        self.assert_same_bytes(expected, FriendRequestRowSerializer(queryset.values_list(*columns), many=True).data)
+        rows = queryset.values_list(*columns, named=True)
+        self.assert_same_bytes(expected, FriendRequestRowSerializer(rows, many=True).data)
+        self.assert_same_bytes(expected, FriendRequestRowSerializer(instances, many=True).data)
+        with timezone.override("Asia/Kolkata"):
+            self.assert_same_bytes(
+                FriendRequestSerializer(instances, many=True).data, FriendRequestRowSerializer(rows, many=True).data
+            )
+
+    def test_user_rows_match_the_model_serializer(self):
+        queryset = User.objects.order_by("id")
+        expected = UserDisplaySerializer(queryset, many=True).data
+        # Extra columns (the search rank, say) come last and are left out.
+        rows = queryset.values_list("id", "email", "name", "username", named=True)
+
+        self.assert_same_bytes(expected, UserRowSerializer(rows, many=True).data)
+        self.assert_same_bytes(expected[0], UserRowSerializer(queryset.first()).data)
+
+    def test_renderer_matches_drf(self):
+        now = timezone.now()
+        data = {
+            "aware": now,
+            "naive": now.replace(tzinfo=None),
+            "date": date(2024, 2, 29),
+            "time": now.time(),
+            "duration": timedelta(seconds=90),
+            "decimal": Decimal("1.50"),
+            "uuid": uuid.UUID(int=1),
+            "lazy": gettext_lazy("Invalid cursor"),
+            "separators": "\u2028\u2029",
+            "nested": [{"list": [1, None, True, "é"]}, ()],
+            "big": 2 ** 70,
+        }
+        self.assert_same_bytes(data, data)
+        self.assert_same_bytes([], [])
+        self.assertEqual(JSONRenderer().render(None), b"")
+        self.assertEqual(
+            renderers.JSONRenderer().render(data, "application/json; indent=4"),
+            JSONRenderer().render(data, "application/json; indent=4"),
+        )
+
+    def test_list_endpoint_payload(self):
+        list_cache().clear()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse("list-pending-requests") + "?page_size=3")
+        page = FriendRequest.objects.order_by("created_date", "id").select_related("request_received_user")[:3]
+        expected = {
+            "message": "Listed Pending Friends Requests.",
+            "data": FriendRequestSerializer(page, many=True).data,
+            "next": response.data["next"],
+        }
+        self.assertIsNotNone(response.data["next"])
+        self.assertEqual(response.content, renderers.JSONRenderer().render(expected))
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        get_rate_limiter().reset()
+        self.delivered = []
+        handler("test.event")(self.record)
+
+    def tearDown(self):
+        handlers.pop("test.event", None)
+
+    def record(self, events):
+        if any(event.payload.get("fail") for event in events):
+            raise RuntimeError("bad event")
+        self.delivered.append([event.payload["n"] for event in events])
+
+    def test_lifecycle_events_are_written_with_the_change(self):
+        client = APIClient()
+        response = client.post(reverse("user-signup"), {"email": "new@mail.com", "password": "secret"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        sender = User.objects.get(email="new@mail.com")
+        others = [
+            User.objects.create(email="other%d@mail.com" % index, username="other%d" % index) for index in range(2)
+        ]
+        client.force_authenticate(sender)
+        for other in others:
+            client.post("/api/send-friends-requests/", {"request_received_user_id": other.id}, format="json")
+        accepted, rejected = FriendRequest.objects.filter(requested_user=sender).order_by("id")
+        client.post(reverse("accept-friend-request"), {"request_id": accepted.id}, format="json")
+        client.post(reverse("reject-friend-request"), {"request_id": rejected.id}, format="json")
+
+        events = list(OutboxEvent.objects.order_by("id").values_list("topic", "payload"))
+        self.assertEqual(events[0], ("user.signed_up", {"id": sender.id, "email": "new@mail.com"}))
+        self.assertEqual([topic for topic, _ in events[1:]], [
+            "friend_request.sent", "friend_request.sent", "friend_request.accepted", "friend_request.rejected",
+        ])
+        self.assertEqual(events[3][1], {
+            "id": accepted.id, "requested_user_id": sender.id, "request_received_user_id": others[0].id,
+        })
+
+    def test_publish_needs_a_transaction(self):
+        with mock.patch.object(connection, "in_atomic_block", False):
+            with self.assertRaises(transaction.TransactionManagementError):
+                publish("test.event", {"n": 1})
+
+    def test_dispatch_delivers_in_bounded_batches(self):
+        publish("test.event", *[{"n": n} for n in range(5)])
+        self.assertEqual([dispatch(batch_size=2) for _ in range(4)], [2, 2, 1, 0])
+        self.assertEqual(self.delivered, [[0, 1], [2, 3], [4]])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_failed_events_are_retried_without_holding_back_the_others(self):
+        publish("test.event", {"n": 0}, {"n": 1, "fail": True}, {"n": 2})
+        with self.assertLogs("apps.users.outbox", "ERROR"):
+            self.assertEqual(dispatch(), 3)
+        self.assertEqual(self.delivered, [[0], [2]])
+        failed = OutboxEvent.objects.get()
+        self.assertEqual((failed.payload["n"], failed.attempts), (1, 1))
+        self.assertEqual(failed.last_error, "RuntimeError: bad event")
+        self.assertGreater(failed.available_date, timezone.now())
+        # Not due until the backoff has passed.
+        self.assertEqual(dispatch(), 0)
+
+        OutboxEvent.objects.update(available_date=timezone.now(), payload={"n": 1})
+        self.assertEqual(dispatch(), 1)
+        self.assertEqual(self.delivered[-1], [1])
+
+    def test_local_queue_sink_applies_backpressure(self):
+        class SmallQueueSink(LocalQueueSink):
+            queue = Queue(maxsize=2)
+
+        publish("test.event", *[{"n": n} for n in range(3)])
+        sinks = [SmallQueueSink()]
+        self.assertEqual(dispatch(batch_size=2, sinks=sinks), 2)
+        self.assertEqual([message["payload"] for message in SmallQueueSink.queue.queue], [{"n": 0}, {"n": 1}])
+        with self.assertLogs("apps.users.outbox", "ERROR"):
+            dispatch(sinks=sinks)
+        self.assertEqual(OutboxEvent.objects.get().attempts, 1)
+
+    def test_retries_go_to_the_failed_sinks_only(self):
+        class FailingSink:
+            calls = []
+
+            def send(self, events):
+                self.calls.append([event.payload["n"] for event in events])
+                raise RuntimeError("broker down")
+
+        publish("test.event", {"n": 0}, {"n": 1})
+        sinks = [HandlerSink(), FailingSink()]
+        with self.assertLogs("apps.users.outbox", "ERROR"):
+            self.assertEqual(dispatch(sinks=sinks), 2)
+        self.assertEqual(self.delivered, [[0, 1]])
+        self.assertEqual(FailingSink.calls, [[0, 1], [0], [1]])
+        event = OutboxEvent.objects.order_by("id").first()
+        self.assertEqual(event.pending_sinks, [sink_name(sinks[1])])
+
+        OutboxEvent.objects.update(available_date=timezone.now())
+        with self.assertLogs("apps.users.outbox", "ERROR"):
+            dispatch(sinks=sinks)
+        self.assertEqual(self.delivered, [[0, 1]])
+        self.assertEqual(len(FailingSink.calls), 6)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_events_are_dead_lettered_after_max_attempts(self):
+        publish("test.event", {"n": 0, "fail": True})
+        for _ in range(2):
+            OutboxEvent.objects.update(available_date=timezone.now())
+            with self.assertLogs("apps.users.outbox", "ERROR") as logs:
+                self.assertEqual(dispatch(), 1)
+        self.assertIn("dead-lettered after 2 attempts", logs.output[-1])
+        OutboxEvent.objects.update(available_date=timezone.now())
+        self.assertEqual(dispatch(), 0)
+        self.assertIsNotNone(OutboxEvent.objects.get().dead_date)
+
+        OutboxEvent.objects.update(payload={"n": 0})
+        out = StringIO()
+        call_command("dispatch_outbox", "--once", "--requeue-dead", stdout=out)
+        self.assertIn("Requeued 1 dead-lettered outbox events.", out.getvalue())
+        self.assertEqual(self.delivered, [[0]])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_local_queue_sink_is_drained(self):
+        class SmallQueueSink(LocalQueueSink):
+            queue = Queue(maxsize=2)
+
+        publish("test.event", *[{"n": n} for n in range(3)])
+        sinks = [SmallQueueSink()]
+        dispatch(batch_size=2, sinks=sinks)
+        self.assertEqual([message["payload"]["n"] for message in SmallQueueSink.drain(max_items=1)], [0])
+        self.assertEqual([message["payload"]["n"] for message in SmallQueueSink.drain()], [1])
+        self.assertEqual(dispatch(sinks=sinks), 1)
+        self.assertEqual(SmallQueueSink.drain()[0]["payload"], {"n": 2})
+        self.assertEqual(SmallQueueSink.drain(), [])
+
+    def test_dispatch_outbox_command(self):
+        publish("test.event", *[{"n": n} for n in range(3)])
+        out = StringIO()
+        call_command("dispatch_outbox", "--once", "--batch-size", "2", stdout=out)
+        self.assertIn("Dispatched 3 outbox events.", out.getvalue())
+        self.assertEqual(self.delivered, [[0, 1], [2]])
+
+
+class UserCounterTests(TestCase):
+
+    def setUp(self):
+        get_rate_limiter().reset()
+        list_cache().clear()
+        self.users = [
+            User.objects.create(email="user%d@mail.com" % index, username="user%d" % index) for index in range(6)
+        ]
+        reconcile()
+        self.client = APIClient()
+
+    def counters(self):
+        return {
+            row["user_id"]: {field: row[field] for field in COUNTER_FIELDS}
+            for row in UserCounter.objects.values("user_id", *COUNTER_FIELDS)
+        }
+
+    def post(self, user, url, data):
+        self.client.force_authenticate(user)
+        return self.client.post(url, data, format="json")
+
+    @override_settings(RATE_LIMITS={})
+    def test_transitions_keep_the_counters_exact(self):
+        rng = random.Random(3)
+        for _ in range(40):
+            user = rng.choice(self.users)
+            pending = list(FriendRequest.objects.filter(requested_user=user, status=1).values_list("id", flat=True))
+            others = [other.id for other in rng.sample(self.users, 3)]
+            action = rng.choice(["send", "send_bulk", "accept", "reject", "accept_bulk", "reject_bulk"])
+            if action == "send":
+                self.post(user, "/api/send-friends-requests/", {"request_received_user_id": others[0]})
+            elif action == "send_bulk":
+                self.post(user, reverse("send-friend-requests-bulk"), {"request_received_user_ids": others})
+            elif pending and action in ("accept", "reject"):
+                self.post(user, reverse("%s-friend-request" % action), {"request_id": rng.choice(pending)})
+            elif pending:
+                url = reverse("%s-friend-requests-bulk" % action.split("_")[0])
+                self.post(user, url, {"request_ids": rng.sample(pending, min(2, len(pending)))})
+            self.assertEqual(self.counters(), compute_counts([user.id for user in self.users]))
+        self.assertTrue(any(counts["friends"] for counts in self.counters().values()))
+
+    def test_transition_racing_another_one_is_refused(self):
+        alice, bob = self.users[:2]
+        self.post(alice, "/api/send-friends-requests/", {"request_received_user_id": bob.id})
+        for action, other_status in [("accept", 3), ("reject", 2)]:
+            friend_request = FriendRequest.objects.get(requested_user=alice, status=1)
+            OutboxEvent.objects.all().delete()
+            counters = self.counters()
+            # The view read the request while it was pending; a concurrent transition then changed it.
+            FriendRequest.objects.filter(pk=friend_request.pk).update(status=other_status)
+            with mock.patch("apps.users.views.get_object_or_404", return_value=friend_request):
+                response = self.post(alice, reverse("%s-friend-request" % action), {"request_id": friend_request.pk})
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(FriendRequest.objects.get(pk=friend_request.pk).status, other_status)
+            self.assertEqual(self.counters(), counters)
+            self.assertFalse(OutboxEvent.objects.exists())
+            self.assertFalse(Friendship.are_friends(alice.id, bob.id))
+            FriendRequest.objects.filter(pk=friend_request.pk).delete()
+            FriendRequest.objects.create(requested_user=alice, request_received_user=bob)
+
+    def test_counts_endpoint(self):
+        alice, bob, carol = self.users[:3]
+        self.post(alice, "/api/send-friends-requests/", {"request_received_user_id": bob.id})
+        self.post(carol, "/api/send-friends-requests/", {"request_received_user_id": alice.id})
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("user-counts"))
+        self.assertEqual(response.data["data"], {"friends": 0, "pending_received": 0, "pending_sent": 1})
+
+        # Users without a counter row get one computed on first read.
+        UserCounter.objects.filter(user=alice).delete()
+        Friendship.add(alice.id, bob.id)
+        self.client.force_authenticate(alice)
+        response = self.client.get(reverse("user-counts"))
+        self.assertEqual(response.data["data"], {"friends": 1, "pending_received": 1, "pending_sent": 1})
+        self.assertTrue(UserCounter.objects.filter(user=alice, friends=1).exists())
+
+    def test_signup_creates_the_counters(self):
+        self.client.post(reverse("user-signup"), {"email": "new@mail.com", "password": "secret"}, format="json")
+        self.assertTrue(UserCounter.objects.filter(user__email="new@mail.com", friends=0).exists())
+
+    def test_reconcile_repairs_drift(self):
+        alice, bob = self.users[:2]
+        Friendship.add(alice.id, bob.id)
+        FriendRequest.objects.create(requested_user=bob, request_received_user=self.users[2])
+        UserCounter.objects.filter(user=self.users[3]).update(pending_sent=-4)
+        UserCounter.objects.filter(user=self.users[4]).delete()
+
+        out = StringIO()
+        call_command("reconcile_counters", "--batch-size", "2", stdout=out)
+        self.assertIn("Checked the counters of 6 users, repaired 5", out.getvalue())
+        self.assertEqual(self.counters(), compute_counts([user.id for user in self.users]))
+        self.assertEqual(reconcile([alice.id, 0]), (1, 0))
+
+
+class FriendRequestArchiveTests(TestCase):
+
+    def setUp(self):
+        get_rate_limiter().reset()
+        self.alice = User.objects.create(email="alice@mail.com", username="alice", name="Alice Smith")
+        self.bob = User.objects.create(email="bob@mail.com", username="bob", name="Bob Stone")
+        self.carol = User.objects.create(email="carol@mail.com", username="carol", name="Carol King")
+        self.requests = {}
+        for name, sender, receiver, status, age in [
+            ("old_rejected", self.carol, self.alice, 3, 40),
+            ("old_accepted", self.alice, self.bob, 2, 100),
+            ("recent_accepted", self.bob, self.carol, 2, 40),
+            ("recent_rejected", self.bob, self.alice, 3, 5),
+            ("old_pending", self.alice, self.carol, 1, 400),
+            ("old_rejected_again", self.carol, self.bob, 3, 35),
+        ]:
+            request = FriendRequest.objects.create(requested_user=sender, request_received_user=receiver, status=status)
+            FriendRequest.objects.filter(pk=request.pk).update(created_date=timezone.now() - timedelta(days=age))
+            self.requests[name] = request.pk
+
+    def test_moves_old_accepted_and_rejected_requests(self):
+        out = StringIO()
+        call_command("archive_friend_requests", "--batch-size", "2", stdout=out)
+
+        archived = {"old_rejected", "old_accepted", "old_rejected_again"}
+        self.assertEqual(
+            set(FriendRequestArchive.objects.values_list("id", flat=True)),
+            {self.requests[name] for name in archived},
+        )
+        self.assertEqual(
+            set(FriendRequest.objects.values_list("id", flat=True)),
+            {pk for name, pk in self.requests.items() if name not in archived},
+        )
+        row = FriendRequestArchive.objects.get(pk=self.requests["old_accepted"])
+        self.assertEqual((row.requested_user_id, row.request_received_user_id, row.status), (self.alice.id, self.bob.id, 2))
+        self.assertIn("Archived 2 friend requests...", out.getvalue())
+        self.assertIn("Archived 3 friend requests.", out.getvalue())
+
+    def test_batches_oldest_first_and_stops_after_max_batches(self):
+        self.assertEqual(archive(batch_size=1, max_batches=2), 2)
+
+        self.assertEqual(
+            set(FriendRequestArchive.objects.values_list("id", flat=True)),
+            {self.requests["old_accepted"], self.requests["old_rejected"]},
+        )
+        self.assertEqual(archive(batch_size=1), 1)
+        self.assertEqual(archive(), 0)
+
+    def test_dry_run_and_retention_options(self):
+        out = StringIO()
+        call_command("archive_friend_requests", "--dry-run", "--rejected-days", "1", stdout=out)
+        self.assertIn("4 friend requests are due", out.getvalue())
+        self.assertFalse(FriendRequestArchive.objects.exists())
+
+        call_command("archive_friend_requests", "--accepted-days", "30", stdout=StringIO())
+        self.assertEqual(FriendRequestArchive.objects.filter(status=2).count(), 2)
+
+    def test_skips_rows_already_copied(self):
+        condition = archivable()
+        FriendRequestArchive.objects.create(
+            id=self.requests["old_accepted"], created_date=timezone.now(), requested_user=self.alice,
+            request_received_user=self.bob, status=2,
+        )
+
+        self.assertEqual(archive(condition), 3)
+        self.assertFalse(FriendRequest.objects.filter(condition).exists())
+        self.assertEqual(FriendRequestArchive.objects.count(), 3)
+
+    def test_export_and_backfill_read_the_archive(self):
+        archive()
+        client = APIClient()
+        client.force_authenticate(self.alice)
+
+        response = client.get(reverse("export-social-graph"))
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        history = [record["id"] for record in records if record["type"] == "friend_request"]
+        self.assertEqual(
+            history,
+            sorted(self.requests[name] for name in ("old_rejected", "old_accepted", "recent_rejected", "old_pending")),
+        )
+
+        call_command("backfill_friendships", stdout=StringIO())
+        self.assertTrue(Friendship.are_friends(self.alice.id, self.bob.id))
+        self.assertTrue(Friendship.are_friends(self.bob.id, self.carol.id))
+
+
+class GraphQueryTests(TestCase):
+
+    def setUp(self):
+        get_rate_limiter().reset()
+        self.users = [
+            User.objects.create(email="user%d@mail.com" % index, username="user%d" % index, name="User %d" % index)
+            for index in range(8)
+        ]
+        self.ids = [user.id for user in self.users]
+        # A chain 0-1-2-3-4, with 5 and 6 friends of both 0 and 2; 7 has no friends.
+        for a, b in [(0, 1), (1, 2), (2, 3), (3, 4), (0, 5), (2, 5), (0, 6), (2, 6)]:
+            Friendship.add(self.ids[a], self.ids[b])
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def reference_distance(self, source, target):
+        neighbors = {}
+        for user_id, friend_id in Friendship.objects.values_list("user_id", "friend_id"):
+            neighbors.setdefault(user_id, set()).add(friend_id)
+        seen, frontier, depth = {source}, {source}, 0
+        while frontier:
+            if target in frontier:
+                return depth
+            frontier = {friend for user in frontier for friend in neighbors.get(user, ())} - seen
+            seen |= frontier
+            depth += 1
+        return None
+
+    def assert_valid_path(self, nodes, source, target):
+        self.assertEqual((nodes[0], nodes[-1]), (source, target))
+        for user_id, friend_id in zip(nodes, nodes[1:]):
+            self.assertTrue(Friendship.are_friends(user_id, friend_id))
+
+    def test_intersect_matches_set_intersection(self):
+        rng = random.Random(0)
+        for short, long in [(0, 10), (5, 5), (50, 60), (3, 1000), (40, 5000)]:
+            first = sorted(rng.sample(range(10000), short))
+            second = sorted(rng.sample(range(10000), long))
+            expected = sorted(set(first) & set(second))
+            self.assertEqual(list(intersect(first, second)), expected)
+            self.assertEqual(list(intersect(second, first)), expected)
+
+    def test_mutual_friend_ids(self):
+        expected = [self.ids[1], self.ids[5], self.ids[6]]
+        with self.assertNumQueries(1):
+            self.assertEqual(list(mutual_friend_ids(self.ids[0], self.ids[2])), expected)
+        # Over the degree limit the database intersects the lists.
+        with override_settings(GRAPH_MAX_DEGREE=2), self.assertNumQueries(2):
+            self.assertEqual(list(mutual_friend_ids(self.ids[0], self.ids[2])), expected)
+        self.assertEqual(list(mutual_friend_ids(self.ids[0], self.ids[7])), [])
+        self.assertEqual(list(mutual_friend_ids(self.ids[0], self.ids[0])), [])
+
+    def test_mutual_friends_endpoint_is_paginated(self):
+        url = reverse("mutual-friends")
+        response = self.client.get(url, {"user_id": self.ids[2], "page_size": 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual([row["id"] for row in response.data["data"]], [self.ids[1], self.ids[5]])
+        response = self.client.get(response.data["next"])
+        self.assertEqual([row["id"] for row in response.data["data"]], [self.ids[6]])
+        self.assertIsNone(response.data["next"])
+
+        response = self.client.get(url, {"user_id": self.ids[7]})
+        self.assertEqual(response.data["message"], "You don't have any mutual friends.")
+        self.assertEqual(self.client.get(url, {"user_id": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"user_id": self.ids[2], "cursor": "bad"}).status_code, 404)
+
+    def test_find_path(self):
+        with self.assertNumQueries(3):
+            path = find_path(self.ids[0], self.ids[3])
+        self.assertTrue(path.complete)
+        self.assertEqual(len(path.nodes), 4)
+        self.assert_valid_path(path.nodes, self.ids[0], self.ids[3])
+        self.assertEqual(find_path(self.ids[3], self.ids[1]).nodes, self.ids[3:0:-1])
+        self.assertEqual(find_path(self.ids[0], self.ids[0]).nodes, [self.ids[0]])
+        self.assertIsNone(find_path(self.ids[0], self.ids[3], max_depth=2).nodes)
+        # Four hops away.
+        self.assertIsNone(find_path(self.ids[0], self.ids[4]).nodes)
+        self.assertIsNone(find_path(self.ids[0], self.ids[7]).nodes)
+
+    def test_find_path_matches_breadth_first_search_on_random_graphs(self):
+        for seed in range(5):
+            rng = random.Random(seed)
+            Friendship.objects.all().delete()
+            for _ in range(12):
+                a, b = rng.sample(self.ids, 2)
+                Friendship.add(a, b)
+            for _ in range(10):
+                source, target = rng.sample(self.ids, 2)
+                distance = self.reference_distance(source, target)
+                path = find_path(source, target)
+                self.assertTrue(path.complete)
+                if distance is None or distance > 3:
+                    self.assertIsNone(path.nodes)
+                else:
+                    self.assertEqual(len(path.nodes) - 1, distance)
+                    self.assert_valid_path(path.nodes, source, target)
+
+    def test_find_path_reports_cut_searches(self):
+        with override_settings(GRAPH_HOP_EDGES_MAX=1):
+            self.assertFalse(find_path(self.ids[0], self.ids[3]).complete)
+        with override_settings(GRAPH_FRONTIER_MAX=1):
+            path = find_path(self.ids[0], self.ids[3])
+        self.assertFalse(path.complete)
+
+    def test_connection_endpoint(self):
+        url = reverse("connection")
+        response = self.client.get(url, {"user_id": self.ids[3]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"]["degree"], 3)
+        self.assertTrue(response.data["data"]["complete"])
+        self.assertEqual([row["id"] for row in response.data["data"]["path"]][::3], [self.ids[0], self.ids[3]])
+        self.assertEqual(response.data["data"]["path"][2]["email"], "user2@mail.com")
+
+        response = self.client.get(url, {"user_id": self.ids[3], "max_depth": 2})
+        self.assertEqual(response.data["message"], "You are not connected within 2 hops.")
+        self.assertIsNone(response.data["data"]["degree"])
+        self.assertEqual(self.client.get(url, {"user_id": self.ids[3], "max_depth": 4}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"user_id": 0}).status_code, 404)
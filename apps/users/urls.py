@@ -1,4 +1,5 @@
 from django.urls import path
+from apps.users import async_views
 from apps.users.views import (
     AuthenticationView, 
     FriendRequestView, 
@@ -16,13 +17,34 @@ urlpatterns = [
     path('login/', AuthenticationView.as_view({'get': 'login'}), name='user-login'),
     path('user-name-update/', UserView.as_view({'post': 'name_update'}), name='user-name-update'),
     path('user-search/', UserView.as_view({'post': 'user_search'}), name='user-search'),
+    path('export/', UserView.as_view({'get': 'export_social_graph'}), name='export-social-graph'),
+    path('counts/', UserView.as_view({'get': 'counts'}), name='user-counts'),
     path('send-friends-requests/', FriendRequestView.as_view({'post': 'send_friend_request'})),
     path('accept-friend-request/', FriendRequestView.as_view({'post': 'accept_friend_request'}),
          name='accept-friend-request'),
     path('reject-friend-request/', FriendRequestView.as_view({'post': 'reject_friend_request'}),
          name='reject-friend-request'),
+    path('send-friends-requests/bulk/', FriendRequestView.as_view({'post': 'send_friend_requests_bulk'}),
+         name='send-friend-requests-bulk'),
+    path('accept-friend-requests/bulk/', FriendRequestView.as_view({'post': 'accept_friend_requests_bulk'}),
+         name='accept-friend-requests-bulk'),
+    path('reject-friend-requests/bulk/', FriendRequestView.as_view({'post': 'reject_friend_requests_bulk'}),
+         name='reject-friend-requests-bulk'),
     path('list-pending-requests/', FriendRequestView.as_view({'get': 'list_pending_friends_request'}), name='list-pending-requests'),
     path('list-friends/', FriendRequestView.as_view({'get': 'list_friends'}), name='list-friends'),
+    path('friend-suggestions/', FriendRequestView.as_view({'get': 'list_friend_suggestions'}),
+         name='friend-suggestions'),
+    path('mutual-friends/', FriendRequestView.as_view({'get': 'mutual_friends'}), name='mutual-friends'),
+    path('connection/', FriendRequestView.as_view({'get': 'connection'}), name='connection'),
+
+    # Async (ASGI) versions of the search and friend endpoints, see apps/users/async_views.py.
+    path('async/user-search/', async_views.user_search, name='async-user-search'),
+    path('async/send-friends-requests/', async_views.send_friend_request, name='async-send-friend-request'),
+    path('async/accept-friend-request/', async_views.accept_friend_request, name='async-accept-friend-request'),
+    path('async/reject-friend-request/', async_views.reject_friend_request, name='async-reject-friend-request'),
+    path('async/list-pending-requests/', async_views.list_pending_friends_request,
+         name='async-list-pending-requests'),
+    path('async/list-friends/', async_views.list_friends, name='async-list-friends'),
 ]
 
 urlpatterns += router.urls
@@ -1,24 +1,51 @@
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.contrib.auth import get_user_model
 
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework.pagination import PageNumberPagination
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.contrib.auth.hashers import make_password
 from rest_framework import status
 
-from apps.users.models import FriendRequest, User
+from apps.users.cache import cached_list_response, invalidate_lists, invalidate_lists_showing
+from apps.users.counters import get_counts, record_accepted, record_rejected, record_sent
+from apps.users.export import export_user, ndjson
+from apps.users.graph import find_path, mutual_friend_ids
+from apps.users.hashers import hash_password
+from apps.users.models import FriendRequest, FriendSuggestion, Friendship, User, UserCounter
+from apps.users.outbox import (
+    FRIEND_REQUEST_ACCEPTED,
+    FRIEND_REQUEST_REJECTED,
+    FRIEND_REQUEST_SENT,
+    USER_SIGNED_UP,
+    friend_request_payload,
+    publish,
+)
+from apps.users.pagination import KeysetPagination
+from apps.users.ratelimit import (
+    ActionRateThrottle,
+    check_rate_limit,
+    get_rate,
+    release_rate_limit,
+    retry_after_header,
+)
+from apps.users.routers import pin_to_primary, read_from_replica
+from apps.users.search import get_search_backend
 from apps.users.serializer import (
+    BulkFriendRequestActionSerializer,
+    BulkSendFriendRequestSerializer,
+    ConnectionSerializer,
     LoginSerializer,
-    UserDisplaySerializer,
+    MutualFriendsSerializer,
     UserSearchSerializer,
     UserSignupSerializer,
-    FriendRequestSerializer,
     UserNameUpdateSerializer,
+    UserRowSerializer,
+    FriendRequestRowSerializer,
+    FriendSuggestionRowSerializer,
 )
 
 
@@ -28,6 +55,7 @@ User = get_user_model()
 class AuthenticationView(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSignupSerializer
+    throttle_classes = [ActionRateThrottle]
 
     @action(detail=False, methods=["post"], url_path="signup")
     def signup(self, request, *args, **kwargs):
@@ -42,12 +70,16 @@ class AuthenticationView(viewsets.ModelViewSet):
         """
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            user_obj, created = User.objects.get_or_create(
-                email=serializer.validated_data["email"],
-                defaults={
-                    "password": make_password(serializer.validated_data["password"])
-                },
-            )
+            with transaction.atomic():
+                user_obj, created = User.objects.get_or_create(
+                    email=serializer.validated_data["email"],
+                    defaults={
+                        "password": hash_password(serializer.validated_data["password"])
+                    },
+                )
+                if created:
+                    UserCounter.objects.create(user=user_obj)
+                    publish(USER_SIGNED_UP, {"id": user_obj.pk, "email": user_obj.email})
             if created:
                 custom_data = {
                     "message": "User Registered Successfully",
@@ -92,7 +124,8 @@ class UserView(viewsets.ModelViewSet):
 
     permission_classes = [IsAuthenticated]
     serializer_class = UserNameUpdateSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
+    throttle_classes = [ActionRateThrottle]
 
     @action(detail=False, methods=["post"], url_path="name_update")
     def name_update(self, request, *args, **kwargs):
@@ -117,16 +150,14 @@ class UserView(viewsets.ModelViewSet):
                         {"error": "User Not Found."}, status=status.HTTP_404_NOT_FOUND
                     )
             else:
-                try:
-                    user_obj = User.objects.get(pk=request.user.id)
-                except Http404:
-                    return Response(
-                        {"error": "User Not Found."}, status=status.HTTP_404_NOT_FOUND
-                    )
+                user_obj = request.user
 
             if user_obj:
                 user_obj.name = serializer.validated_data["name"]
-                user_obj.save()
+                # Only write the name: request.user may come from the authentication cache.
+                user_obj.save(update_fields=["name"])
+                invalidate_lists_showing(user_obj)
+                pin_to_primary(request.user.pk, user_obj.pk)
 
                 custom_data = {
                     "message": "User Name Updated Successfully.",
@@ -134,9 +165,12 @@ class UserView(viewsets.ModelViewSet):
                 return Response(custom_data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["post"], url_path="user_search")
+    @read_from_replica
     def user_search(self, request, *args, **kwargs):
         """
             The function `user_search` filters users based on email or name input, paginates the results, and returns a response.
+            Name search goes through the configured search backend; `mode` selects `contains` (default), `trigram` or `fulltext`.
+            Results are keyset paginated: follow `next` (an opaque `cursor`), and pass `count=true` to get the total.
 
             :param request: The HTTP request object containing query parameters for user search.
             :return: A paginated response with user data based on the provided search parameters (email or name).
@@ -150,35 +184,79 @@ class UserView(viewsets.ModelViewSet):
             queryset = User.objects.all()
 
             if email:
-                queryset = queryset.filter(email__iexact=email)
+                queryset = queryset.filter(email__iexact=email).order_by("id")
             elif name:
-                queryset = queryset.filter(name__icontains=name)
+                queryset = get_search_backend().search(
+                    queryset, name, serializer.validated_data["mode"]
+                )
             else:
                 custom_data = {
                     "error": "Please provide either 'email' or 'name' as search parameter."
                 }
                 return Response(custom_data, status=status.HTTP_400_BAD_REQUEST)
 
+            # Rows also carry the ordering key (`rank` for ranked modes) for the next cursor.
             paginator = self.pagination_class()
-            paginated_queryset = paginator.paginate_queryset(queryset, request)
-            serializer = UserDisplaySerializer(paginated_queryset, many=True)
+            columns = UserRowSerializer.columns()
+            ordering = paginator.get_queryset_ordering(queryset) or paginator.ordering
+            rows = queryset.values_list(
+                *columns,
+                *[field.lstrip("-") for field in ordering if field.lstrip("-") not in columns],
+                named=True,
+            )
+            page = paginator.paginate_queryset(rows, request)
+            serializer = UserRowSerializer(page, many=True)
             return paginator.get_paginated_response(serializer.data)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=["get"], url_path="export")
+    def export_social_graph(self, request, *args, **kwargs):
+        """
+            Stream the user's social graph as NDJSON: the profile, friends, pending requests and the full friend request
+            history, one JSON record per line (see `apps.users.export`). Rows are read with server-side cursors and sent
+            as they are encoded, so memory stays flat however large the graph is.
+
+            :param request: The HTTP request object of the authenticated user.
+            :return: A StreamingHttpResponse with one record per line, sent as an attachment.
+        """
+        response = StreamingHttpResponse(ndjson(export_user(request.user.pk)), content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="social-graph-%d.ndjson"' % request.user.pk
+        return response
+
+    @action(detail=False, methods=["get"], url_path="counts")
+    @read_from_replica
+    def counts(self, request, *args, **kwargs):
+        """
+            Return the user's badge counts: friends, pending requests received and pending requests sent.
+            The counts are kept up to date by the friend request endpoints (see `apps.users.counters`), so this is a
+            single primary key lookup.
+
+            :param request: The HTTP request object of the authenticated user.
+            :return: A response with `friends`, `pending_received` and `pending_sent`.
+        """
+        return Response(
+            {"message": "User counts.", "data": get_counts(request.user.pk)},
+            status=status.HTTP_200_OK,
+        )
+
 
 class FriendRequestView(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     @action(detail=False, methods=['post'], url_path='send_friend_request')
     def send_friend_request(self, request, *args, **kwargs):
         """
             This function handles sending a friend request between two users, checking various conditions before creating the request.
+            All checks are answered by a single query (`FriendRequest.get_send_state`); the insert relies on the
+            one-pending-request-per-pair constraint, so concurrent sends cannot create duplicates.
+            Only requests that are created count against the `send_friend_request` rate limit.
 
             :param request: The HTTP request object containing user information and request data.
             :return: A Response object indicating the outcome of the friend request. Different responses are returned based on the conditions checked.
         """
-        requested_user_id = request.user.id
+        requested_user = request.user
         request_received_user_id = request.data.get("request_received_user_id")
 
         if not request_received_user_id:
@@ -187,44 +265,62 @@ class FriendRequestView(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        requested_user = get_object_or_404(User, pk=requested_user_id)
-
         try:
-            request_received_user = get_object_or_404(User, pk=request_received_user_id)
-        except Http404:
+            request_received_user = FriendRequest.get_send_state(
+                requested_user, request_received_user_id
+            )
+        except (TypeError, ValueError):
+            request_received_user = None
+        if request_received_user is None:
             return Response(
                 {"error": "Friend not found."}, status=status.HTTP_404_NOT_FOUND
             )
 
-        if requested_user == request_received_user:
+        if requested_user.pk == request_received_user.pk:
             return Response(
                 {"error": "You cannot send Friend Request to Same User."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if not FriendRequest.can_send_friend_request(requested_user):
+        if request_received_user.has_pending_request:
             return Response(
-                {
-                    "error": "You cannot send more than 3 friend requests within a minute."
-                },
-                status=status.HTTP_400_BAD_REQUEST,
+                {"message": "Already have pending request."}, status=status.HTTP_200_OK
             )
 
-        if FriendRequest.check_already_request_send(
-            requested_user, request_received_user
-        ):
+        if request_received_user.is_friend:
             return Response(
-                {"message": "Already have pending request."}, status=status.HTTP_200_OK
+                {"message": "Already your friend."}, status=status.HTTP_200_OK
             )
 
-        if FriendRequest.check_already_friend(requested_user, request_received_user):
+        limit = check_rate_limit("send_friend_request", requested_user.pk)
+        if not limit.allowed:
+            rate = get_rate("send_friend_request")
             return Response(
-                {"message": "Already your friend."}, status=status.HTTP_200_OK
+                {
+                    "error": "You cannot send more than %d friend requests within %s."
+                    % (rate.limit, rate.describe())
+                },
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers=retry_after_header(limit),
             )
 
-        FriendRequest.objects.create(
-            requested_user=requested_user, request_received_user=request_received_user
-        )
+        try:
+            with transaction.atomic():
+                friend_request = FriendRequest.objects.create(
+                    requested_user=requested_user, request_received_user=request_received_user
+                )
+                publish(
+                    FRIEND_REQUEST_SENT,
+                    friend_request_payload(friend_request.pk, requested_user.pk, request_received_user.pk),
+                )
+                record_sent([(requested_user.pk, request_received_user.pk)])
+                invalidate_lists(requested_user.pk)
+        except IntegrityError:
+            # A concurrent send for the same pair won the race; this request created nothing.
+            release_rate_limit("send_friend_request", requested_user.pk)
+            return Response(
+                {"message": "Already have pending request."}, status=status.HTTP_200_OK
+            )
         return Response(
             {"message": "Friend request sent successfully."},
             status=status.HTTP_201_CREATED,
@@ -234,6 +330,10 @@ class FriendRequestView(viewsets.ModelViewSet):
     def accept_friend_request(self, request, *args, **kwargs):
         """
             This function accepts a friend request and updating its status to "accepted".
+            The matching `Friendship` edges and a `friend_request.accepted` outbox event are written in the same
+            transaction; the friend suggestions are updated from the event by the outbox dispatcher.
+            The status only changes while the request is still pending, so of two concurrent accepts or rejects of the
+            same request only one takes effect.
 
             :param request: The HTTP request object containing user information and request data.
             :return: A Response object with a message indicating if the friend request was accepted successfully or if there was an error.
@@ -250,12 +350,22 @@ class FriendRequestView(viewsets.ModelViewSet):
             return Response({"error": "This friend request is no longer pending."},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        if friend_request.requested_user != request.user:
+        if friend_request.requested_user_id != request.user.id:
             return Response({"error": "You do not have permission to accept this friend request."},
                             status=status.HTTP_403_FORBIDDEN)
 
-        friend_request.status = 2
-        friend_request.save()
+        with transaction.atomic():
+            if not FriendRequest.objects.filter(pk=friend_request.pk, status=1).update(status=2):
+                # Accepted or rejected by a concurrent request since it was read.
+                return Response({"error": "This friend request is no longer pending."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            pair = (friend_request.requested_user_id, friend_request.request_received_user_id)
+            # A request in the other direction may have been accepted already.
+            already_friends = Friendship.are_friends(*pair)
+            Friendship.add(*pair)
+            publish(FRIEND_REQUEST_ACCEPTED, friend_request_payload(friend_request.pk, *pair))
+            record_accepted([pair], [pair] if already_friends else [])
+            invalidate_lists(friend_request.requested_user_id, friend_request.request_received_user_id)
 
         return Response({"message": "Friend request accepted successfully."},
                         status=status.HTTP_200_OK)
@@ -264,6 +374,7 @@ class FriendRequestView(viewsets.ModelViewSet):
     def reject_friend_request(self, request, *args, **kwargs):
         """
             This function rejects a friend request by updating its status to rejected.
+            The status only changes while the request is still pending (see `accept_friend_request`).
 
             :param request: The HTTP request object containing user information.
             :return: A Response object with a message indicating if the rejection was successful or if there was an error.
@@ -284,42 +395,205 @@ class FriendRequestView(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if friend_request.requested_user != request.user:
+        if friend_request.requested_user_id != request.user.id:
             return Response(
                 {"error": "You do not have permission to accept this friend request."},
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        friend_request.status = 3
-        friend_request.save()
+        with transaction.atomic():
+            if not FriendRequest.objects.filter(pk=friend_request.pk, status=1).update(status=3):
+                # Accepted or rejected by a concurrent request since it was read.
+                return Response(
+                    {"error": "This friend request is no longer pending."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            publish(
+                FRIEND_REQUEST_REJECTED,
+                friend_request_payload(
+                    friend_request.pk, friend_request.requested_user_id, friend_request.request_received_user_id
+                ),
+            )
+            record_rejected([(friend_request.requested_user_id, friend_request.request_received_user_id)])
+            invalidate_lists(friend_request.requested_user_id)
 
         return Response(
             {"message": "Friend request rejected successfully."},
             status=status.HTTP_200_OK,
         )
 
+    @action(detail=False, methods=['post'], url_path='send_friend_requests_bulk')
+    def send_friend_requests_bulk(self, request, *args, **kwargs):
+        """
+            This function sends friend requests to many users in one call.
+            The pair state of every target is loaded in one query and the new requests are written with a single
+            `bulk_create`; each request created counts against the `send_friend_request` rate limit. A target whose
+            request is skipped by the one-pending-per-pair constraint, because one was sent concurrently, is
+            reported as "already_pending".
+
+            :param request: The HTTP request object with `request_received_user_ids`, a list of user IDs.
+            :return: A Response object with one result per distinct ID: "sent", "not_found", "same_user",
+                    "already_pending", "already_friend" or "rate_limited".
+        """
+        serializer = BulkSendFriendRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        requested_user = request.user
+        user_ids = list(dict.fromkeys(serializer.validated_data["request_received_user_ids"]))
+        states = {
+            row["id"]: row
+            for row in FriendRequest.annotate_send_state(
+                requested_user, User.objects.filter(pk__in=user_ids)
+            ).values("id", "has_pending_request", "is_friend")
+        }
+
+        results, new_requests = {}, []
+        for user_id in user_ids:
+            state = states.get(user_id)
+            if state is None:
+                result = "not_found"
+            elif user_id == requested_user.pk:
+                result = "same_user"
+            elif state["has_pending_request"]:
+                result = "already_pending"
+            elif state["is_friend"]:
+                result = "already_friend"
+            elif not check_rate_limit("send_friend_request", requested_user.pk).allowed:
+                result = "rate_limited"
+            else:
+                # Settled once the insert shows whether the row was written.
+                result = "already_pending"
+                new_requests.append(
+                    FriendRequest(requested_user=requested_user, request_received_user_id=user_id)
+                )
+            results[user_id] = result
+
+        if new_requests:
+            with transaction.atomic():
+                # A pending request created concurrently for the same pair is skipped by the unique constraint.
+                created = FriendRequest.create_pending(new_requests)
+                for friend_request in created:
+                    results[friend_request.request_received_user_id] = "sent"
+                release_rate_limit("send_friend_request", requested_user.pk, len(new_requests) - len(created))
+                publish(FRIEND_REQUEST_SENT, *[
+                    friend_request_payload(
+                        friend_request.pk, requested_user.pk, friend_request.request_received_user_id
+                    )
+                    for friend_request in created
+                ])
+                record_sent([(requested_user.pk, friend_request.request_received_user_id) for friend_request in created])
+                invalidate_lists(requested_user.pk)
+
+        return Response(
+            {
+                "message": "Friend requests processed.",
+                "data": [{"id": user_id, "result": result} for user_id, result in results.items()],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=['post'], url_path='accept_friend_requests_bulk')
+    def accept_friend_requests_bulk(self, request, *args, **kwargs):
+        """
+            This function accepts many pending friend requests in one call and writes their `Friendship` edges.
+
+            :param request: The HTTP request object with `request_ids`, a list of friend request IDs.
+            :return: A Response object with one result per distinct ID: "accepted", "not_pending" or "forbidden".
+        """
+        return self._update_pending_requests(request, 2, "accepted")
+
+    @action(detail=False, methods=['post'], url_path='reject_friend_requests_bulk')
+    def reject_friend_requests_bulk(self, request, *args, **kwargs):
+        """
+            This function rejects many pending friend requests in one call.
+
+            :param request: The HTTP request object with `request_ids`, a list of friend request IDs.
+            :return: A Response object with one result per distinct ID: "rejected", "not_pending" or "forbidden".
+        """
+        return self._update_pending_requests(request, 3, "rejected")
+
+    def _update_pending_requests(self, request, new_status, done):
+        serializer = BulkFriendRequestActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        request_ids = list(dict.fromkeys(serializer.validated_data["request_ids"]))
+        with transaction.atomic():
+            pending = {
+                request_id: (requested_user_id, request_received_user_id)
+                for request_id, requested_user_id, request_received_user_id in FriendRequest.objects.select_for_update()
+                .filter(pk__in=request_ids, status=1)
+                .values_list("id", "requested_user_id", "request_received_user_id")
+            }
+
+            results, updated = [], []
+            for request_id in request_ids:
+                if request_id not in pending:
+                    result = "not_pending"
+                elif pending[request_id][0] != request.user.id:
+                    result = "forbidden"
+                else:
+                    result = done
+                    updated.append(request_id)
+                results.append({"id": request_id, "result": result})
+
+            if updated:
+                FriendRequest.objects.filter(pk__in=updated).update(status=new_status)
+                pairs = [pending[request_id] for request_id in updated]
+                if new_status == 2:
+                    already_friends = [
+                        (request.user.id, friend_id) for friend_id in Friendship.objects.filter(
+                            user_id=request.user.id, friend_id__in=[received_id for _, received_id in pairs]
+                        ).values_list("friend_id", flat=True)
+                    ]
+                    Friendship.objects.bulk_create(
+                        [edge for pair in pairs for edge in Friendship.edges(*pair)], ignore_conflicts=True
+                    )
+                    record_accepted(pairs, already_friends)
+                else:
+                    record_rejected(pairs)
+                publish(
+                    FRIEND_REQUEST_ACCEPTED if new_status == 2 else FRIEND_REQUEST_REJECTED,
+                    *[friend_request_payload(request_id, *pending[request_id]) for request_id in updated],
+                )
+                invalidate_lists(request.user.id, *[received_id for _, received_id in pairs])
+
+        return Response(
+            {"message": "Friend requests processed.", "data": results},
+            status=status.HTTP_200_OK,
+        )
+
     @action(detail=False, methods=['get'], url_path='list_pending_friends_request')
+    @cached_list_response
+    @read_from_replica
     def list_pending_friends_request(self, request, *args, **kwargs):
         """
-            This function lists pending friend requests for a specific user.
+            This function lists pending friend requests for a specific user, oldest first, one keyset page at a time.
+            Responses are cached per user and carry an ETag; `If-None-Match` gets a 304 while the list is unchanged.
 
             :param request: The HTTP request object containing user information.
             :return: A response with a message and data about pending friend requests.
                     If there are pending requests, it returns "Listed Pending Friends Requests" with the request data.
                     If there are no pending requests, it returns "You don't have any pending friend requests."
         """
-        user = request.user
-        request_user = get_object_or_404(User, pk=user.id)
+        request_user = request.user
 
-        pending_requests = FriendRequest.objects.filter(
-            requested_user=request_user, status=1
+        # The nested user is joined in the same query, and rows are plain tuples rather than models.
+        pending_requests = FriendRequest.objects.filter(requested_user=request_user, status=1).values_list(
+            *FriendRequestRowSerializer.columns(), named=True
         )
 
-        if pending_requests.exists():
-            serializer = FriendRequestSerializer(pending_requests, many=True)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(
+            pending_requests, request, ordering=("created_date", "id")
+        )
+        if page:
+            serializer = FriendRequestRowSerializer(page, many=True)
             custom_data = {
                 "message": "Listed Pending Friends Requests.",
                 "data": serializer.data,
+                **paginator.get_page_info(),
             }
             return Response(custom_data, status=status.HTTP_200_OK)
         else:
@@ -329,31 +603,143 @@ class FriendRequestView(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=['get'], url_path='list_friends')
+    @cached_list_response
+    @read_from_replica
     def list_friends(self, request, *args, **kwargs):
         """
-            List the friends of a user based on accepted friend requests (status=2) Accepted.
+            List the friends of a user from the `Friendship` table (accepted friend requests, both directions).
+            The list is keyset paginated on the friend id, cached per user and served with an ETag.
 
             :param request: The current HTTP request object.
             :return: A response with a success message and the friends list data if there are friends,
                     or a message indicating no friends if the list is empty.
         """
-        user = request.user
-        request_user = get_object_or_404(User, pk=user.id)
+        request_user = request.user
 
-        friends_list = [
-            friends.request_received_user
-            for friends in FriendRequest.objects.filter(
-                requested_user=request_user, status=2
-            )
-        ]
-        if friends_list:
-            serializer = UserDisplaySerializer(friends_list, many=True)
+        # Project the friend's columns through the join rather than loading each friend separately.
+        friends = Friendship.objects.filter(user=request_user).values_list(
+            "friend_id", "friend__email", "friend__name", named=True
+        )
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(friends, request, ordering=("friend_id",))
+        if page:
+            serializer = UserRowSerializer(page, many=True)
             custom_data = {
                 "message": "Listed Friends List successfully.",
                 "data": serializer.data,
+                **paginator.get_page_info(),
             }
             return Response(custom_data, status=status.HTTP_200_OK)
         else:
             return Response(
                 {"message": "You don't have any friends."}, status=status.HTTP_200_OK
             )
+
+    @action(detail=False, methods=['get'], url_path='list_friend_suggestions')
+    @read_from_replica
+    def list_friend_suggestions(self, request, *args, **kwargs):
+        """
+            List "people you may know": users who are not friends yet, most mutual friends first.
+            The ranking is precomputed in `FriendSuggestion` (see apps/users/suggestions.py), so each keyset page is one
+            indexed read.
+
+            :param request: The current HTTP request object.
+            :return: A response with the suggested users and their `mutual_friends` count,
+                    or a message indicating there are no suggestions.
+        """
+        suggestions = FriendSuggestion.objects.filter(user=request.user).values_list(
+            "candidate_id", "candidate__email", "candidate__name", "mutual_friends", named=True
+        )
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(suggestions, request, ordering=("-mutual_friends", "candidate_id"))
+        if page:
+            custom_data = {
+                "message": "Listed Friend Suggestions successfully.",
+                "data": FriendSuggestionRowSerializer(page, many=True).data,
+                **paginator.get_page_info(),
+            }
+            return Response(custom_data, status=status.HTTP_200_OK)
+        else:
+            return Response(
+                {"message": "You don't have any friend suggestions."}, status=status.HTTP_200_OK
+            )
+
+    @action(detail=False, methods=['get'], url_path='mutual_friends')
+    @read_from_replica
+    def mutual_friends(self, request, *args, **kwargs):
+        """
+            List the friends the user has in common with `user_id`, by id. The two sorted friend id lists are read through
+            the `Friendship` index and intersected (see apps/users/graph.py); the page is keyset paginated over the result
+            and always carries the total `count`.
+
+            :param request: The HTTP request object with the `user_id` query parameter.
+            :return: A response with the mutual friends and their count, or a message indicating there are none.
+                    Invalid input is returned with HTTP status 400.
+        """
+        serializer = MutualFriendsSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        mutual_ids = mutual_friend_ids(request.user.pk, serializer.validated_data["user_id"])
+        paginator = self.pagination_class()
+        page = paginator.paginate_keys(mutual_ids, request)
+        if page:
+            rows = User.objects.filter(pk__in=page).order_by("id").values_list("id", "email", "name", named=True)
+            custom_data = {
+                "message": "Listed Mutual Friends successfully.",
+                "data": UserRowSerializer(rows, many=True).data,
+                **paginator.get_page_info(),
+            }
+            return Response(custom_data, status=status.HTTP_200_OK)
+        else:
+            return Response(
+                {"message": "You don't have any mutual friends.", "count": 0}, status=status.HTTP_200_OK
+            )
+
+    @action(detail=False, methods=['get'], url_path='connection')
+    @read_from_replica
+    def connection(self, request, *args, **kwargs):
+        """
+            Find how the user is connected to `user_id`: a shortest chain of friends of at most `max_depth` hops
+            (default and maximum `GRAPH_MAX_DEPTH`), found by a bidirectional breadth-first search with one query per
+            hop (see apps/users/graph.py). `complete` is false when the search hit its per-hop limits, in which case
+            a missing or longer path may exist.
+
+            :param request: The HTTP request object with the `user_id` and optional `max_depth` query parameters.
+            :return: A response with the `degree` of separation and the users on the `path`, both endpoints included,
+                    or a message indicating no connection within `max_depth` hops.
+                    Invalid input is returned with HTTP status 400, an unknown user with HTTP status 404.
+        """
+        serializer = ConnectionSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        target_id = serializer.validated_data["user_id"]
+        max_depth = serializer.validated_data["max_depth"]
+
+        if not User.objects.filter(pk=target_id).exists():
+            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        path = find_path(request.user.pk, target_id, max_depth)
+        if path.nodes is None:
+            return Response(
+                {
+                    "message": "You are not connected within %d hops." % max_depth,
+                    "data": {"degree": None, "path": [], "complete": path.complete},
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        users = {
+            row.id: row for row in User.objects.filter(pk__in=path.nodes).values_list("id", "email", "name", named=True)
+        }
+        custom_data = {
+            "message": "Connection found.",
+            "data": {
+                "degree": len(path.nodes) - 1,
+                "path": UserRowSerializer([users[user_id] for user_id in path.nodes], many=True).data,
+                "complete": path.complete,
+            },
+        }
+        return Response(custom_data, status=status.HTTP_200_OK)
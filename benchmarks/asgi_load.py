@@ -0,0 +1,155 @@
+"""
+HTTP load test of the sync (WSGI) and async (ASGI) friend/search endpoints.
+
+Seeds a scratch database with users, friendships and pending requests, then starts each server
+target as a subprocess on that database and drives it with `--concurrency` simultaneous clients
+for `--duration` seconds per level:
+
+    - ``wsgi``: ``manage.py runserver`` (threaded WSGI) on ``/api/<endpoint>/``
+    - ``asgi-sync``: uvicorn on the same sync DRF views, which Django runs on one thread per process
+    - ``asgi-async``: uvicorn on ``/api/async/<endpoint>/`` (see apps/users/async_views.py)
+
+    python -m benchmarks.asgi_load --users 5000 --concurrency 10,100,1000 --duration 15
+
+Needs uvicorn. With SQLite the scratch database is a temporary file (set through ``SQLITE_PATH``);
+with Postgres it is ``test_<POSTGRES_DB>``. Each request authenticates as a random seeded user, so the
+response cache only helps once a user repeats a page.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from urllib.parse import urlencode
+
+from benchmarks import common
+
+
+TARGETS = {
+    'wsgi': ([sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:{port}'], '/api/{endpoint}/'),
+    'asgi-sync': (
+        [sys.executable, '-m', 'uvicorn', 'accuknox.asgi:application', '--port', '{port}', '--log-level', 'warning'],
+        '/api/{endpoint}/',
+    ),
+    'asgi-async': (
+        [sys.executable, '-m', 'uvicorn', 'accuknox.asgi:application', '--port', '{port}', '--log-level', 'warning'],
+        '/api/async/{endpoint}/',
+    ),
+}
+ENDPOINTS = {
+    'list-friends': ('GET', {}),
+    'list-pending-requests': ('GET', {}),
+    'user-search': ('POST', {'name': 'ka'}),
+}
+
+
+def seed(users, friends, pending, rng):
+    from apps.users.models import FriendRequest, Friendship, User
+
+    common.seed_users(0, users, rng)
+    user_ids = list(User.objects.values_list('id', flat=True))
+    edges = []
+    for user_id in user_ids:
+        for friend_id in rng.sample(user_ids, friends):
+            if friend_id != user_id:
+                edges.extend(Friendship.edges(user_id, friend_id))
+    Friendship.objects.bulk_create(edges, batch_size=5000, ignore_conflicts=True)
+    FriendRequest.objects.bulk_create(
+        [
+            FriendRequest(requested_user_id=user_id, request_received_user_id=other_id)
+            for user_id in user_ids
+            for other_id in rng.sample(user_ids, pending)
+            if other_id != user_id
+        ],
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+    return user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--friends', type=int, default=20, help='friendships created per user')
+    parser.add_argument('--pending', type=int, default=5, help='pending requests sent per user')
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='list-friends')
+    parser.add_argument('--targets', default=','.join(TARGETS))
+    parser.add_argument('--concurrency', default='10,100,500', help='comma separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency level')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.db import connection
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from apps.users.models import User
+
+    env = dict(os.environ)
+    if connection.vendor == 'sqlite':
+        # The servers run in other processes, so the scratch database cannot live in memory.
+        path = os.path.join(tempfile.mkdtemp(), 'asgi_load.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = path
+        env['SQLITE_PATH'] = path
+
+    rng = random.Random(0)
+    method, params = ENDPOINTS[args.endpoint]
+    results = []
+    with common.scratch_database():
+        if connection.vendor == 'postgresql':
+            env['POSTGRES_DB'] = connection.settings_dict['NAME']
+        user_ids = seed(args.users, args.friends, args.pending, rng)
+        tokens = [
+            str(RefreshToken.for_user(user).access_token)
+            for user in User.objects.filter(pk__in=rng.sample(user_ids, min(len(user_ids), 1000)))
+        ]
+        connection.close()
+
+        print('%-11s %11s %10s %9s %9s %9s  %s' % (
+            'target', 'concurrency', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'statuses',
+        ))
+        for target in args.targets.split(','):
+            command, path = TARGETS[target]
+            path = path.format(endpoint=args.endpoint)
+            if params:
+                path += '?' + urlencode(params)
+            process = subprocess.Popen(
+                [part.format(port=args.port) for part in command],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                common.wait_for_port(args.port, process)
+
+                async def request():
+                    code, _ = await common.fetch(args.port, method, path, rng.choice(tokens))
+                    return code
+
+                for concurrency in [int(level) for level in args.concurrency.split(',')]:
+                    latencies, statuses = asyncio.run(common.drive(request, concurrency, args.duration))
+                    summary = common.summarize(latencies)
+                    summary.update(
+                        target=target,
+                        endpoint=args.endpoint,
+                        concurrency=concurrency,
+                        requests_per_second=statuses.get(200, 0) / args.duration,
+                        statuses={str(code): count for code, count in statuses.items()},
+                    )
+                    results.append(summary)
+                    print('%-11s %11d %10.1f %9.1f %9.1f %9.1f  %s' % (
+                        target, concurrency, summary['requests_per_second'], summary['p50_ms'],
+                        summary['p95_ms'], summary['p99_ms'], summary['statuses'],
+                    ))
+            finally:
+                process.terminate()
+                process.wait()
+
+    common.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
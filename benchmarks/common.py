@@ -0,0 +1,150 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Every benchmark runs against a throw-away database created the same way the test runner
+does it (an in-memory SQLite database, or ``test_<POSTGRES_DB>`` when Postgres is configured),
+so it never touches real data.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import statistics
+import time
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'accuknox.settings')
+    import django
+
+    django.setup()
+
+
+@contextlib.contextmanager
+def scratch_database(keepdb=False):
+    """
+        With `keepdb`, an existing scratch database is reused and kept afterwards (useful for graphs
+        that take long to seed; with SQLite only when its ``TEST['NAME']`` is a file).
+    """
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+def seed_users(start, stop, rng=None, batch_size=5000):
+    """
+        Bulk insert users ``start..stop`` with random names. Passwords are left empty; none of
+        the benchmarks log these users in through the password path.
+    """
+    from apps.users.management.commands.seed_social_graph import random_name
+    from apps.users.models import User
+
+    rng = rng or random.Random(start)
+    for offset in range(start, stop, batch_size):
+        User.objects.bulk_create(
+            [
+                User(email='user%d@bench.local' % i, username='user%d' % i, name=random_name(rng))
+                for i in range(offset, min(offset + batch_size, stop))
+            ],
+            batch_size=batch_size,
+        )
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples):
+    """
+        Return mean and p50/p95/p99 of `samples` (seconds) in milliseconds.
+    """
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.mean(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+    }
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited with status %s' % process.returncode)
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start listening on port %d' % port)
+
+
+async def fetch(port, method, path, token=None, body=None):
+    """
+        One HTTP/1.1 request on a fresh connection. `body` is sent as JSON. Returns ``(status, body)``.
+    """
+    payload = json.dumps(body).encode() if body is not None else b''
+    headers = ['%s %s HTTP/1.1' % (method, path), 'Host: 127.0.0.1:%d' % port, 'Connection: close']
+    if token:
+        headers.append('Authorization: Bearer %s' % token)
+    if body is not None:
+        headers.append('Content-Type: application/json')
+    headers.append('Content-Length: %d' % len(payload))
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + payload)
+        await writer.drain()
+        response = await reader.read()
+        head, _, content = response.partition(b'\r\n\r\n')
+        return int(head.split(None, 2)[1]), content
+    finally:
+        writer.close()
+
+
+async def drive(make_request, concurrency, duration):
+    """
+        Run `concurrency` clients for `duration` seconds, each awaiting ``make_request()`` (which returns
+        the status code, or None when it has nothing left to send) in a loop. Returns
+        ``(latencies, {status: count})``.
+    """
+    latencies = []
+    statuses = {}
+    deadline = time.monotonic() + duration
+
+    async def client():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                code = await make_request()
+            except OSError:
+                code = 'connection_error'
+            if code is None:
+                return
+            latencies.append(time.perf_counter() - started)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses
+
+
+def write_results(path, results):
+    if path:
+        with open(path, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
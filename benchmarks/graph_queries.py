@@ -0,0 +1,163 @@
+"""
+Latency of the mutual friends and connection queries on a synthetic power-law graph.
+
+Seeds a scratch database with ``manage.py seed_social_graph`` (friend counts drawn from a power law,
+so a few users have thousands of friends) and times, for random pairs of users and for pairs that
+include the highest-degree users:
+
+    - ``mutual``: a double join through ``User.friendships`` (``orm``) vs the intersection of sorted
+      adjacency arrays in apps/users/graph.py (``graph``)
+    - ``path``: a breadth-first search from one side with one query per user (``orm``) vs the
+      bidirectional search with one query per hop (``graph``)
+
+    python -m benchmarks.graph_queries --users 20000 --pairs 200 --output graph.json
+
+Both methods must agree (mutual friends, and path lengths whenever neither search was cut short);
+the benchmark stops if they do not. ``--orm-max-queries`` bounds the one-query-per-user search.
+"""
+import argparse
+import contextlib
+import random
+
+from benchmarks import common
+
+
+def orm_mutual(user_id, other_id):
+    from apps.users.models import User
+
+    rows = User.objects.filter(friendships__friend_id=user_id).filter(friendships__friend_id=other_id)
+    return list(rows.order_by('id').values_list('id', flat=True))
+
+
+def orm_distance(source, target, max_depth, max_queries):
+    """
+        Distance from `source` to `target`, reading each user's friends with its own query. Returns
+        ``(distance, complete)``.
+    """
+    from apps.users.models import Friendship
+
+    if source == target:
+        return 0, True
+    seen, frontier, queries = {source}, [source], 0
+    for depth in range(1, max_depth + 1):
+        next_frontier = []
+        for user_id in frontier:
+            if queries == max_queries:
+                return None, False
+            queries += 1
+            for friend_id in Friendship.objects.filter(user_id=user_id).values_list('friend_id', flat=True):
+                if friend_id == target:
+                    return depth, True
+                if friend_id not in seen:
+                    seen.add(friend_id)
+                    next_frontier.append(friend_id)
+        frontier = next_frontier
+    return None, True
+
+
+@contextlib.contextmanager
+def count_queries(connection, counter):
+    def execute(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(execute):
+        yield
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--alpha', type=float, default=2.2, help='power-law exponent of the friend degree')
+    parser.add_argument('--max-degree', type=int, default=5000)
+    parser.add_argument('--pairs', type=int, default=200, help='random pairs per query')
+    parser.add_argument('--hubs', type=int, default=10, help='also time pairs including the N highest-degree users')
+    parser.add_argument('--orm-max-queries', type=int, default=5000)
+    parser.add_argument('--keepdb', action='store_true', help='reuse the seeded graph between runs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connection
+    from django.db.models import Count, Max, Min
+
+    from apps.users.graph import find_path, mutual_friend_ids
+    from apps.users.models import Friendship, User
+
+    rng = random.Random(args.seed)
+    results = []
+    with common.scratch_database(keepdb=args.keepdb):
+        existing = User.objects.count()
+        if existing < args.users:
+            call_command(
+                'seed_social_graph',
+                users=args.users - existing,
+                alpha=args.alpha,
+                max_degree=args.max_degree,
+                pending=0,
+                seed=args.seed,
+            )
+        bounds = User.objects.aggregate(Min('id'), Max('id'))
+        hubs = list(
+            Friendship.objects.values_list('user_id', flat=True).annotate(degree=Count('id'))
+            .order_by('-degree')[:args.hubs]
+        )
+        random_pairs = [
+            tuple(rng.sample(range(bounds['id__min'], bounds['id__max'] + 1), 2)) for _ in range(args.pairs)
+        ]
+        hub_pairs = [
+            (rng.choice(hubs), rng.randint(bounds['id__min'], bounds['id__max'])) for _ in range(args.pairs)
+        ] if hubs else []
+        max_depth = settings.GRAPH_MAX_DEPTH
+
+        print('%-7s %-7s %-6s %10s %10s %10s %10s' % ('query', 'pairs', 'method', 'mean ms', 'p50 ms', 'p95 ms', 'queries'))
+        for query in ('mutual', 'path'):
+            for label, pairs in (('random', random_pairs), ('hub', hub_pairs)):
+                samples = {'orm': [], 'graph': []}
+                queries = {'orm': 0, 'graph': 0}
+                for source, target in pairs:
+                    if query == 'mutual':
+                        calls = {
+                            'orm': lambda: orm_mutual(source, target),
+                            'graph': lambda: list(mutual_friend_ids(source, target)),
+                        }
+                    else:
+                        calls = {
+                            'orm': lambda: orm_distance(source, target, max_depth, args.orm_max_queries),
+                            'graph': lambda: find_path(source, target, max_depth),
+                        }
+                    answers = {}
+                    for method, call in calls.items():
+                        counter = [0]
+                        with count_queries(connection, counter):
+                            samples[method] += common.timed(lambda: answers.__setitem__(method, call()), 1)
+                        queries[method] += counter[0]
+                    if query == 'mutual':
+                        agree = answers['orm'] == answers['graph']
+                    else:
+                        (distance, orm_complete), path = answers['orm'], answers['graph']
+                        found = len(path.nodes) - 1 if path.nodes is not None else None
+                        agree = not (orm_complete and path.complete) or distance == found
+                    if not agree:
+                        raise SystemExit('%s: the two methods disagree for users %d and %d' % (query, source, target))
+
+                for method in ('orm', 'graph'):
+                    summary = common.summarize(samples[method])
+                    result = dict(
+                        summary, query=query, pairs=label, method=method, users=args.users,
+                        queries_per_call=queries[method] / max(1, len(pairs)),
+                    )
+                    results.append(result)
+                    print('%-7s %-7s %-6s %10.2f %10.2f %10.2f %10.1f' % (
+                        query, label, method, summary['mean_ms'], summary['p50_ms'], summary['p95_ms'],
+                        result['queries_per_call'],
+                    ))
+
+    common.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
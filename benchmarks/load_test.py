@@ -0,0 +1,254 @@
+"""
+End-to-end HTTP load test of the API.
+
+Seeds a scratch database with a synthetic social graph (``manage.py seed_social_graph``: power-law
+friend counts plus pending requests), starts the server on it as a subprocess with
+``benchmarks.settings`` (no rate limits), and runs every scenario at every concurrency level for
+`--duration` seconds:
+
+    - ``signup``: POST /api/signup/ with a new email each time
+    - ``login``: GET /api/login/ as a random seeded user
+    - ``search``: POST /api/user-search/?name=<syllable>
+    - ``send``: POST /api/send-friends-requests/ to a random user
+    - ``accept``: POST /api/accept-friend-request/ for each pending request of the token users, until
+      they run out
+    - ``list-friends``, ``list-pending-requests`` and ``friend-suggestions``: GET, first page
+
+    python -m benchmarks.load_test --users 100000 --concurrency 1,10,50 --output load.json
+    python -m benchmarks.load_test --users 100000 --keepdb --output after.json --baseline load.json
+
+Throughput (2xx responses per second), p50/p95/p99 latency and status counts are written as JSON
+together with the commit, database and graph size; with `--baseline`, the changes against an earlier
+results file are printed. With SQLite the scratch database is a file (kept in the temp directory
+with `--keepdb`); with Postgres it is ``test_<POSTGRES_DB>``.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from urllib.parse import urlencode
+
+from benchmarks import common
+
+
+SERVERS = {
+    'uvicorn': [
+        sys.executable, '-m', 'uvicorn', 'accuknox.asgi:application', '--port', '{port}',
+        '--workers', '{workers}', '--log-level', 'warning',
+    ],
+    'runserver': [sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:{port}'],
+}
+SCENARIOS = [
+    'signup', 'login', 'search', 'send', 'accept', 'list-friends', 'list-pending-requests', 'friend-suggestions',
+]
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def make_scenario(name, port, tokens, password, rng):
+    """
+        Return an async callable sending one request of scenario `name` and returning its status.
+    """
+    from django.db.models import Max, Min
+
+    from apps.users.management.commands.seed_social_graph import SYLLABLES
+    from apps.users.models import FriendRequest, User
+
+    user_ids = list(tokens)
+
+    if name == 'signup':
+        counter = itertools.count()
+        run = '%x' % int(time.time() * 1000)
+
+        async def request():
+            body = {'email': 'load-%s-%d@bench.local' % (run, next(counter)), 'password': password}
+            return (await common.fetch(port, 'POST', '/api/signup/', body=body))[0]
+
+    elif name == 'login':
+        emails = list(User.objects.filter(pk__in=user_ids).values_list('email', flat=True))
+
+        async def request():
+            body = {'email': rng.choice(emails), 'password': password}
+            return (await common.fetch(port, 'GET', '/api/login/', body=body))[0]
+
+    elif name == 'search':
+        async def request():
+            path = '/api/user-search/?' + urlencode({'name': rng.choice(SYLLABLES)})
+            return (await common.fetch(port, 'POST', path, tokens[rng.choice(user_ids)]))[0]
+
+    elif name == 'send':
+        bounds = User.objects.aggregate(Min('id'), Max('id'))
+
+        async def request():
+            body = {'request_received_user_id': rng.randint(bounds['id__min'], bounds['id__max'])}
+            token = tokens[rng.choice(user_ids)]
+            return (await common.fetch(port, 'POST', '/api/send-friends-requests/', token, body))[0]
+
+    elif name == 'accept':
+        # In this API the sender of a request is the one who accepts it.
+        pending = deque(
+            FriendRequest.objects.filter(requested_user_id__in=user_ids, status=1)
+            .values_list('id', 'requested_user_id')
+            .iterator()
+        )
+
+        async def request():
+            if not pending:
+                return None
+            request_id, user_id = pending.popleft()
+            body = {'request_id': request_id}
+            return (await common.fetch(port, 'POST', '/api/accept-friend-request/', tokens[user_id], body))[0]
+
+    else:
+        async def request():
+            return (await common.fetch(port, 'GET', '/api/%s/' % name, tokens[rng.choice(user_ids)]))[0]
+
+    return request
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as handle:
+        baseline = {(row['scenario'], row['concurrency']): row for row in json.load(handle)['results']}
+    print('\nchange against %s' % baseline_path)
+    print('%-22s %11s %10s %10s' % ('scenario', 'concurrency', 'req/s', 'p95'))
+    for row in results:
+        before = baseline.get((row['scenario'], row['concurrency']))
+        if not before or not before['requests_per_second'] or not before.get('p95_ms'):
+            continue
+        print('%-22s %11d %+9.1f%% %+9.1f%%' % (
+            row['scenario'], row['concurrency'],
+            (row['requests_per_second'] / before['requests_per_second'] - 1) * 100,
+            (row['p95_ms'] / before['p95_ms'] - 1) * 100,
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--alpha', type=float, default=2.5, help='power-law exponent of the friend degree')
+    parser.add_argument('--max-degree', type=int, default=1000)
+    parser.add_argument('--pending', type=int, default=5, help='pending requests seeded per user')
+    parser.add_argument('--token-users', type=int, default=1000, help='seeded users the clients act as')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,10,50', help='comma separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario and level')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='uvicorn')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keepdb', action='store_true', help='reuse (and keep) the seeded scratch database')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: %s' % ', '.join(sorted(unknown)))
+
+    common.setup()
+    import django
+    from django.core.management import call_command
+    from django.db import connection
+    from django.db.models import Max, Min
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from apps.users.models import User
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.settings')
+    if connection.vendor == 'sqlite':
+        # The server runs in another process, so the scratch database cannot live in memory.
+        directory = tempfile.gettempdir() if args.keepdb else tempfile.mkdtemp()
+        path = os.path.join(directory, 'load_test.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = path
+        env['SQLITE_PATH'] = path
+
+    rng = random.Random(args.seed)
+    password = 'bench-password'
+    results = []
+    with common.scratch_database(keepdb=args.keepdb):
+        if connection.vendor == 'postgresql':
+            env['POSTGRES_DB'] = connection.settings_dict['NAME']
+        existing = User.objects.count()
+        if existing < args.users:
+            call_command(
+                'seed_social_graph',
+                users=args.users - existing,
+                alpha=args.alpha,
+                max_degree=args.max_degree,
+                pending=args.pending,
+                password=password,
+                seed=args.seed,
+            )
+            call_command('rebuild_friend_suggestions')
+        # Seeded ids are contiguous, so sampling the id range avoids loading every id.
+        bounds = User.objects.aggregate(Min('id'), Max('id'))
+        id_range = range(bounds['id__min'], bounds['id__max'] + 1)
+        token_users = User.objects.filter(pk__in=rng.sample(id_range, min(len(id_range), args.token_users)))
+        tokens = {user.pk: str(RefreshToken.for_user(user).access_token) for user in token_users}
+        metadata = {
+            'commit': git_commit(),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'database': connection.vendor,
+            'users': User.objects.count(),
+            'server': args.server,
+            'workers': args.workers if args.server == 'uvicorn' else None,
+            'duration': args.duration,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
+        connection.close()
+
+        command = [part.format(port=args.port, workers=args.workers) for part in SERVERS[args.server]]
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            common.wait_for_port(args.port, process)
+            print('%-22s %11s %10s %9s %9s %9s  %s' % (
+                'scenario', 'concurrency', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'statuses',
+            ))
+            for scenario in scenarios:
+                for concurrency in [int(level) for level in args.concurrency.split(',')]:
+                    request = make_scenario(scenario, args.port, tokens, password, rng)
+                    connection.close()
+                    started = time.monotonic()
+                    latencies, statuses = asyncio.run(common.drive(request, concurrency, args.duration))
+                    elapsed = time.monotonic() - started
+                    ok = sum(count for code, count in statuses.items() if isinstance(code, int) and code < 300)
+                    summary = common.summarize(latencies) if latencies else {'count': 0}
+                    summary.update(
+                        scenario=scenario,
+                        concurrency=concurrency,
+                        requests_per_second=ok / elapsed,
+                        statuses={str(code): count for code, count in statuses.items()},
+                    )
+                    results.append(summary)
+                    print('%-22s %11d %10.1f %9.1f %9.1f %9.1f  %s' % (
+                        scenario, concurrency, summary['requests_per_second'], summary.get('p50_ms', 0),
+                        summary.get('p95_ms', 0), summary.get('p99_ms', 0), summary['statuses'],
+                    ))
+        finally:
+            process.terminate()
+            process.wait()
+
+    common.write_results(args.output, {'metadata': metadata, 'results': results})
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
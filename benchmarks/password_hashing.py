@@ -0,0 +1,77 @@
+"""
+Login password verification throughput per algorithm.
+
+Measures verifications per second on the request thread (one core) and through the process pool
+with ``--workers`` processes, reported per worker. Algorithms whose library is not installed
+(argon2-cffi, bcrypt) are skipped.
+
+    python -m benchmarks.password_hashing --logins 50 --workers 4
+"""
+import argparse
+import time
+
+from benchmarks import common
+
+
+HASHERS = {
+    'pbkdf2_sha256': 'apps.users.hashers.PBKDF2PasswordHasher',
+    'argon2': 'apps.users.hashers.Argon2PasswordHasher',
+    'bcrypt_sha256': 'apps.users.hashers.BCryptSHA256PasswordHasher',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=40, help='verifications per measurement')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--algorithms', nargs='+', default=['pbkdf2_sha256', 'argon2', 'bcrypt_sha256'])
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    common.setup()
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.test.utils import override_settings
+
+    from apps.users import hashers
+
+    results = []
+    print('%-15s %-10s %16s' % ('algorithm', 'mode', 'logins/s/core'))
+    for algorithm in args.algorithms:
+        with override_settings(PASSWORD_HASH_ALGORITHM=algorithm, PASSWORD_HASHERS=[HASHERS[algorithm]]):
+            try:
+                encoded = hashers.hash_password('correct horse battery staple')
+            except ValueError as exc:
+                print('%-15s skipped (%s)' % (algorithm, exc))
+                continue
+
+            started = time.perf_counter()
+            for _ in range(args.logins):
+                hashers.verify_password('correct horse battery staple', encoded)
+            inline = args.logins / (time.perf_counter() - started)
+            results.append({'algorithm': algorithm, 'mode': 'inline', 'logins_per_second_per_core': inline})
+            print('%-15s %-10s %16.1f' % (algorithm, 'inline', inline))
+
+        # Pool workers load the full PASSWORD_HASHERS list, which verifies every algorithm.
+        with override_settings(PASSWORD_HASH_WORKERS=args.workers):
+            pool = hashers.HashingPool()
+            try:
+                pool.run(hashers._check_password, 'warm up', encoded)
+                with ThreadPoolExecutor(args.workers * 2) as threads:
+                    started = time.perf_counter()
+                    list(threads.map(
+                        lambda _: pool.run(hashers._check_password, 'correct horse battery staple', encoded),
+                        range(args.logins * args.workers),
+                    ))
+                    pooled = args.logins * args.workers / (time.perf_counter() - started) / args.workers
+            finally:
+                pool.shutdown()
+        results.append({'algorithm': algorithm, 'mode': 'pool', 'workers': args.workers,
+                        'logins_per_second_per_core': pooled})
+        print('%-15s %-10s %16.1f' % (algorithm, 'pool', pooled))
+
+    common.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Cost of one rate limit check on the send_friend_request path.
+
+Compares the original database check (`FriendRequest.can_send_friend_request`, a COUNT over
+friend_request) with the in-memory and cache rate limiter backends.
+
+    python -m benchmarks.rate_limit --requests 50000 --checks 20000
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from benchmarks import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=50000, help='friend_request rows to seed')
+    parser.add_argument('--checks', type=int, default=10000)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.utils import timezone
+
+    from apps.users.models import FriendRequest, User
+    from apps.users.ratelimit import CacheRateLimiter, InMemoryRateLimiter, Rate
+
+    rng = random.Random(0)
+    rate = Rate.parse('3/m')
+    results = []
+    with common.scratch_database():
+        common.seed_users(0, args.users, rng)
+        user_ids = list(User.objects.values_list('id', flat=True))
+        now = timezone.now()
+        FriendRequest.objects.bulk_create(
+            [
+                FriendRequest(
+                    requested_user_id=rng.choice(user_ids),
+                    request_received_user_id=rng.choice(user_ids),
+                    status=rng.choice([2, 3]),
+                    created_date=now - timedelta(seconds=rng.randint(0, 86400)),
+                )
+                for _ in range(args.requests)
+            ],
+            batch_size=5000,
+        )
+        users = list(User.objects.filter(pk__in=user_ids[:100]))
+
+        checks = {
+            'database_count': lambda user: FriendRequest.can_send_friend_request(user),
+            'in_memory': lambda user, limiter=InMemoryRateLimiter(): limiter.hit('send', user.pk, rate),
+            'cache': lambda user, limiter=CacheRateLimiter(): limiter.hit('send', user.pk, rate),
+        }
+        print('%-16s %12s %10s %10s' % ('backend', 'checks/s', 'p50 us', 'p99 us'))
+        for name, check in checks.items():
+            samples = common.timed(lambda: check(rng.choice(users)), args.checks)
+            summary = common.summarize(samples)
+            summary.update(backend=name, checks_per_second=len(samples) / sum(samples))
+            results.append(summary)
+            print('%-16s %12.0f %10.1f %10.1f' % (
+                name, summary['checks_per_second'], summary['p50_ms'] * 1000, summary['p99_ms'] * 1000,
+            ))
+
+    common.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
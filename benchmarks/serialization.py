@@ -0,0 +1,101 @@
+"""
+Serialization and rendering throughput of the list endpoints, in rows per second.
+
+Compares DRF's ModelSerializers and JSON encoder (the old path) with the row serializers and the
+orjson renderer (see apps/users/serializer.py and apps/users/renderers.py) on in-memory pages, for:
+
+    - ``friends``: ``UserDisplaySerializer`` over dicts vs ``UserRowSerializer`` over ``values_list()`` rows
+    - ``pending``: ``FriendRequestSerializer`` over model instances with their joined user vs
+      ``FriendRequestRowSerializer`` over rows
+
+    python -m benchmarks.serialization --rows 1000 --repeat 50
+
+Both paths must render the same bytes; the benchmark stops if they do not. Without orjson installed
+the renderer falls back to DRF's encoder.
+"""
+import argparse
+import random
+from collections import namedtuple
+
+from benchmarks import common
+
+
+def build_pages(rows):
+    from django.utils import timezone
+
+    from apps.users.management.commands.seed_social_graph import random_name
+    from apps.users.models import FriendRequest, User
+    from apps.users.serializer import FriendRequestRowSerializer, UserRowSerializer
+
+    rng = random.Random(0)
+    now = timezone.now()
+    users = [
+        User(id=index, email='user%d@bench.local' % index, name=random_name(rng) if index % 5 else None)
+        for index in range(1, rows + 1)
+    ]
+    UserRow = namedtuple('Row', ['friend_id', 'friend__email', 'friend__name'])
+    RequestRow = namedtuple('Row', [column.replace('__', '_') for column in FriendRequestRowSerializer.columns()])
+    return {
+        'friends': (
+            [{'id': user.id, 'email': user.email, 'name': user.name} for user in users],
+            [UserRow(user.id, user.email, user.name) for user in users],
+            UserRowSerializer,
+        ),
+        'pending': (
+            [FriendRequest(id=user.id, created_date=now, request_received_user=user) for user in users],
+            [RequestRow(user.id, now, user.id, user.email, user.name) for user in users],
+            FriendRequestRowSerializer,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000, help='rows per page')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    common.setup()
+    from rest_framework import renderers
+
+    from apps.users import renderers as fast_renderers
+    from apps.users.serializer import FriendRequestSerializer, UserDisplaySerializer
+
+    old_serializers = {'friends': UserDisplaySerializer, 'pending': FriendRequestSerializer}
+    old_renderer, new_renderer = renderers.JSONRenderer(), fast_renderers.JSONRenderer()
+    print('orjson: %s' % ('yes' if fast_renderers.orjson else 'no (DRF encoder)'))
+
+    results = []
+    print('%-8s %-5s %14s %14s %14s' % ('page', 'path', 'serialize/s', 'render/s', 'total rows/s'))
+    for name, (objects, rows, row_serializer) in build_pages(args.rows).items():
+        paths = {
+            'old': (lambda: old_serializers[name](objects, many=True).data, old_renderer),
+            'new': (lambda: row_serializer(rows, many=True).data, new_renderer),
+        }
+        if old_renderer.render(paths['old'][0]()) != new_renderer.render(paths['new'][0]()):
+            raise SystemExit('%s: the two paths render different bytes' % name)
+
+        for path, (serialize, renderer) in paths.items():
+            data = serialize()
+            serialize_time = min(common.timed(serialize, args.repeat))
+            render_time = min(common.timed(lambda: renderer.render(data), args.repeat))
+            result = {
+                'page': name,
+                'path': path,
+                'rows': args.rows,
+                'serialize_rows_per_second': args.rows / serialize_time,
+                'render_rows_per_second': args.rows / render_time,
+                'rows_per_second': args.rows / (serialize_time + render_time),
+            }
+            results.append(result)
+            print('%-8s %-5s %14.0f %14.0f %14.0f' % (
+                name, path, result['serialize_rows_per_second'], result['render_rows_per_second'],
+                result['rows_per_second'],
+            ))
+
+    common.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
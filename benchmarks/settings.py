@@ -0,0 +1,11 @@
+"""
+Settings for the servers started by the HTTP benchmarks: production-like (no DEBUG, default sampling)
+and without rate limits, which would otherwise turn most of the load into 429s.
+"""
+from accuknox.settings import *  # noqa: F401,F403
+
+
+DEBUG = False
+RATE_LIMITS = {}
+PERFORMANCE_SAMPLE_RATE = 0.01
+QUERY_LOG_SAMPLE_RATE = 0.001
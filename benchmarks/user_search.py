@@ -0,0 +1,57 @@
+"""
+Latency of `UserView.user_search` name lookups as the user table grows.
+
+Compares the plain ``icontains`` scan with the configured search backend (pg_trgm/full-text
+on Postgres, the in-process index elsewhere) for every search mode.
+
+    python -m benchmarks.user_search --sizes 10000 100000 500000
+"""
+import argparse
+import random
+
+from benchmarks import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=50, help='distinct search terms per size')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    common.setup()
+    from apps.users.models import User
+    from apps.users.search import SEARCH_MODES, DatabaseSearchBackend, get_search_backend
+
+    rng = random.Random(0)
+    results = []
+    with common.scratch_database():
+        backend = get_search_backend()
+        baseline = DatabaseSearchBackend()
+        seeded = 0
+        print('%-10s %-22s %-9s %10s %10s' % ('users', 'backend', 'mode', 'p50 ms', 'p95 ms'))
+        for size in sorted(args.sizes):
+            common.seed_users(seeded, size, rng)
+            seeded = size
+
+            names = list(User.objects.order_by('?').values_list('name', flat=True)[:args.queries])
+            terms = [name.split()[rng.randint(0, 1)][:rng.randint(3, 6)] for name in names]
+            runs = [(baseline, 'contains')] + [(backend, mode) for mode in SEARCH_MODES]
+            for engine, mode in runs:
+                # Warm up caches (and the in-process index) outside the measured loop.
+                list(engine.search(User.objects.all(), terms[0], mode)[:10])
+                samples = []
+                for term in terms:
+                    samples += common.timed(lambda: list(engine.search(User.objects.all(), term, mode)[:10]), 1)
+                summary = common.summarize(samples)
+                summary.update(users=size, backend=type(engine).__name__, mode=mode)
+                results.append(summary)
+                print('%-10d %-22s %-9s %10.2f %10.2f' % (
+                    size, type(engine).__name__, mode, summary['p50_ms'], summary['p95_ms'],
+                ))
+
+    common.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()